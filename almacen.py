@@ -0,0 +1,280 @@
+import hashlib
+import logging
+import os
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache
+import pandas as pd
+from sqlalchemy import create_engine, event, inspect, text
+
+logger = logging.getLogger(__name__)
+
+# Filas por cada executemany al insertar
+DB_LOTE_INSERCION = int(os.getenv("DB_LOTE_INSERCION", "5000"))
+
+# Se aplican a cada conexión nueva; WAL deja leer (p. ej. a Power BI)
+# mientras el ETL escribe
+PRAGMAS = (
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    "temp_store=MEMORY",
+    "cache_size=-65536",
+    "mmap_size=268435456",
+    "busy_timeout=30000",
+)
+
+# Columnas de la tabla facturas y su tipo en SQLite
+COLUMNAS = {
+    "fecha_factura": "DATE",
+    "proveedor": "TEXT",
+    "concepto": "TEXT",
+    "importe": "REAL",
+    "archivo": "TEXT",
+    "importe_original": "REAL",
+    "moneda_original": "TEXT",
+    # Posición de la fila dentro de su archivo (0, 1, ...); forma parte de la clave
+    "linea": "INTEGER",
+}
+
+
+def _aplicar_pragmas(conexion, _registro):
+    cursor = conexion.cursor()
+    for pragma in PRAGMAS:
+        cursor.execute(f"PRAGMA {pragma}")
+    cursor.close()
+
+
+def crear_engine(ruta_db="facturas.db"):
+    """Engine de SQLAlchemy para la base de facturas con WAL y pragmas de escritura masiva"""
+    engine = create_engine(f"sqlite:///{ruta_db}")
+    event.listen(engine, "connect", _aplicar_pragmas)
+    return engine
+
+
+@lru_cache(maxsize=65536)
+def fecha_iso(fecha):
+    """Convierte dd/mm/aaaa (o una fecha ya ISO) a AAAA-MM-DD; None si no es válida.
+
+    Hay muchas menos fechas distintas que facturas, así que la caché evita
+    casi todas las conversiones.
+    """
+    fecha = fecha.strip()
+    for formato in ("%d/%m/%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(fecha, formato).strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    return None
+
+
+def fechas_iso(serie):
+    """Columna de fechas (datetime64 o texto) como lista de AAAA-MM-DD, con None si no es válida"""
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie.dt.strftime("%Y-%m-%d").astype(object).where(serie.notna(), None).tolist()
+    return [fecha_iso(fecha) if isinstance(fecha, str) else None for fecha in serie]
+
+
+def clave_factura(fecha, proveedor, concepto, importe, archivo=None, linea=0):
+    """Clave única de una fila (entero de 64 bits) a partir de fecha, proveedor, concepto e importe,
+    el archivo de origen y la posición de la fila en él.
+
+    Dos líneas idénticas de la misma factura (o de dos facturas distintas)
+    tienen claves distintas; recargar el mismo archivo da las mismas claves.
+    """
+    firma = "|".join([
+        archivo or "",
+        str(linea),
+        fecha or "",
+        str(proveedor or "").lower(),
+        str(concepto or "").lower(),
+        "" if importe is None else f"{importe:.2f}",
+    ])
+    return int.from_bytes(hashlib.blake2b(firma.encode(), digest_size=8).digest(), "big", signed=True)
+
+
+def _columna(df, nombre):
+    """Valores de una columna como lista de Python, con None en lugar de NaN"""
+    if nombre not in df.columns:
+        return [None] * len(df)
+    serie = df[nombre]
+    if nombre in ("importe", "importe_original"):
+        serie = pd.to_numeric(serie, errors="coerce")
+    return serie.astype(object).where(serie.notna(), None).tolist()
+
+
+class AlmacenFacturas:
+    """Capa de almacenamiento de la tabla facturas.
+
+    Crea la tabla con tipos, clave única por factura e índices para los
+    filtros habituales del dashboard (fecha y proveedor), y escribe con
+    executemany por bloques haciendo upsert sobre la clave: volver a cargar
+    la misma factura actualiza su fila en lugar de duplicarla.
+
+    Cuando la tabla se crea de cero los índices del dashboard se construyen
+    una sola vez al final con crear_indices(), que es bastante más rápido
+    que mantenerlos fila a fila durante la carga.
+    """
+
+    def __init__(self, engine, tabla="facturas", lote=DB_LOTE_INSERCION):
+        self.engine = engine
+        self.tabla = tabla
+        self.lote = lote
+        self.indices_pendientes = False
+        self._preparada = False
+
+    def preparar_tabla(self, conn, reemplazar=False):
+        """Crea (o recrea con reemplazar) la tabla y sus índices"""
+        if reemplazar:
+            conn.execute(text(f"DROP TABLE IF EXISTS {self.tabla}"))
+        elif self._preparada:
+            return
+
+        existe = inspect(conn).has_table(self.tabla)
+        if existe:
+            columnas = [c["name"] for c in inspect(conn).get_columns(self.tabla)]
+            # Sin clave (to_sql) o con la clave antigua, que no distinguía filas repetidas
+            if "clave" not in columnas or "linea" not in columnas:
+                self._migrar(conn)
+                return
+            for nombre, tipo in COLUMNAS.items():
+                if nombre not in columnas:
+                    conn.execute(text(f"ALTER TABLE {self.tabla} ADD COLUMN {nombre} {tipo}"))
+
+        definicion = ",\n                ".join(f"{nombre} {tipo}" for nombre, tipo in COLUMNAS.items())
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {self.tabla} (
+                id INTEGER PRIMARY KEY,
+                clave INTEGER NOT NULL UNIQUE,
+                {definicion}
+            )
+        """))
+        # El de archivo se necesita durante la carga para sustituir filas en modo incremental
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_{self.tabla}_archivo ON {self.tabla} (archivo)"))
+        if existe:
+            self.crear_indices(conn)
+        else:
+            self.indices_pendientes = True
+        self._preparada = True
+
+    def crear_indices(self, conn=None):
+        """Crea los índices de fecha y proveedor si aún no existen"""
+        if conn is None:
+            with self.engine.begin() as conn:
+                return self.crear_indices(conn)
+
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_{self.tabla}_fecha ON {self.tabla} (fecha_factura)"))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_{self.tabla}_proveedor ON {self.tabla} (proveedor, fecha_factura)"))
+        self.indices_pendientes = False
+
+    def _migrar(self, conn):
+        """Pasa una tabla de una versión anterior (to_sql sin tipos ni clave, o con la
+        clave sin archivo ni línea) al esquema actual sin perder filas repetidas"""
+        logger.info(f"Migrando la tabla {self.tabla} al esquema con clave e índices")
+        # En el orden de inserción, así cada fila conserva su posición dentro del archivo
+        antigua = pd.read_sql(text(f"SELECT * FROM {self.tabla} ORDER BY rowid"), conn)
+        conn.execute(text(f"DROP TABLE {self.tabla}"))
+        self.preparar_tabla(conn)
+        if len(antigua):
+            self.escribir(antigua, conn=conn)
+        self.crear_indices(conn)
+
+    def filas(self, df):
+        """Tuplas (clave, columnas...) listas para executemany.
+
+        Las filas de un mismo archivo se numeran en el orden en que llegan en
+        df; todas las de un archivo se escriben siempre en la misma llamada.
+        """
+        columnas = {nombre: _columna(df, nombre) for nombre in COLUMNAS}
+        columnas["fecha_factura"] = fechas_iso(df["fecha_factura"])
+        posiciones = Counter()
+        lineas = []
+        for archivo in columnas["archivo"]:
+            lineas.append(posiciones[archivo])
+            posiciones[archivo] += 1
+        columnas["linea"] = lineas
+        # La clave usa el importe en su moneda original: no cambia si se actualizan las tasas
+        return [
+            (
+                clave_factura(fecha, proveedor, concepto, importe if original is None else original,
+                              archivo, linea),
+                fecha, proveedor, concepto, importe, archivo, original, moneda, linea,
+            )
+            for fecha, proveedor, concepto, importe, archivo, original, moneda, linea in zip(*columnas.values())
+        ]
+
+    def escribir(self, df, reemplazar=False, conn=None):
+        """Inserta o actualiza las filas de df; devuelve cuántas se enviaron"""
+        if conn is None:
+            with self.engine.begin() as conn:
+                return self.escribir(df, reemplazar, conn)
+
+        self.preparar_tabla(conn, reemplazar)
+
+        columnas = ["clave", *COLUMNAS]
+        # Una recarga sin ruta de origen no borra la que ya tenía la factura
+        actualizar = ", ".join(
+            f"{columna} = COALESCE(excluded.{columna}, {columna})" if columna == "archivo"
+            else f"{columna} = excluded.{columna}"
+            for columna in COLUMNAS
+        )
+        sql = (
+            f"INSERT INTO {self.tabla} ({', '.join(columnas)}) "
+            f"VALUES ({', '.join('?' * len(columnas))}) "
+            f"ON CONFLICT(clave) DO UPDATE SET {actualizar}"
+        )
+
+        filas = self.filas(df)
+        for inicio in range(0, len(filas), self.lote):
+            conn.exec_driver_sql(sql, filas[inicio:inicio + self.lote])
+        return len(filas)
+
+    def borrar_archivos(self, rutas, conn):
+        """Elimina las filas que vienen de los archivos indicados"""
+        conn.exec_driver_sql(
+            f"DELETE FROM {self.tabla} WHERE archivo = ?",
+            [(ruta,) for ruta in rutas],
+        )
+
+
+class Cuarentena:
+    """Tabla con las filas devueltas por el LLM que no pasaron la validación.
+
+    Guarda la línea CSV tal cual, el PDF de origen y el motivo, para poder
+    revisarlas o reprocesar esos archivos sin perderlas en silencio.
+    """
+
+    def __init__(self, engine, tabla="cuarentena"):
+        self.engine = engine
+        self.tabla = tabla
+        self.filas = 0
+        self._preparada = False
+
+    def _preparar(self, conn):
+        if self._preparada:
+            return
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {self.tabla} (
+                id INTEGER PRIMARY KEY,
+                archivo TEXT,
+                linea TEXT,
+                motivo TEXT NOT NULL,
+                registrada TEXT NOT NULL
+            )
+        """))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_{self.tabla}_archivo ON {self.tabla} (archivo)"))
+        self._preparada = True
+
+    def guardar(self, registros):
+        """Anexa registros (archivo, línea, motivo); devuelve cuántos se guardaron"""
+        if not registros:
+            return 0
+
+        ahora = datetime.now().isoformat(timespec="seconds")
+        with self.engine.begin() as conn:
+            self._preparar(conn)
+            conn.exec_driver_sql(
+                f"INSERT INTO {self.tabla} (archivo, linea, motivo, registrada) VALUES (?, ?, ?, ?)",
+                [(archivo, linea, motivo, ahora) for archivo, linea, motivo in registros],
+            )
+        self.filas += len(registros)
+        return len(registros)
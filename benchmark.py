@@ -0,0 +1,604 @@
+import argparse
+import contextlib
+import io
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import warnings
+import fitz  # PyMuPDF
+import pandas as pd
+from sqlalchemy import create_engine
+import pipeline
+import funciones
+from almacen import AlmacenFacturas, crear_engine
+from extraccion import PoolExtraccion, workers_disponibles
+from llm_backend import BackendMock
+
+
+def facturas_sinteticas(cantidad, semilla=42):
+    """Genera DataFrames de una fila como los que produce csv_a_dataframe"""
+    rng = random.Random(semilla)
+    monedas = ["pesos", "dolares", "euros"]
+
+    for i in range(cantidad):
+        yield pd.DataFrame({
+            "fecha_factura": [f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2024"],
+            "proveedor": [f"proveedor {i % 500}"],
+            "concepto": ["servicio de prueba"],
+            "importe": [round(rng.uniform(10, 5000), 2)],
+            "moneda": [rng.choice(monedas)],
+        })
+
+
+def _medir(funcion, memoria):
+    """Ejecuta funcion y devuelve (segundos, pico de memoria en MB o None)"""
+    if memoria:
+        tracemalloc.start()
+    inicio = time.perf_counter()
+    funcion()
+    segundos = time.perf_counter() - inicio
+    pico = None
+    if memoria:
+        pico = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+    return segundos, pico
+
+
+def bench_concat(cantidades, chunk_size, memoria=False):
+    """Compara el pd.concat acumulativo con el pipeline por bloques"""
+
+    def cuadratico(cantidad, engine):
+        df = pd.DataFrame()
+        for df_factura in facturas_sinteticas(cantidad):
+            df = pd.concat([df, df_factura], ignore_index=True)
+        df, _, _ = pipeline.convertir_monedas(df)
+        df.iloc[:, 0:4].to_sql("facturas", engine, if_exists="replace", index=False)
+
+    def streaming(cantidad, engine):
+        sink = pipeline.SinkSQLite(engine, reemplazar=True)
+        for df in pipeline.agrupar_en_chunks(facturas_sinteticas(cantidad), chunk_size):
+            df, _, _ = pipeline.convertir_monedas(df)
+            sink.escribir(df.iloc[:, 0:4])
+        sink.cerrar()
+
+    print(f"{'facturas':>10} {'modo':>12} {'segundos':>10} {'facturas/s':>12} {'pico MB':>9}")
+
+    with tempfile.TemporaryDirectory() as carpeta, warnings.catch_warnings():
+        # pandas avisa al concatenar con un DataFrame vacío
+        warnings.simplefilter("ignore", FutureWarning)
+
+        for cantidad in cantidades:
+            for nombre, funcion in (("cuadratico", cuadratico), ("streaming", streaming)):
+                engine = create_engine(f"sqlite:///{os.path.join(carpeta, nombre)}.db")
+                segundos, pico = _medir(lambda: funcion(cantidad, engine), memoria)
+                engine.dispose()
+
+                pico_texto = f"{pico:9.1f}" if pico is not None else f"{'-':>9}"
+                print(f"{cantidad:>10} {nombre:>12} {segundos:>10.2f} {cantidad / segundos:>12.0f} {pico_texto}")
+
+
+def tabla_sintetica(cantidad, semilla=42):
+    """DataFrame de facturas sintéticas con fechas dd/mm/aaaa, generado de una vez"""
+    rng = random.Random(semilla)
+    return pd.DataFrame({
+        "fecha_factura": [f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2019, 2024)}"
+                          for _ in range(cantidad)],
+        "proveedor": [f"proveedor {rng.randrange(2000)}" for _ in range(cantidad)],
+        "concepto": [f"servicio {i}" for i in range(cantidad)],
+        "importe": [round(rng.uniform(10, 5000000), 2) for _ in range(cantidad)],
+    })
+
+
+def bench_almacen(cantidad, chunk_size, repeticiones=5):
+    """Compara to_sql sin esquema con AlmacenFacturas: inserción y consultas del dashboard"""
+    df = tabla_sintetica(cantidad)
+
+    def insertar_to_sql(engine):
+        for inicio in range(0, cantidad, chunk_size):
+            df.iloc[inicio:inicio + chunk_size].to_sql("facturas", engine, if_exists="append", index=False)
+
+    def insertar_almacen(engine):
+        almacen = AlmacenFacturas(engine)
+        for inicio in range(0, cantidad, chunk_size):
+            almacen.escribir(df.iloc[inicio:inicio + chunk_size])
+        almacen.crear_indices()
+
+    # Mismo filtro en los dos esquemas: la tabla antigua guarda dd/mm/aaaa y
+    # necesita reordenar la fecha en cada fila para filtrar por rango
+    consultas = {
+        "to_sql": {
+            "rango fechas": "SELECT SUM(importe) FROM facturas WHERE substr(fecha_factura, 7, 4) || '-' || "
+                            "substr(fecha_factura, 4, 2) || '-' || substr(fecha_factura, 1, 2) "
+                            "BETWEEN '2023-03-01' AND '2023-03-31'",
+            "proveedor": "SELECT COUNT(*), SUM(importe) FROM facturas WHERE proveedor = 'proveedor 42'",
+        },
+        "almacen": {
+            "rango fechas": "SELECT SUM(importe) FROM facturas WHERE fecha_factura "
+                            "BETWEEN '2023-03-01' AND '2023-03-31'",
+            "proveedor": "SELECT COUNT(*), SUM(importe) FROM facturas WHERE proveedor = 'proveedor 42'",
+        },
+    }
+
+    print(f"{'modo':>10} {'filas/s':>10} {'rango fechas ms':>16} {'proveedor ms':>13}")
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        for nombre, insertar, engine in (
+            ("to_sql", insertar_to_sql, create_engine(f"sqlite:///{os.path.join(carpeta, 'to_sql.db')}")),
+            ("almacen", insertar_almacen, crear_engine(os.path.join(carpeta, "almacen.db"))),
+        ):
+            inicio = time.perf_counter()
+            insertar(engine)
+            filas_por_segundo = cantidad / (time.perf_counter() - inicio)
+
+            tiempos = {}
+            with engine.connect() as conn:
+                for consulta, sql in consultas[nombre].items():
+                    muestras = []
+                    for _ in range(repeticiones):
+                        inicio = time.perf_counter()
+                        conn.exec_driver_sql(sql).fetchall()
+                        muestras.append(time.perf_counter() - inicio)
+                    tiempos[consulta] = statistics.median(muestras) * 1000
+            engine.dispose()
+
+            print(f"{nombre:>10} {filas_por_segundo:>10.0f} {tiempos['rango fechas']:>16.1f} {tiempos['proveedor']:>13.1f}")
+
+
+def bench_parquet(cantidad):
+    """Agregado anual por proveedor y moneda: tabla facturas en SQLite vs dataset Parquet"""
+    from salida_parquet import SinkParquet
+
+    df = tabla_sintetica(cantidad)
+    df["moneda"] = random.Random(0).choices(["pesos", "dolares", "euros"], k=cantidad)
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        engine = crear_engine(os.path.join(carpeta, "facturas.db"))
+        sink_sqlite = pipeline.SinkSQLite(engine, reemplazar=True)
+        sink_sqlite.escribir(df)
+        sink_sqlite.cerrar()
+
+        sink_parquet = SinkParquet(os.path.join(carpeta, "parquet"), filas_por_archivo=cantidad)
+        sink_parquet.escribir(df)
+        sink_parquet.cerrar()
+
+        def desde_sqlite():
+            tabla = pd.read_sql("SELECT fecha_factura, proveedor, importe FROM facturas", engine)
+            tabla["anio"] = tabla["fecha_factura"].str[:4]
+            return tabla.groupby(["anio", "proveedor"])["importe"].sum()
+
+        def desde_parquet():
+            tabla = pd.read_parquet(os.path.join(carpeta, "parquet"), columns=["anio", "proveedor", "moneda", "importe"])
+            return tabla.groupby(["anio", "proveedor", "moneda"], observed=True)["importe"].sum()
+
+        print(f"{'origen':>10} {'segundos':>10} {'MB en disco':>12}")
+        for nombre, funcion, tamaño in (
+            ("sqlite", desde_sqlite, os.path.getsize(os.path.join(carpeta, "facturas.db"))),
+            ("parquet", desde_parquet, sum(
+                os.path.getsize(os.path.join(raiz, archivo))
+                for raiz, _, archivos in os.walk(os.path.join(carpeta, "parquet")) for archivo in archivos
+            )),
+        ):
+            segundos, _ = _medir(funcion, memoria=False)
+            print(f"{nombre:>10} {segundos:>10.2f} {tamaño / 1024 / 1024:>12.1f}")
+        engine.dispose()
+
+
+def respuestas_sinteticas(cantidad, semilla=42):
+    """Respuestas CSV del LLM como las que consume el pipeline, con algún formato de importe español"""
+    rng = random.Random(semilla)
+    monedas = ["pesos", "dolares", "euros"]
+    return [
+        (f"factura_{i}.pdf",
+         f"fecha_factura;proveedor;concepto;importe;moneda\n"
+         f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2024;proveedor {i % 500};servicio de prueba;"
+         f"{rng.uniform(10, 5000):.2f}".replace(".", ",") + f";{rng.choice(monedas)}")
+        for i in range(cantidad)
+    ]
+
+
+def bench_parseo(cantidad, chunk_size):
+    """Un read_csv por respuesta y concat por bloque vs parseo y validación por bloques"""
+    respuestas = respuestas_sinteticas(cantidad)
+
+    def por_respuesta():
+        def dataframes():
+            for _, texto in respuestas:
+                df = pd.read_csv(io.StringIO(texto), delimiter=";", dtype=str)
+                df["importe"] = pd.to_numeric(df["importe"].str.replace(",", "."), errors="coerce")
+                yield df
+        for _ in pipeline.agrupar_en_chunks(dataframes(), chunk_size):
+            pass
+
+    def por_bloques():
+        for _ in pipeline.parsear_en_bloques(respuestas, chunk_size):
+            pass
+
+    print(f"{'modo':>14} {'segundos':>10} {'respuestas/s':>14}")
+    for nombre, funcion in (("por_respuesta", por_respuesta), ("por_bloques", por_bloques)):
+        segundos, _ = _medir(funcion, memoria=False)
+        print(f"{nombre:>14} {segundos:>10.2f} {cantidad / segundos:>14.0f}")
+
+
+def bench_descubrimiento(carpetas, por_carpeta, hilos):
+    """Recorrido listdir + isfile/isdir + stat en serie vs Descubrimiento (scandir en paralelo)"""
+    from descubrimiento import Descubrimiento
+
+    def listdir_serie(raiz):
+        encontrados = {}
+        pendientes = [raiz]
+        while pendientes:
+            carpeta = pendientes.pop()
+            for nombre in os.listdir(carpeta):
+                ruta = os.path.join(carpeta, nombre)
+                if os.path.isdir(ruta):
+                    pendientes.append(ruta)
+                elif os.path.isfile(ruta) and nombre.lower().endswith(".pdf"):
+                    stat = os.stat(ruta)
+                    encontrados[ruta] = (stat.st_size, stat.st_mtime)
+        return encontrados
+
+    with tempfile.TemporaryDirectory() as raiz:
+        # Árbol año/mes/proveedor como el del archivo de facturas
+        for i in range(carpetas):
+            carpeta = os.path.join(raiz, str(2019 + i % 6), f"{i % 12 + 1:02d}", f"proveedor_{i}")
+            os.makedirs(carpeta)
+            for j in range(por_carpeta):
+                open(os.path.join(carpeta, f"factura_{j}.pdf"), "wb").close()
+
+        print(f"{'modo':>14} {'hilos':>6} {'segundos':>10} {'archivos/s':>12}")
+        segundos, _ = _medir(lambda: listdir_serie(raiz), memoria=False)
+        total = carpetas * por_carpeta
+        print(f"{'listdir':>14} {1:>6} {segundos:>10.3f} {total / segundos:>12.0f}")
+        for cantidad in hilos:
+            segundos, _ = _medir(lambda: list(Descubrimiento(raiz, profundidad=0, hilos=cantidad)), memoria=False)
+            print(f"{'scandir':>14} {cantidad:>6} {segundos:>10.3f} {total / segundos:>12.0f}")
+
+
+def bench_clientes(llamadas, hilos):
+    """Coste por llamada de preparar el cliente Gemini: construirlo en cada intento vs registro"""
+    import google.generativeai as genai
+    from concurrent.futures import ThreadPoolExecutor
+    from llm_backend import RegistroClientes, crear_cliente_gemini
+    from prompt import prompt
+
+    # Sólo se construyen objetos, no se hace ninguna petición
+    genai.configure(api_key="benchmark")
+    modelos = [funciones.MODEL_NAME, funciones.FALLBACK_MODEL or funciones.MODEL_NAME]
+    texto = "Factura de prueba\n" * 50
+
+    def por_intento(i):
+        full_prompt = prompt + "\n Este es el texto a parsear:\n" + texto
+        crear_cliente_gemini(modelos[i % 2], funciones.MAX_OUTPUT_TOKENS, funciones.TEMPERATURE)
+        return full_prompt
+
+    registro = RegistroClientes(crear_cliente_gemini)
+    registro.precalentar(modelos, funciones.MAX_OUTPUT_TOKENS, funciones.TEMPERATURE)
+
+    def con_registro(i):
+        full_prompt = funciones.constructor.prefijo_individual + texto
+        registro.obtener(modelos[i % 2], funciones.MAX_OUTPUT_TOKENS, funciones.TEMPERATURE)
+        return full_prompt
+
+    print(f"{'modo':>12} {'hilos':>6} {'µs/llamada':>12}")
+    for nombre, funcion in (("por_intento", por_intento), ("registro", con_registro)):
+        for cantidad in hilos:
+            if cantidad == 1:
+                segundos, _ = _medir(lambda: [funcion(i) for i in range(llamadas)], memoria=False)
+            else:
+                with ThreadPoolExecutor(max_workers=cantidad) as pool:
+                    segundos, _ = _medir(lambda: list(pool.map(funcion, range(llamadas))), memoria=False)
+            print(f"{nombre:>12} {cantidad:>6} {segundos / llamadas * 1e6:>12.1f}")
+    print(f"Clientes creados por el registro: {registro.creados}")
+
+
+def bench_async(cantidad, concurrencias, latencia):
+    """Facturas/s con un hilo por solicitud vs asyncio con respuestas en streaming"""
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    texto = (
+        "Empresa: Proveedor de prueba SAS\nFecha: 15/03/2024\n"
+        "Descripción: Servicio de prueba\nTotal a pagar: $ 1.250.000,00 COP\n"
+    )
+    textos = [texto + f"Factura {i}\n" for i in range(cantidad)]
+    backend = funciones.backend
+    usar_plantillas = funciones.usar_plantillas
+    funciones.backend = BackendMock(latencia=latencia, jitter=0.0, semilla=0)
+    funciones.usar_plantillas = False
+
+    def hilos(n):
+        with ThreadPoolExecutor(max_workers=n) as pool:
+            return list(pool.map(funciones.estructurar_texto, textos))
+
+    def asincrono(n):
+        return asyncio.run(funciones.estructurar_textos_async(textos, concurrencia=n))
+
+    # tracemalloc no ve las pilas de los hilos: se informa cuántos hilos hubo
+    print(f"{'modo':>8} {'en vuelo':>9} {'hilos':>6} {'segundos':>10} {'facturas/s':>12}")
+    try:
+        for nombre, funcion in (("hilos", hilos), ("async", asincrono)):
+            for n in concurrencias:
+                if nombre == "hilos" and n > 2000:
+                    continue
+                segundos, _ = _medir(lambda: funcion(n), memoria=False)
+                usados = n if nombre == "hilos" else 1
+                print(f"{nombre:>8} {n:>9} {usados:>6} {segundos:>10.2f} {cantidad / segundos:>12.1f}")
+    finally:
+        funciones.backend = backend
+        funciones.usar_plantillas = usar_plantillas
+
+
+def textos_con_duplicados(cantidad, proporcion, semilla=42):
+    """Textos de facturas de pocas plantillas; `proporcion` de ellos repite uno anterior.
+
+    Las repeticiones cambian espacios, tildes o añaden un pie de página,
+    como un PDF reexportado o descargado otra vez. Devuelve [(texto, índice
+    del original o None)].
+    """
+    rng = random.Random(semilla)
+    textos = []
+    originales = []
+    for i in range(cantidad):
+        if originales and rng.random() < proporcion:
+            j = rng.choice(originales)
+            texto = textos[j][0]
+            variante = rng.randrange(3)
+            if variante == 0:
+                texto = texto.replace("\n", " \n  ")
+            elif variante == 1:
+                texto = texto.replace("ó", "o").replace("í", "i")
+            else:
+                texto += "Documento descargado del portal de clientes\n"
+            textos.append((texto, j))
+            continue
+
+        # Misma plantilla por proveedor: sólo cambian las cifras
+        proveedor = i % 50
+        originales.append(len(textos))
+        textos.append((
+            f"FACTURA ELECTRÓNICA DE VENTA N° FE-{i:06d}\n"
+            f"Empresa: Proveedor {proveedor} SAS  NIT 900.{proveedor:03d}.555-1\n"
+            f"Fecha de emisión: {rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2024\n"
+            f"Descripción: servicio mensual de soporte técnico y mantenimiento de la plataforma\n"
+            f"Condiciones de pago: 30 días. Régimen común, no somos grandes contribuyentes\n"
+            f"Subtotal: $ {rng.randint(100, 9000)}.{rng.randint(0, 999):03d},00\n"
+            f"Total a pagar: $ {rng.randint(100, 9000)}.{rng.randint(0, 999):03d},00 COP\n",
+            None,
+        ))
+    return textos
+
+
+def bench_duplicados(cantidad, proporcion, latencia):
+    """Huellas/s del Deduplicador, aciertos frente a la verdad y llamadas al LLM evitadas"""
+    from duplicados import Deduplicador
+
+    textos = textos_con_duplicados(cantidad, proporcion)
+    engine = create_engine("sqlite://")
+    deduplicador = Deduplicador(engine)
+
+    resultados = []
+    segundos, _ = _medir(
+        lambda: resultados.extend(
+            deduplicador.comprobar(f"factura_{i}.pdf", texto) for i, (texto, _) in enumerate(textos)
+        ),
+        memoria=False,
+    )
+    deduplicador.volcar()
+    engine.dispose()
+
+    reales = sum(original is not None for _, original in textos)
+    detectados = sum(resultado is not None for resultado in resultados)
+    falsos = sum(
+        resultado is not None and original is None
+        for resultado, (_, original) in zip(resultados, textos)
+    )
+    print(f"{cantidad} textos, {reales} duplicados reales ({reales / cantidad:.0%})")
+    print(f"   {segundos:.2f}s, {cantidad / segundos:.0f} textos/s ({segundos / cantidad * 1000:.2f} ms por texto)")
+    print(f"   detectados {detectados} ({detectados / max(reales, 1):.0%} de los reales), "
+          f"{falsos} falsos positivos")
+    print(f"   llamadas al LLM evitadas: {detectados}, ~{detectados * latencia:.0f}s a {latencia}s por llamada")
+
+
+@contextlib.contextmanager
+def corpus_demo(cantidad):
+    """Genera un corpus temporal de PDFs con setup_demo.crear_facturas_aleatorias"""
+    import setup_demo
+
+    directorio_original = os.getcwd()
+    with tempfile.TemporaryDirectory() as carpeta:
+        os.makedirs(os.path.join(carpeta, "facturas"))
+        os.chdir(carpeta)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                setup_demo.crear_facturas_aleatorias(cantidad)
+            rutas = sorted(
+                os.path.abspath(os.path.join("facturas", archivo))
+                for archivo in os.listdir("facturas")
+            )
+            yield rutas
+        finally:
+            os.chdir(directorio_original)
+
+
+def bench_extraccion(cantidad, lista_workers):
+    """Mide páginas/segundo de la extracción en serie y con el pool de procesos"""
+    with corpus_demo(cantidad) as rutas:
+        print(f"📄 Corpus: {len(rutas)} PDFs, {workers_disponibles()} núcleos disponibles")
+        print(f"{'modo':>14} {'segundos':>10} {'páginas/s':>12} {'speedup':>9}")
+
+        inicio = time.perf_counter()
+        paginas = 0
+        for ruta_pdf in rutas:
+            doc = fitz.open(ruta_pdf)
+            paginas += funciones.extraer_texto_documento(doc)[1]
+            doc.close()
+        base = time.perf_counter() - inicio
+        print(f"{'serie':>14} {base:>10.2f} {paginas / base:>12.0f} {1.0:>9.2f}")
+
+        for workers in lista_workers:
+            with PoolExtraccion(workers) as pool:
+                # Calentar los procesos para no medir su arranque
+                list(pool.extraer(rutas[:workers]))
+                inicio = time.perf_counter()
+                paginas = sum(leidas for _, _, leidas in pool.extraer(rutas))
+                segundos = time.perf_counter() - inicio
+            print(f"{f'pool x{workers}':>14} {segundos:>10.2f} {paginas / segundos:>12.0f} {base / segundos:>9.2f}")
+
+
+def _percentil(valores, p):
+    if len(valores) < 2:
+        return valores[0] if valores else 0.0
+    return statistics.quantiles(valores, n=100, method="inclusive")[p - 1]
+
+
+def bench_e2e(cantidad, workers, batch, latencia, tasa_503, tasa_429):
+    """Ejecuta main.py completo contra el backend simulado y mide el rendimiento"""
+    import main
+
+    mock = BackendMock(latencia=latencia, tasa_503=tasa_503, tasa_429=tasa_429, semilla=0)
+    latencias = []
+    lock = threading.Lock()
+
+    estructurar_texto = funciones.estructurar_texto
+    estructurar_lote = funciones.estructurar_lote
+    backend = funciones.backend
+
+    def estructurar_texto_medido(texto, archivo=None):
+        inicio = time.perf_counter()
+        try:
+            return estructurar_texto(texto, archivo)
+        finally:
+            with lock:
+                latencias.append(time.perf_counter() - inicio)
+
+    def estructurar_lote_medido(textos, archivos=None):
+        inicio = time.perf_counter()
+        try:
+            return estructurar_lote(textos, archivos)
+        finally:
+            # Cada factura del lote espera lo mismo que el lote completo
+            with lock:
+                latencias.extend([time.perf_counter() - inicio] * len(textos))
+
+    argv = ["main.py", "--overwrite", "--no-cache", "--no-templates", "--workers", str(workers)]
+    if batch:
+        argv.append("--batch")
+
+    with corpus_demo(cantidad):
+        funciones.backend = mock
+        funciones.estructurar_texto = estructurar_texto_medido
+        funciones.estructurar_lote = estructurar_lote_medido
+        argv_original = sys.argv
+        sys.argv = argv
+        try:
+            inicio = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                main.main()
+            segundos = time.perf_counter() - inicio
+        finally:
+            sys.argv = argv_original
+            funciones.backend = backend
+            funciones.estructurar_texto = estructurar_texto
+            funciones.estructurar_lote = estructurar_lote
+
+    pico_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    reintentos = sum(mock.errores.values())
+
+    print(f"⚙️ {cantidad} facturas, workers={workers}, lote={'sí' if batch else 'no'}, "
+          f"latencia simulada={latencia}s, 503={tasa_503:.0%}, 429={tasa_429:.0%}")
+    print(f"   facturas/s:   {cantidad / segundos:.2f} ({segundos:.1f}s en total)")
+    print(f"   latencia p50: {_percentil(latencias, 50):.3f}s")
+    print(f"   latencia p95: {_percentil(latencias, 95):.3f}s")
+    print(f"   latencia p99: {_percentil(latencias, 99):.3f}s")
+    print(f"   llamadas LLM: {mock.llamadas} ({reintentos} con error: "
+          f"{mock.errores['503']} x 503, {mock.errores['429']} x 429)")
+    print(f"   memoria pico: {pico_mb:.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks del pipeline de facturas')
+    subparsers = parser.add_subparsers(dest='bench', required=True)
+
+    parser_concat = subparsers.add_parser('concat', help='pd.concat acumulativo vs pipeline por bloques')
+    parser_concat.add_argument('--n', type=int, nargs='+', default=[10000, 100000],
+                               help='Cantidades de facturas sintéticas')
+    parser_concat.add_argument('--chunk-size', type=int, default=pipeline.CHUNK_SIZE)
+    parser_concat.add_argument('--memoria', action='store_true',
+                               help='Medir pico de memoria con tracemalloc (más lento)')
+
+    parser_almacen = subparsers.add_parser('almacen', help='to_sql sin esquema vs AlmacenFacturas')
+    parser_almacen.add_argument('--n', type=int, default=1000000, help='Filas sintéticas')
+    parser_almacen.add_argument('--chunk-size', type=int, default=pipeline.CHUNK_SIZE)
+
+    parser_parseo = subparsers.add_parser('parseo', help='read_csv por respuesta vs parseo por bloques')
+    parser_parseo.add_argument('--n', type=int, default=100000, help='Respuestas sintéticas')
+    parser_parseo.add_argument('--chunk-size', type=int, default=pipeline.CHUNK_SIZE)
+
+    parser_descubrimiento = subparsers.add_parser('descubrimiento', help='listdir en serie vs scandir en paralelo')
+    parser_descubrimiento.add_argument('--carpetas', type=int, default=2000, help='Carpetas del árbol sintético')
+    parser_descubrimiento.add_argument('--por-carpeta', type=int, default=20, help='PDFs vacíos por carpeta')
+    parser_descubrimiento.add_argument('--hilos', type=int, nargs='+', default=[1, 8])
+
+    parser_clientes = subparsers.add_parser('clientes', help='Cliente Gemini por intento vs registro de clientes')
+    parser_clientes.add_argument('--n', type=int, default=20000, help='Llamadas simuladas')
+    parser_clientes.add_argument('--hilos', type=int, nargs='+', default=[1, 8])
+
+    parser_async = subparsers.add_parser('async', help='Hilos vs asyncio contra el backend LLM simulado')
+    parser_async.add_argument('--n', type=int, default=2000, help='Textos estructurados')
+    parser_async.add_argument('--en-vuelo', type=int, nargs='+', default=[16, 64, 256],
+                              help='Solicitudes simultáneas (hilos o tareas asyncio)')
+    parser_async.add_argument('--latencia', type=float, default=0.5, help='Segundos por llamada simulada')
+
+    parser_duplicados = subparsers.add_parser('duplicados', help='Detección de facturas casi duplicadas')
+    parser_duplicados.add_argument('--n', type=int, default=20000, help='Textos sintéticos')
+    parser_duplicados.add_argument('--proporcion', type=float, default=0.4, help='Fracción de duplicados')
+    parser_duplicados.add_argument('--latencia', type=float, default=0.5, help='Segundos por llamada al LLM')
+
+    parser_parquet = subparsers.add_parser('parquet', help='Agregados anuales: SQLite vs Parquet')
+    parser_parquet.add_argument('--n', type=int, default=1000000, help='Filas sintéticas')
+
+    parser_extraccion = subparsers.add_parser('extraccion', help='Páginas/segundo del pool de extracción')
+    parser_extraccion.add_argument('--n', type=int, default=200, help='PDFs del corpus de prueba')
+    parser_extraccion.add_argument('--workers', type=int, nargs='+',
+                                   default=sorted({1, 2, workers_disponibles()}))
+
+    parser_e2e = subparsers.add_parser('e2e', help='main.py completo contra el backend LLM simulado')
+    parser_e2e.add_argument('--n', type=int, default=100, help='PDFs generados con setup_demo')
+    parser_e2e.add_argument('--workers', type=int, default=1)
+    parser_e2e.add_argument('--batch', action='store_true', help='Usar el modo lote de main.py')
+    parser_e2e.add_argument('--latencia', type=float, default=0.5, help='Segundos por llamada simulada')
+    parser_e2e.add_argument('--tasa-503', type=float, default=0.0, help='Probabilidad de error 503')
+    parser_e2e.add_argument('--tasa-429', type=float, default=0.0, help='Probabilidad de error 429')
+
+    args = parser.parse_args()
+
+    if args.bench == 'concat':
+        bench_concat(args.n, args.chunk_size, args.memoria)
+    elif args.bench == 'almacen':
+        bench_almacen(args.n, args.chunk_size)
+    elif args.bench == 'parseo':
+        bench_parseo(args.n, args.chunk_size)
+    elif args.bench == 'descubrimiento':
+        bench_descubrimiento(args.carpetas, args.por_carpeta, args.hilos)
+    elif args.bench == 'clientes':
+        bench_clientes(args.n, args.hilos)
+    elif args.bench == 'async':
+        bench_async(args.n, args.en_vuelo, args.latencia)
+    elif args.bench == 'duplicados':
+        bench_duplicados(args.n, args.proporcion, args.latencia)
+    elif args.bench == 'parquet':
+        bench_parquet(args.n)
+    elif args.bench == 'extraccion':
+        bench_extraccion(args.n, args.workers)
+    elif args.bench == 'e2e':
+        bench_e2e(args.n, args.workers, args.batch, args.latencia, args.tasa_503, args.tasa_429)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def hash_texto(texto):
+    """SHA-256 hexadecimal de un texto"""
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """Caché persistente en SQLite de respuestas CSV del LLM.
+
+    La clave combina el hash del texto extraído con el hash de la
+    configuración (prompt, temperatura, tokens máximos), del modelo que
+    respondió de verdad y del modo de la solicitud (individual o lote), de
+    modo que cambiar cualquiera de ellos invalida las entradas anteriores y
+    una respuesta del fallback nunca pasa por una del primario.
+    """
+
+    def __init__(self, ruta_db, config, max_mb=0, max_dias=0):
+        self.ruta_db = ruta_db
+        self.hash_config = hash_texto("\x1f".join(str(parte) for parte in config))
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_segundos = max_dias * 86400
+        self.refrescar = False
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(ruta_db, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                clave TEXT PRIMARY KEY,
+                respuesta TEXT NOT NULL,
+                bytes INTEGER NOT NULL,
+                creado REAL NOT NULL,
+                ultimo_acceso REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_llm_cache_acceso ON llm_cache (ultimo_acceso)"
+        )
+        self._conn.commit()
+
+    def clave(self, texto, modelo, modo="individual"):
+        """Clave de caché para un texto respondido por `modelo` en el modo dado"""
+        return f"{hash_texto(texto)}:{hash_texto(f'{self.hash_config}:{modelo}:{modo}')}"
+
+    def obtener(self, texto, modelos, modo="individual"):
+        """(CSV, modelo que lo generó) de la primera entrada válida según el orden de `modelos`, o None"""
+        with self._lock:
+            if self.refrescar:
+                self.misses += 1
+                return None
+
+            claves = {self.clave(texto, modelo, modo): modelo for modelo in modelos}
+            filas = {
+                clave: (respuesta, creado)
+                for clave, respuesta, creado in self._conn.execute(
+                    f"SELECT clave, respuesta, creado FROM llm_cache WHERE clave IN ({', '.join('?' * len(claves))})",
+                    list(claves),
+                )
+                if not self._caducada(creado)
+            }
+
+            clave = next((clave for clave in claves if clave in filas), None)
+            if clave is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE llm_cache SET ultimo_acceso = ? WHERE clave = ?", (time.time(), clave)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return filas[clave][0], claves[clave]
+
+    def guardar(self, texto, respuesta, modelo, modo="individual"):
+        """Guarda la respuesta CSV asociada al texto y al modelo que la generó"""
+        ahora = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?)",
+                (self.clave(texto, modelo, modo), respuesta, len(respuesta.encode("utf-8")), ahora, ahora),
+            )
+            self._conn.commit()
+
+    def _caducada(self, creado):
+        return bool(self.max_segundos) and time.time() - creado > self.max_segundos
+
+    def purgar(self):
+        """Elimina entradas caducadas y las menos usadas si se supera el tamaño máximo"""
+        eliminadas = 0
+        with self._lock:
+            if self.max_segundos:
+                cursor = self._conn.execute(
+                    "DELETE FROM llm_cache WHERE creado < ?", (time.time() - self.max_segundos,)
+                )
+                eliminadas += cursor.rowcount
+
+            if self.max_bytes:
+                total = self._conn.execute(
+                    "SELECT COALESCE(SUM(bytes), 0) FROM llm_cache"
+                ).fetchone()[0]
+                if total > self.max_bytes:
+                    filas = self._conn.execute(
+                        "SELECT clave, bytes FROM llm_cache ORDER BY ultimo_acceso"
+                    ).fetchall()
+                    claves = []
+                    for clave, tamaño in filas:
+                        if total <= self.max_bytes:
+                            break
+                        claves.append((clave,))
+                        total -= tamaño
+                    self._conn.executemany("DELETE FROM llm_cache WHERE clave = ?", claves)
+                    eliminadas += len(claves)
+
+            self._conn.commit()
+
+        if eliminadas:
+            logger.info(f"Caché LLM: {eliminadas} entradas eliminadas")
+        return eliminadas
+
+    def cerrar(self):
+        with self._lock:
+            self._conn.close()
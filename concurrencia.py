@@ -0,0 +1,270 @@
+import asyncio
+import contextlib
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
+import funciones
+import ocr
+from extraccion import PoolExtraccion
+
+
+def _marcar_extraido(registro, ruta_pdf):
+    if registro is not None:
+        registro.marcar(ruta_pdf, "extraido")
+
+
+def _duplicado(duplicados, ruta_pdf, texto):
+    """Duplicado si el texto repite una factura ya vista; None sin deduplicador"""
+    if duplicados is None:
+        return None
+    return duplicados.comprobar(ruta_pdf, texto)
+
+
+def procesar_facturas_serie(rutas_pdf, registro=None, duplicados=None):
+    """Extrae y estructura cada factura una tras otra (modo clásico).
+
+    Genera pares (ruta, CSV o excepción) a medida que se procesan. Si se
+    pasa un registro de trabajos, cada PDF extraído queda marcado en él.
+    Con un Deduplicador, las facturas repetidas no llegan al LLM y su
+    resultado es un Duplicado en lugar del CSV.
+    """
+    for ruta_pdf in rutas_pdf:
+        try:
+            texto_no_estructurado = funciones.extraer_texto_pdf(ruta_pdf)
+            _marcar_extraido(registro, ruta_pdf)
+            yield ruta_pdf, (
+                _duplicado(duplicados, ruta_pdf, texto_no_estructurado)
+                or funciones.estructurar_texto(texto_no_estructurado, ruta_pdf)
+            )
+        except Exception as e:
+            yield ruta_pdf, e
+
+
+def _estructurar_extraido(futuro_pdf, ruta_pdf, registro=None, duplicados=None):
+    """Espera la extracción de un PDF, reconoce sus páginas escaneadas y estructura su texto"""
+    texto = ocr.completar(ruta_pdf, futuro_pdf.result())
+    _marcar_extraido(registro, ruta_pdf)
+    return _duplicado(duplicados, ruta_pdf, texto) or funciones.estructurar_texto(texto, ruta_pdf)
+
+
+def _resultado(ruta_pdf, futuro):
+    try:
+        return ruta_pdf, futuro.result()
+    except Exception as e:
+        return ruta_pdf, e
+
+
+def procesar_facturas_concurrente(rutas_pdf, workers, registro=None, pool_pdf=None, duplicados=None):
+    """Extrae PDFs en el pool de extracción y estructura con Gemini en un pool de hilos.
+
+    Genera pares (ruta, CSV o excepción) en el mismo orden que rutas_pdf,
+    para que main.py los consuma igual que el modo en serie. Sólo se
+    mantienen en vuelo unas pocas facturas por worker, así la memoria no
+    crece con el tamaño del lote. Se puede pasar un pool_pdf ya arrancado
+    para reutilizarlo entre llamadas; si no, se crea uno para esta.
+    """
+    ventana = deque()
+
+    with contextlib.ExitStack() as pilas:
+        if pool_pdf is None:
+            pool_pdf = pilas.enter_context(PoolExtraccion())
+        pool_llm = pilas.enter_context(ThreadPoolExecutor(max_workers=workers))
+
+        for ruta_pdf in rutas_pdf:
+            # Cada texto pasa a Gemini en cuanto termina su extracción
+            futuro_pdf = pool_pdf.submit(ruta_pdf)
+            ventana.append((ruta_pdf, pool_llm.submit(
+                _estructurar_extraido, futuro_pdf, ruta_pdf, registro, duplicados
+            )))
+
+            if len(ventana) >= workers * 4:
+                yield _resultado(*ventana.popleft())
+
+        while ventana:
+            yield _resultado(*ventana.popleft())
+
+
+def _procesar_grupo_por_lotes(rutas_pdf, pool_pdf, pool_llm, registro=None, duplicados=None):
+    """Extrae un grupo de PDFs y lo estructura en lotes; lista alineada con rutas_pdf"""
+    resultados = [None] * len(rutas_pdf)
+    textos = {}
+
+    if pool_pdf is not None:
+        futuros_pdf = {
+            pool_pdf.submit(ruta_pdf): i
+            for i, ruta_pdf in enumerate(rutas_pdf)
+        }
+        for futuro in as_completed(futuros_pdf):
+            i = futuros_pdf[futuro]
+            try:
+                textos[i] = ocr.completar(rutas_pdf[i], futuro.result())
+                _marcar_extraido(registro, rutas_pdf[i])
+            except Exception as e:
+                resultados[i] = e
+    else:
+        for i, ruta_pdf in enumerate(rutas_pdf):
+            try:
+                textos[i] = funciones.extraer_texto_pdf(ruta_pdf)
+                _marcar_extraido(registro, ruta_pdf)
+            except Exception as e:
+                resultados[i] = e
+
+    # Las facturas repetidas no ocupan sitio en los lotes
+    for i in sorted(textos):
+        resultados[i] = _duplicado(duplicados, rutas_pdf[i], textos[i])
+        if resultados[i] is not None:
+            del textos[i]
+
+    indices = sorted(textos)
+    lotes = [
+        [indices[j] for j in lote]
+        for lote in funciones.planificar_lotes([textos[i] for i in indices])
+    ]
+
+    futuros_llm = {
+        pool_llm.submit(
+            funciones.estructurar_lote,
+            [textos[i] for i in lote],
+            [rutas_pdf[i] for i in lote],
+        ): tuple(lote)
+        for lote in lotes
+    }
+    for futuro in as_completed(futuros_llm):
+        lote = futuros_llm[futuro]
+        try:
+            respuestas = futuro.result()
+        except Exception as e:
+            respuestas = [e] * len(lote)
+        for i, respuesta in zip(lote, respuestas):
+            resultados[i] = respuesta
+
+    return resultados
+
+
+def procesar_facturas_por_lotes(rutas_pdf, workers=1, registro=None, pool_pdf=None, duplicados=None):
+    """Extrae los PDFs y los estructura empaquetando varias facturas por solicitud.
+
+    Las rutas se consumen por grupos de unos pocos lotes; los lotes de cada
+    grupo se envían en paralelo cuando workers > 1. Genera pares
+    (ruta, CSV o excepción) en el orden de entrada.
+    """
+    rutas_pdf = iter(rutas_pdf)
+    tamaño_grupo = funciones.LLM_BATCH_SIZE * max(1, workers) * 2
+
+    propio = pool_pdf is None and workers > 1
+    if propio:
+        pool_pdf = PoolExtraccion()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool_llm:
+            while True:
+                grupo = list(islice(rutas_pdf, tamaño_grupo))
+                if not grupo:
+                    break
+                yield from zip(grupo, _procesar_grupo_por_lotes(grupo, pool_pdf, pool_llm, registro, duplicados))
+    finally:
+        if propio:
+            pool_pdf.cerrar()
+
+
+async def _estructurar_pdf_async(ruta_pdf, pool_pdf, registro=None, duplicados=None):
+    texto = await ocr.completar_async(ruta_pdf, await asyncio.wrap_future(pool_pdf.submit(ruta_pdf)))
+    _marcar_extraido(registro, ruta_pdf)
+    duplicado = _duplicado(duplicados, ruta_pdf, texto)
+    if duplicado is not None:
+        return duplicado
+    return await funciones.estructurar_texto_async(texto, ruta_pdf)
+
+
+async def _una_async(ruta_pdf, pool_pdf, registro, duplicados, tareas):
+    """(ruta, CSV o excepción) de una factura; los errores viajan como resultado"""
+    tarea = asyncio.current_task()
+    tareas.add(tarea)
+    try:
+        return ruta_pdf, await _estructurar_pdf_async(ruta_pdf, pool_pdf, registro, duplicados)
+    except Exception as e:
+        return ruta_pdf, e
+    finally:
+        tareas.discard(tarea)
+
+
+async def _cancelar(tareas):
+    """Cancela las tareas en marcha y espera a que suelten sus turnos"""
+    tareas = list(tareas)
+    for tarea in tareas:
+        tarea.cancel()
+    await asyncio.gather(*tareas, return_exceptions=True)
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def bucle_async():
+    """Event loop del proceso, en un hilo propio que se arranca la primera vez.
+
+    Es siempre el mismo: los clientes asíncronos de Gemini (grpc.aio) quedan
+    ligados al loop en el que se usaron por primera vez, así que cada
+    ejecución de procesar_facturas_async (p. ej. cada micro-lote de
+    --watch) debe reutilizarlo en lugar de crear uno nuevo.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-async", daemon=True).start()
+        return _loop
+
+
+def procesar_facturas_async(rutas_pdf, concurrencia=None, registro=None, pool_pdf=None, duplicados=None):
+    """Extrae en el pool de extracción y estructura con asyncio y streaming.
+
+    El event loop del proceso (bucle_async) mantiene hasta `concurrencia`
+    facturas en vuelo (LLM_ASYNC_CONCURRENCIA por defecto) sin un hilo por
+    solicitud. Las rutas se leen en el hilo que consume, no en el del loop,
+    así el descubrimiento, el manifiesto o el registro nunca lo bloquean.
+    Genera pares (ruta, CSV o excepción) según terminan, no en el orden de
+    entrada; una factura cuenta en vuelo hasta que quien consume recoge su
+    resultado, así la memoria queda acotada aunque el guardado vaya más
+    lento que Gemini.
+    """
+    concurrencia = concurrencia or funciones.LLM_ASYNC_CONCURRENCIA
+    loop = bucle_async()
+    terminados = queue.Queue()
+    en_vuelo = set()
+    # Tareas ya arrancadas en el loop; sólo se tocan desde su hilo
+    tareas = set()
+    rutas_pdf = iter(rutas_pdf)
+    agotadas = False
+
+    with contextlib.ExitStack() as pilas:
+        if pool_pdf is None:
+            pool_pdf = pilas.enter_context(PoolExtraccion())
+
+        try:
+            while True:
+                while not agotadas and len(en_vuelo) < concurrencia:
+                    ruta_pdf = next(rutas_pdf, None)
+                    if ruta_pdf is None:
+                        agotadas = True
+                        break
+                    futuro = asyncio.run_coroutine_threadsafe(
+                        _una_async(ruta_pdf, pool_pdf, registro, duplicados, tareas), loop
+                    )
+                    en_vuelo.add(futuro)
+                    futuro.add_done_callback(terminados.put)
+
+                if not en_vuelo:
+                    break
+                futuro = terminados.get()
+                en_vuelo.discard(futuro)
+                yield futuro.result()
+        finally:
+            # Interrumpido o abandonado por quien consume: no dejar tareas en el
+            # loop, que sigue vivo, ni cerrar el pool de extracción bajo ellas
+            if en_vuelo:
+                for futuro in en_vuelo:
+                    futuro.cancel()
+                asyncio.run_coroutine_threadsafe(_cancelar(tareas), loop).result()
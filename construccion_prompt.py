@@ -0,0 +1,178 @@
+import os
+import re
+from dotenv import load_dotenv
+from perfilado import perfil
+from prompt import instrucciones_lote, instrucciones_lote_compactas, prompt, prompt_compacto
+
+load_dotenv(".env")
+
+# Instrucciones enviadas al LLM: completo (prompt.py original) o compacto
+PROMPT_VARIANTE = os.getenv("PROMPT_VARIANTE", "completo").lower()
+# Tokens estimados como máximo para el texto de cada factura (0 = sin recortar)
+LLM_MAX_INPUT_TOKENS = int(os.getenv("LLM_MAX_INPUT_TOKENS", "0"))
+
+VARIANTES = {
+    "completo": (prompt, instrucciones_lote),
+    "compacto": (prompt_compacto, instrucciones_lote_compactas),
+}
+
+INTRO_INDIVIDUAL = "\n Este es el texto a parsear:\n"
+INTRO_LOTE = "\n Estos son los textos a parsear:\n"
+
+# Marcadores de la sección de totales/resumen de una factura
+PATRON_TOTAL = re.compile(
+    r"total\s+a\s+pagar|valor\s+total|importe\s+total|total\s+factura|"
+    r"gran\s+total|grand\s+total|amount\s+due|total\s+due",
+    re.IGNORECASE,
+)
+
+# Líneas que suelen contener fechas, importes, NIT, emisor o moneda
+PATRON_RELEVANTE = re.compile(
+    r"\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}|\d{4}-\d{2}-\d{2}|total|importe|valor|"
+    r"nit|cif|vat|tax\s*id|empresa|raz[oó]n\s+social|emisor|proveedor|fecha|"
+    r"descripci[oó]n|concepto|\$|€|\bcop\b|\busd\b|\beur\b|pesos|d[oó]lares|euros",
+    re.IGNORECASE,
+)
+
+# Cifras con separador de miles o decimales (1.250.000 / 299,99), aunque no lleven símbolo
+PATRON_IMPORTE = re.compile(r"\d{1,3}(?:[.,]\d{3})+(?:[.,]\d{1,2})?\b|\d+[.,]\d{2}\b")
+
+# Las mismas búsquedas sin IGNORECASE, sobre la línea ya en minúsculas (bastante más rápido)
+_TOTAL = re.compile(PATRON_TOTAL.pattern)
+_RELEVANTE = re.compile(PATRON_RELEVANTE.pattern)
+
+# Las primeras líneas suelen traer el emisor aunque no lleven ningún marcador
+LINEAS_EMISOR = 5
+
+# El tokenizador de Gemini (SentencePiece, vocabulario grande) separa cada
+# dígito y cada signo; las palabras comunes son un token y las largas se parten
+PATRON_SUELTOS = re.compile(r"\d|[^\w\s]")
+PATRON_PALABRAS = re.compile(r"[^\W\d_]+")
+
+
+def contar_tokens(texto):
+    """Estimación local de tokens, sin llamar a la API.
+
+    Cuenta un token por dígito o signo y algo más de uno por palabra
+    según su largo, así las facturas cargadas de cifras no se quedan
+    cortas como con la regla de 4 caracteres por token.
+    """
+    palabras = PATRON_PALABRAS.findall(texto)
+    letras = sum(map(len, palabras))
+    return len(PATRON_SUELTOS.findall(texto)) + (letras + 4 * len(palabras)) // 8 + 1
+
+
+def _prioridad(numero, linea):
+    """0 = total, 1 = importes, fechas, NIT, moneda o emisor, 2 = resto"""
+    linea = linea.lower()
+    if _TOTAL.search(linea):
+        return 0
+    if numero < LINEAS_EMISOR or _RELEVANTE.search(linea) or PATRON_IMPORTE.search(linea):
+        return 1
+    return 2
+
+
+def recortar_texto(texto, presupuesto):
+    """Deja el texto de una factura en ~presupuesto tokens estimados.
+
+    Primero se quitan espacios sobrantes, líneas vacías y líneas repetidas.
+    Si no basta, se conservan antes que nada la sección de totales, las
+    líneas con importes, fechas, NIT o moneda y las del emisor, y con lo
+    que sobre del presupuesto el resto por orden de aparición. Las líneas
+    elegidas mantienen su orden original.
+    """
+    vistas = set()
+    lineas = []
+    for linea in texto.splitlines():
+        linea = " ".join(linea.split())
+        if linea and linea not in vistas:
+            vistas.add(linea)
+            lineas.append(linea)
+
+    tokens = [contar_tokens(linea) for linea in lineas]
+    if sum(tokens) <= presupuesto:
+        return "\n".join(lineas)
+
+    orden = sorted(range(len(lineas)), key=lambda i: (_prioridad(i, lineas[i]), i))
+    elegidas = []
+    usados = 0
+    for i in orden:
+        # Una línea enorme no impide que entren otras más cortas
+        if usados + tokens[i] <= presupuesto:
+            elegidas.append(i)
+            usados += tokens[i]
+
+    return "\n".join(lineas[i] for i in sorted(elegidas))
+
+
+class ConstructorPrompt:
+    """Arma los prompts que se envían al LLM y estima su tamaño.
+
+    Usa las instrucciones completas o compactas y deja el texto de cada
+    factura dentro de `presupuesto` tokens. Junto a cada prompt devuelve
+    (tokens originales, tokens enviados): lo que habría ocupado con las
+    instrucciones completas y el texto sin recortar, y lo que ocupa de
+    verdad, ambos estimados con contar_tokens.
+    """
+
+    def __init__(self, variante=PROMPT_VARIANTE, presupuesto=LLM_MAX_INPUT_TOKENS):
+        if variante not in VARIANTES:
+            raise ValueError(f"Variante de prompt desconocida: {variante}")
+
+        self.variante = variante
+        self.presupuesto = presupuesto
+        self.instrucciones, lote = VARIANTES[variante]
+
+        # Partes fijas del prompt, concatenadas y medidas una sola vez
+        self.prefijo_individual = self.instrucciones + INTRO_INDIVIDUAL
+        self.prefijo_lote = self.instrucciones + lote + INTRO_LOTE
+        self._tokens_individual = (
+            contar_tokens(prompt + INTRO_INDIVIDUAL), contar_tokens(self.prefijo_individual)
+        )
+        self._tokens_lote = (
+            contar_tokens(prompt + instrucciones_lote + INTRO_LOTE), contar_tokens(self.prefijo_lote)
+        )
+
+    def tokens_texto(self, texto):
+        """Tokens estimados que ocupará un texto una vez recortado"""
+        tokens = contar_tokens(texto)
+        return min(tokens, self.presupuesto) if self.presupuesto else tokens
+
+    def recortar(self, texto):
+        """(texto tal como irá al LLM, tokens estimados del texto original)
+
+        Un texto que ya cabe en el presupuesto se devuelve sin tocar, así su
+        clave en la caché no cambia.
+        """
+        tokens = contar_tokens(texto)
+        if not self.presupuesto or tokens <= self.presupuesto:
+            return texto, tokens
+
+        perfil.contar("textos_recortados")
+        return recortar_texto(texto, self.presupuesto), tokens
+
+    def individual(self, texto, tokens_original=None):
+        """(prompt para una factura, (tokens originales, tokens enviados))"""
+        tokens_texto = contar_tokens(texto)
+        original, enviado = self._tokens_individual
+        return self.prefijo_individual + texto, (
+            original + (tokens_original or tokens_texto), enviado + tokens_texto
+        )
+
+    def lote(self, textos, tokens_originales=None):
+        """(prompt, ids de documento, (tokens originales, tokens enviados)) para varias facturas"""
+        ids = [str(i + 1) for i in range(len(textos))]
+        documentos = "\n".join(
+            f"<<<DOCUMENTO {id_doc}>>>\n{texto}\n<<<FIN DOCUMENTO {id_doc}>>>"
+            for id_doc, texto in zip(ids, textos)
+        )
+
+        tokens_documentos = contar_tokens(documentos)
+        recortados = 0
+        if tokens_originales:
+            recortados = sum(tokens_originales) - sum(contar_tokens(texto) for texto in textos)
+
+        original, enviado = self._tokens_lote
+        return self.prefijo_lote + documentos, ids, (
+            original + tokens_documentos + recortados, enviado + tokens_documentos
+        )
@@ -1,7 +1,9 @@
 import os
+from collections import defaultdict
+from descubrimiento import Descubrimiento
 
 def debug_estructura_facturas():
-    """Debug para ver exactamente qué hay en la carpeta facturas"""
+    """Debug para ver exactamente qué encuentra el descubrimiento en la carpeta facturas"""
     
     print("🔍 Debug de estructura de facturas")
     print("=" * 50)
@@ -13,70 +15,32 @@ def debug_estructura_facturas():
     
     print("✅ Carpeta './facturas' existe")
     
-    # Listar todo el contenido
-    try:
-        contenido = os.listdir("./facturas")
-        print(f"📂 Contenido de ./facturas: {contenido}")
-        
-        for item in contenido:
-            ruta_item = os.path.join("./facturas", item)
-            
-            if os.path.isfile(ruta_item):
-                tamaño = os.path.getsize(ruta_item)
-                print(f"📄 Archivo: {item} ({tamaño:,} bytes)")
-            elif os.path.isdir(ruta_item):
-                print(f"📁 Carpeta: {item}/")
-                try:
-                    sub_contenido = os.listdir(ruta_item)
-                    print(f"   Contenido: {sub_contenido}")
-                    
-                    for sub_item in sub_contenido:
-                        ruta_sub = os.path.join(ruta_item, sub_item)
-                        if os.path.isfile(ruta_sub):
-                            tamaño = os.path.getsize(ruta_sub)
-                            es_pdf = sub_item.lower().endswith('.pdf')
-                            print(f"   📄 {sub_item} ({tamaño:,} bytes) {'✅ PDF' if es_pdf else '❌ No PDF'}")
-                except PermissionError as e:
-                    print(f"   ❌ Sin permisos: {e}")
-            else:
-                print(f"❓ Tipo desconocido: {item}")
-                
-    except Exception as e:
-        print(f"❌ Error listando ./facturas: {e}")
+    # Mismo recorrido (y misma configuración del .env) que usa main.py
+    descubrimiento = Descubrimiento("./facturas")
+    profundidad = descubrimiento.profundidad or "sin límite"
+    print(f"📏 Profundidad: {profundidad}")
+    print(f"✅ Incluir: {', '.join(descubrimiento.incluir) or '-'}")
+    print(f"⏭️ Excluir: {', '.join(descubrimiento.excluir) or '-'}")
     
-    # Probar main.py simulado
     print("\n" + "=" * 50)
-    print("🧪 Simulando lógica de main.py:")
+    print("🧪 Facturas que procesaría main.py:")
     
-    facturas_encontradas = 0
+    por_carpeta = defaultdict(list)
+    for ruta_pdf in descubrimiento:
+        por_carpeta[os.path.dirname(ruta_pdf)].append(ruta_pdf)
     
-    for carpeta in sorted(os.listdir("./facturas")):
-        ruta_carpeta = os.path.join("./facturas", carpeta)
-        print(f"\n📂 Revisando: {carpeta}")
-        print(f"   Ruta: {ruta_carpeta}")
-        print(f"   Es directorio: {os.path.isdir(ruta_carpeta)}")
-        
-        if not os.path.isdir(ruta_carpeta):
-            print(f"   ⏭️ Saltando (no es directorio)")
-            continue
-            
-        try:
-            archivos = os.listdir(ruta_carpeta)
-            print(f"   Archivos: {archivos}")
-            
-            for archivo in archivos:
-                es_pdf = archivo.lower().endswith('.pdf')
-                print(f"   📄 {archivo} -> PDF: {es_pdf}")
-                
-                if es_pdf:
-                    ruta_completa = os.path.join(ruta_carpeta, archivo)
-                    print(f"   ✅ FACTURA ENCONTRADA: {ruta_completa}")
-                    facturas_encontradas += 1
-                    
-        except Exception as e:
-            print(f"   ❌ Error listando carpeta: {e}")
+    for carpeta in sorted(por_carpeta):
+        print(f"\n📂 {carpeta}/")
+        for ruta_pdf in sorted(por_carpeta[carpeta]):
+            tamaño = descubrimiento.stats[ruta_pdf][0]
+            print(f"   📄 {os.path.basename(ruta_pdf)} ({tamaño:,} bytes)")
     
-    print(f"\n📊 TOTAL FACTURAS ENCONTRADAS: {facturas_encontradas}")
+    for carpeta, error in descubrimiento.errores:
+        print(f"\n❌ Sin acceso a {carpeta}: {error}")
+    
+    print(f"\n📁 Carpetas recorridas: {descubrimiento.carpetas}")
+    print(f"⏭️ Entradas descartadas (no coinciden o excluidas): {descubrimiento.descartados}")
+    print(f"📊 TOTAL FACTURAS ENCONTRADAS: {len(descubrimiento.stats)}")
 
 if __name__ == "__main__":
     debug_estructura_facturas()
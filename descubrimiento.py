@@ -0,0 +1,132 @@
+import logging
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import re
+from fnmatch import translate
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv(".env")
+
+# Niveles de carpetas leídos desde ./facturas (1 = sólo la raíz, 0 = sin límite)
+DESCUBRIMIENTO_PROFUNDIDAD = int(os.getenv("DESCUBRIMIENTO_PROFUNDIDAD", "0"))
+# Patrones glob separados por comas, sobre la ruta relativa a la raíz
+DESCUBRIMIENTO_INCLUIR = os.getenv("DESCUBRIMIENTO_INCLUIR", "*.pdf")
+DESCUBRIMIENTO_EXCLUIR = os.getenv("DESCUBRIMIENTO_EXCLUIR", "")
+# Carpetas leídas en paralelo (en un recurso de red cada listado espera E/S)
+DESCUBRIMIENTO_HILOS = int(os.getenv("DESCUBRIMIENTO_HILOS", "8"))
+
+
+def patrones(texto):
+    """Lista de patrones a partir de un texto separado por comas"""
+    return [patron.strip() for patron in texto.split(",") if patron.strip()]
+
+
+def _compilar(lista):
+    """Una sola expresión regular para todos los patrones, sin distinguir mayúsculas.
+
+    '*' también cruza '/', así '*.pdf' vale a cualquier profundidad. Sin
+    patrones devuelve None.
+    """
+    if not lista:
+        return None
+    return re.compile("|".join(f"(?:{translate(patron)})" for patron in lista), re.IGNORECASE)
+
+
+class Descubrimiento:
+    """Recorre la carpeta de facturas con os.scandir y genera las rutas a medida que aparecen.
+
+    Cada carpeta se lee con un único scandir en un pool de hilos y se
+    reutiliza el tipo de cada entrada, sin un isfile/isdir aparte. Las
+    carpetas que coinciden con un patrón de exclusión no se recorren. El
+    tamaño y el mtime de cada archivo encontrado quedan en `stats` para
+    que el manifiesto no vuelva a consultarlos.
+    """
+
+    def __init__(self, raiz, profundidad=DESCUBRIMIENTO_PROFUNDIDAD,
+                 incluir=None, excluir=None, hilos=DESCUBRIMIENTO_HILOS):
+        self.raiz = raiz
+        self.profundidad = profundidad
+        self.incluir = patrones(DESCUBRIMIENTO_INCLUIR) if incluir is None else incluir
+        self.excluir = patrones(DESCUBRIMIENTO_EXCLUIR) if excluir is None else excluir
+        self.hilos = max(1, hilos)
+        self._incluir = _compilar(self.incluir)
+        self._excluir = _compilar(self.excluir)
+        self.stats = {}
+        self.carpetas = 0
+        self.descartados = 0
+        self.errores = []
+
+    def acepta(self, relativa):
+        """True si un archivo (ruta relativa a la raíz, separada por '/') pasa los filtros"""
+        return bool(self._incluir and self._incluir.match(relativa)) and not (
+            self._excluir and self._excluir.match(relativa))
+
+    def recorre_carpeta(self, relativa, nivel):
+        """True si la subcarpeta (relativa, en el nivel indicado) se debe leer"""
+        if self._excluir and (self._excluir.match(relativa) or self._excluir.match(relativa + "/")):
+            return False
+        return not self.profundidad or nivel <= self.profundidad
+
+    def _escanear(self, carpeta, relativa, nivel):
+        """Lee una carpeta: (archivos aceptados con su stat, subcarpetas, descartados)"""
+        archivos = []
+        subcarpetas = []
+        descartados = 0
+
+        with os.scandir(carpeta) as entradas:
+            for entrada in sorted(entradas, key=lambda e: e.name):
+                ruta_relativa = relativa + entrada.name
+
+                if entrada.is_dir(follow_symlinks=False):
+                    # '2019/*' también descarta la carpeta 2019 sin leerla
+                    if self.recorre_carpeta(ruta_relativa, nivel + 1):
+                        subcarpetas.append((entrada.path, ruta_relativa + "/"))
+                    else:
+                        descartados += 1
+                    continue
+
+                if entrada.is_file() and self.acepta(ruta_relativa):
+                    try:
+                        stat = entrada.stat()
+                    except OSError as e:
+                        # Borrado o sin permisos entre el listado y el stat
+                        logger.warning(f"No se pudo leer {entrada.path}: {e}")
+                        descartados += 1
+                        continue
+                    archivos.append((entrada.path, stat.st_size, stat.st_mtime))
+                else:
+                    descartados += 1
+
+        return archivos, subcarpetas, descartados
+
+    def __iter__(self):
+        pendientes = deque([(self.raiz, "", 1)])
+        en_vuelo = {}
+
+        with ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix="descubrimiento") as pool:
+            while pendientes or en_vuelo:
+                # Pocas carpetas en vuelo: el recorrido avanza al ritmo de quien consume
+                while pendientes and len(en_vuelo) < self.hilos * 2:
+                    carpeta, relativa, nivel = pendientes.popleft()
+                    en_vuelo[pool.submit(self._escanear, carpeta, relativa, nivel)] = (carpeta, nivel)
+
+                listas, _ = wait(en_vuelo, return_when=FIRST_COMPLETED)
+                for futuro in listas:
+                    carpeta, nivel = en_vuelo.pop(futuro)
+                    try:
+                        archivos, subcarpetas, descartados = futuro.result()
+                    except OSError as e:
+                        logger.warning(f"No se pudo leer {carpeta}: {e}")
+                        self.errores.append((carpeta, e))
+                        continue
+
+                    self.carpetas += 1
+                    self.descartados += descartados
+                    pendientes.extend((subcarpeta, relativa, nivel + 1) for subcarpeta, relativa in subcarpetas)
+
+                    for ruta, tamaño, mtime in archivos:
+                        self.stats[ruta] = (tamaño, mtime)
+                        yield ruta
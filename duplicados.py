@@ -0,0 +1,298 @@
+import argparse
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import text
+from perfilado import perfil
+
+load_dotenv(".env")
+
+# Similitud de Jaccard estimada a partir de la cual dos facturas con las mismas cifras
+# se consideran la misma (un pie de página añadido a una factura corta ya baja a ~0.87)
+DUPLICADOS_UMBRAL = float(os.getenv("DUPLICADOS_UMBRAL", "0.8"))
+
+# Firma MinHash: 64 permutaciones en 16 bandas de 4 para el índice LSH. Con
+# esas bandas un par con similitud 0.8 coincide en alguna banda casi siempre
+# y uno con 0.3 casi nunca, así sólo se comparan firmas de candidatos reales
+PERMUTACIONES = 64
+FILAS_BANDA = 4
+BANDAS = PERMUTACIONES // FILAS_BANDA
+# Palabras por shingle
+SHINGLE = 3
+# Filas de huellas acumuladas antes de escribirlas en facturas.db
+DUPLICADOS_VOLCADO = 500
+
+# Primo mayor que 2**32 para las permutaciones (a·x + b) mod p
+PRIMO = np.uint64(4294967311)
+_azar = np.random.default_rng(20240501)
+_A = _azar.integers(1, 1 << 31, PERMUTACIONES, dtype=np.uint64)
+_B = _azar.integers(0, 1 << 31, PERMUTACIONES, dtype=np.uint64)
+
+PATRON_PALABRA = re.compile(r"[a-z0-9]+")
+# Cifras tal como aparecen (1.250.000,00 / 03/04/2024 / FAC-0012) antes de quitar signos
+PATRON_CIFRA = re.compile(r"\d[\d.,/-]*\d|\d")
+
+
+def normalizar(texto):
+    """Texto en minúsculas, sin tildes y con los espacios colapsados"""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.split())
+
+
+def huella_cifras(normalizado):
+    """Hash de las cifras de 3 o más dígitos (importes, fechas, números de factura).
+
+    Dos facturas de la misma plantilla y el mismo proveedor se parecen
+    casi por completo; lo que las distingue son estas cifras, así que deben
+    coincidir para tratarlas como duplicadas.
+    """
+    cifras = {re.sub(r"\D", "", cifra) for cifra in PATRON_CIFRA.findall(normalizado)}
+    return hashlib.sha1(" ".join(sorted(c for c in cifras if len(c) >= 3)).encode()).hexdigest()
+
+
+def minhash(normalizado):
+    """Firma MinHash de los shingles de palabras; None si el texto no tiene palabras"""
+    palabras = PATRON_PALABRA.findall(normalizado)
+    if not palabras:
+        return None
+
+    hashes = np.fromiter((zlib.crc32(p.encode()) for p in palabras), dtype=np.uint64, count=len(palabras))
+    if len(hashes) >= SHINGLE:
+        # Hash de cada ventana de SHINGLE palabras consecutivas
+        shingles = np.zeros(len(hashes) - SHINGLE + 1, dtype=np.uint64)
+        for desplazamiento in range(SHINGLE):
+            shingles = shingles * np.uint64(1000003) + hashes[desplazamiento:len(hashes) - SHINGLE + 1 + desplazamiento]
+        hashes = shingles & np.uint64(0xFFFFFFFF)
+    hashes = np.unique(hashes)
+
+    return ((np.outer(hashes, _A) + _B) % PRIMO).min(axis=0)
+
+
+def similitud(firma_a, firma_b):
+    """Jaccard estimado: fracción de permutaciones con el mismo mínimo"""
+    return float(np.count_nonzero(firma_a == firma_b)) / PERMUTACIONES
+
+
+def _cubetas(firma, hash_cifras):
+    """Claves LSH de una firma: una por banda, separadas por las cifras del texto.
+
+    Las facturas de una misma plantilla comparten casi todas las bandas;
+    como un duplicado debe tener las mismas cifras, incluirlas en la clave
+    deja cada cubeta con unos pocos candidatos.
+    """
+    return [
+        (banda, hash_cifras, firma[banda * FILAS_BANDA:(banda + 1) * FILAS_BANDA].tobytes())
+        for banda in range(BANDAS)
+    ]
+
+
+@dataclass(frozen=True)
+class Duplicado:
+    """Resultado de una factura que no se estructura por repetir a `original`"""
+
+    original: str
+    similitud: float
+
+    def __str__(self):
+        return f"duplicado de {self.original} (similitud {self.similitud:.2f})"
+
+
+class Deduplicador:
+    """Detecta facturas repetidas entre la extracción de texto y el LLM.
+
+    De cada texto se guardan en facturas.db el SHA-256 del texto
+    normalizado, una firma MinHash y el hash de sus cifras. Un texto
+    idéntico a uno ya visto, o con similitud >= umbral y las mismas
+    cifras, es un duplicado: no se envía al LLM y queda enlazado a su
+    original en la tabla huellas. Así también se reconocen copias del
+    mismo PDF reexportado, escaneado de nuevo o con otro nombre, aunque
+    sus bytes no coincidan. El índice persiste entre ejecuciones.
+    """
+
+    def __init__(self, engine, umbral=DUPLICADOS_UMBRAL, volcado=DUPLICADOS_VOLCADO):
+        self.engine = engine
+        self.umbral = umbral
+        self.volcado = volcado
+        self.duplicados = []
+        self._exactos = {}
+        self._firmas = {}
+        self._indice = defaultdict(set)
+        self._pendientes = []
+        self._lock = threading.Lock()
+
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS huellas (
+                    ruta TEXT PRIMARY KEY,
+                    hash_texto TEXT NOT NULL,
+                    hash_cifras TEXT NOT NULL,
+                    minhash BLOB NOT NULL,
+                    original TEXT,
+                    similitud REAL,
+                    registrada TEXT NOT NULL
+                )
+            """))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS idx_huellas_original ON huellas (original)"))
+
+            # Sólo los originales sirven de referencia; los duplicados apuntan a ellos
+            for ruta, hash_texto, hash_cifras, firma in conn.execute(text(
+                "SELECT ruta, hash_texto, hash_cifras, minhash FROM huellas WHERE original IS NULL"
+            )):
+                self._indexar(ruta, hash_texto, hash_cifras, np.frombuffer(firma, dtype=np.uint64))
+
+    def __len__(self):
+        """Facturas originales registradas en el índice"""
+        return len(self._firmas)
+
+    def vaciar(self):
+        """Olvida todas las huellas (p. ej. con --overwrite)"""
+        with self._lock:
+            self._exactos.clear()
+            self._firmas.clear()
+            self._indice.clear()
+            self._pendientes.clear()
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM huellas"))
+
+    def _indexar(self, ruta, hash_texto, hash_cifras, firma):
+        self._exactos.setdefault(hash_texto, ruta)
+        self._firmas[ruta] = (hash_texto, hash_cifras, firma)
+        for cubeta in _cubetas(firma, hash_cifras):
+            self._indice[cubeta].add(ruta)
+
+    def _olvidar(self, ruta):
+        """Quita del índice en memoria la huella anterior de un archivo modificado"""
+        hash_texto, hash_cifras, firma = self._firmas.pop(ruta)
+        if self._exactos.get(hash_texto) == ruta:
+            del self._exactos[hash_texto]
+        for cubeta in _cubetas(firma, hash_cifras):
+            self._indice[cubeta].discard(ruta)
+
+    def _buscar(self, ruta, hash_texto, hash_cifras, firma):
+        """(original, similitud) del texto más parecido por encima del umbral, o None"""
+        original = self._exactos.get(hash_texto)
+        if original is not None and original != ruta:
+            return original, 1.0
+
+        candidatos = set()
+        for cubeta in _cubetas(firma, hash_cifras):
+            candidatos.update(self._indice.get(cubeta, ()))
+        candidatos.discard(ruta)
+
+        mejor = None
+        for candidato in candidatos:
+            firma_candidato = self._firmas[candidato][2]
+            parecido = similitud(firma, firma_candidato)
+            if parecido >= self.umbral and (mejor is None or parecido > mejor[1]):
+                mejor = candidato, parecido
+        return mejor
+
+    def comprobar(self, ruta, texto):
+        """Duplicado si el texto repite una factura ya registrada; si no, la registra y devuelve None.
+
+        Los textos sin palabras (PDFs escaneados sin OCR) no se comparan.
+        """
+        with perfil.etapa("duplicados"):
+            normalizado = normalizar(texto)
+            firma = minhash(normalizado)
+            if firma is None:
+                return None
+            hash_texto = hashlib.sha256(normalizado.encode()).hexdigest()
+            hash_cifras = huella_cifras(normalizado)
+
+            with self._lock:
+                encontrado = self._buscar(ruta, hash_texto, hash_cifras, firma)
+                if encontrado is None:
+                    if ruta in self._firmas:
+                        self._olvidar(ruta)
+                    self._indexar(ruta, hash_texto, hash_cifras, firma)
+                    original, parecido = None, None
+                else:
+                    original, parecido = encontrado
+                    self.duplicados.append((ruta, original, parecido))
+                    perfil.contar("duplicados_omitidos")
+
+                self._pendientes.append(
+                    (ruta, hash_texto, hash_cifras, firma.tobytes(), original, parecido,
+                     datetime.now().isoformat())
+                )
+                volcar = len(self._pendientes) >= self.volcado
+
+        if volcar:
+            self.volcar()
+        return None if original is None else Duplicado(original, parecido)
+
+    def volcar(self):
+        """Escribe en facturas.db las huellas acumuladas"""
+        with self._lock:
+            filas, self._pendientes = self._pendientes, []
+        if not filas:
+            return
+
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql(
+                """
+                INSERT INTO huellas (ruta, hash_texto, hash_cifras, minhash, original, similitud, registrada)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(ruta) DO UPDATE SET
+                    hash_texto = excluded.hash_texto,
+                    hash_cifras = excluded.hash_cifras,
+                    minhash = excluded.minhash,
+                    original = excluded.original,
+                    similitud = excluded.similitud,
+                    registrada = excluded.registrada
+                """,
+                filas,
+            )
+
+    def grupos(self):
+        """{original: [(duplicado, similitud), ...]} con todo lo registrado en facturas.db"""
+        self.volcar()
+        grupos = defaultdict(list)
+        with self.engine.connect() as conn:
+            for ruta, original, parecido in conn.execute(text(
+                "SELECT ruta, original, similitud FROM huellas WHERE original IS NOT NULL ORDER BY original, ruta"
+            )):
+                grupos[original].append((ruta, parecido))
+        return dict(grupos)
+
+
+def imprimir_grupos(grupos, limite=None):
+    """Lista cada original con sus duplicados, los grupos más grandes primero"""
+    ordenados = sorted(grupos.items(), key=lambda grupo: (-len(grupo[1]), grupo[0]))
+    for original, duplicados in ordenados[:limite]:
+        print(f"   {original} ({len(duplicados)} duplicados)")
+        for ruta, parecido in duplicados:
+            print(f"      ↳ {ruta} ({parecido:.2f})")
+    if limite is not None and len(ordenados) > limite:
+        print(f"   ... y {len(ordenados) - limite} grupos más (python3 duplicados.py para verlos todos)")
+
+
+def main():
+    from almacen import crear_engine
+
+    parser = argparse.ArgumentParser(description='Grupos de facturas duplicadas registrados en facturas.db')
+    parser.parse_args()
+
+    engine = crear_engine("facturas.db")
+    grupos = Deduplicador(engine).grupos()
+    engine.dispose()
+
+    if not grupos:
+        print("✅ No hay facturas duplicadas registradas")
+        return
+    print(f"🧬 {sum(map(len, grupos.values()))} duplicados en {len(grupos)} grupos:")
+    imprimir_grupos(grupos)
+
+
+if __name__ == "__main__":
+    main()
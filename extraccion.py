@@ -0,0 +1,95 @@
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import fitz  # PyMuPDF
+from lectura_pdf import extraer_texto_documento
+from perfilado import perfil
+
+logger = logging.getLogger(__name__)
+
+# Procesos de extracción (0 = uno por núcleo disponible)
+EXTRACCION_WORKERS = int(os.getenv("EXTRACCION_WORKERS", "0"))
+
+
+def workers_disponibles():
+    """Número de núcleos utilizables por este proceso"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def extraer_pdf(ruta_pdf):
+    """Extrae el texto de un PDF dentro del worker.
+
+    Devuelve (texto, páginas leídas). PyMuPDF lee el archivo directamente
+    desde disco; al proceso padre sólo vuelve el texto compacto, nunca el
+    contenido del archivo. Los workers sólo importan lectura_pdf, no
+    funciones: no crean cliente LLM, limitador ni sinks de métricas.
+    """
+    try:
+        with fitz.open(ruta_pdf) as doc:
+            texto, paginas = extraer_texto_documento(doc)
+        logger.debug(f"Texto extraído de {ruta_pdf}: {len(texto)} caracteres de {paginas} páginas")
+        return texto, paginas
+    except Exception as e:
+        logger.error(f"Error extrayendo texto de {ruta_pdf}: {e}")
+        raise
+
+
+def extraer_texto_pdf(ruta_pdf):
+    """Como funciones.extraer_texto_pdf pero sin pasar por el OCR.
+
+    Las páginas escaneadas quedan marcadas: el proceso principal las pasa
+    al pool de OCR con ocr.completar().
+    """
+    return extraer_pdf(ruta_pdf)[0]
+
+
+class PoolExtraccion:
+    """Pool de procesos dedicado a la extracción de texto de PDFs.
+
+    Por defecto usa un proceso por núcleo; se puede compartir entre varias
+    etapas con submit() o procesar listas completas con extraer(). Los
+    procesos se arrancan con spawn: el pool se crea cuando ya hay hilos
+    (limitador, métricas, vigilancia) y un fork en ese estado puede
+    heredar locks tomados y bloquearse.
+    """
+
+    def __init__(self, workers=None):
+        if not workers:
+            workers = EXTRACCION_WORKERS or workers_disponibles()
+        self.workers = workers
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def submit(self, ruta_pdf):
+        """Programa la extracción de un PDF; el futuro devuelve su texto (con marcas de OCR)"""
+        futuro = self._pool.submit(extraer_texto_pdf, ruta_pdf)
+        if perfil.activo:
+            # El trabajo ocurre en otro proceso: se mide desde el envío hasta
+            # el resultado, cola incluida
+            inicio = time.perf_counter()
+            futuro.add_done_callback(
+                lambda _: perfil.observar("extraccion_pool", time.perf_counter() - inicio)
+            )
+        return futuro
+
+    def extraer(self, rutas_pdf, chunksize=4):
+        """Genera (ruta, texto, páginas) en el orden de entrada"""
+        rutas_pdf = list(rutas_pdf)
+        resultados = self._pool.map(extraer_pdf, rutas_pdf, chunksize=chunksize)
+        for ruta_pdf, (texto, paginas) in zip(rutas_pdf, resultados):
+            yield ruta_pdf, texto, paginas
+
+    def cerrar(self):
+        self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
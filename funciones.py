@@ -1,15 +1,25 @@
-import google.generativeai as genai
 import fitz  # PyMuPDF
 from dotenv import load_dotenv
 import os
-import pandas as pd
-from io import StringIO
-from prompt import prompt
 import logging
+import asyncio
 import time
 import random
-import csv
-from datetime import datetime
+import threading
+from limitador import CircuitBreaker, RateLimiter
+from planificador import (
+    LLM_MODELO_FUERTE, LLM_MODELO_RAPIDO, PLANIFICADOR_CONCURRENCIA, PLANIFICADOR_PRIORIDAD,
+    PLANIFICADOR_UMBRAL_TOKENS, Planificador, leer_concurrencia,
+)
+from cache_llm import LLMCache
+import ocr
+from plantillas import CABECERA_CSV, extraer_con_plantillas
+from llm_backend import crear_backend
+from metricas import Metricas, crear_sinks
+from perfilado import perfil
+from parseo import LineasIncrementales, lineas_csv, parsear_lineas
+from construccion_prompt import ConstructorPrompt, contar_tokens
+from lectura_pdf import extraer_texto_documento
 
 # Cargar variables de entorno desde el archivo .env
 load_dotenv(".env")
@@ -20,6 +30,12 @@ logging.basicConfig(level=getattr(logging, LOG_LEVEL),
                    format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Backend LLM: gemini (API real) o mock (local, sin red)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini").lower()
+MOCK_LATENCIA = float(os.getenv("MOCK_LATENCIA", "0.5"))
+MOCK_TASA_503 = float(os.getenv("MOCK_TASA_503", "0.0"))
+MOCK_TASA_429 = float(os.getenv("MOCK_TASA_429", "0.0"))
+
 # Configurar Gemini
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 MODEL_NAME = os.getenv("MODEL_NAME", "models/gemini-2.0-flash")
@@ -33,136 +49,618 @@ BACKOFF_BASE = float(os.getenv("BACKOFF_BASE", "1.0"))
 BACKOFF_MAX = float(os.getenv("BACKOFF_MAX", "30.0"))
 BACKOFF_JITTER = float(os.getenv("BACKOFF_JITTER", "0.5"))
 
-# Archivo de métricas
+# Cuotas compartidas del proveedor (0 = sin límite)
+LLM_RPM = int(os.getenv("LLM_RPM", "0"))
+LLM_TPM = int(os.getenv("LLM_TPM", "0"))
+LLM_RITMO_MINIMO = float(os.getenv("LLM_RITMO_MINIMO", "0.1"))
+
+# Circuit breaker por modelo
+CB_FALLOS = int(os.getenv("CB_FALLOS", "3"))
+CB_APERTURA = float(os.getenv("CB_APERTURA", "30.0"))
+CB_APERTURA_MAX = float(os.getenv("CB_APERTURA_MAX", "300.0"))
+
+# Empaquetado de varias facturas por solicitud
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "10"))
+LLM_BATCH_MAX_INPUT_TOKENS = int(os.getenv("LLM_BATCH_MAX_INPUT_TOKENS", "8000"))
+LLM_BATCH_TOKENS_POR_FILA = float(os.getenv("LLM_BATCH_TOKENS_POR_FILA", "40"))
+
+# Solicitudes en vuelo a la vez en el modo asíncrono (--async)
+LLM_ASYNC_CONCURRENCIA = int(os.getenv("LLM_ASYNC_CONCURRENCIA", "64"))
+
+# Métricas de uso del LLM (sinks: csv, sqlite, jsonl)
+LLM_METRICS_SINKS = os.getenv("LLM_METRICS_SINKS", "csv").split(",")
 LLM_METRICS_CSV = os.getenv("LLM_METRICS_CSV", "llm_usage.csv")
+LLM_METRICS_DB = os.getenv("LLM_METRICS_DB", "facturas.db")
+LLM_METRICS_JSONL = os.getenv("LLM_METRICS_JSONL", "llm_usage.jsonl")
+LLM_METRICS_FLUSH_SEGUNDOS = float(os.getenv("LLM_METRICS_FLUSH_SEGUNDOS", "2.0"))
+# Precio en USD por millón de tokens, para la estimación de coste
+LLM_PRECIO_ENTRADA_1M = float(os.getenv("LLM_PRECIO_ENTRADA_1M", "0.10"))
+LLM_PRECIO_SALIDA_1M = float(os.getenv("LLM_PRECIO_SALIDA_1M", "0.40"))
+
+# Caché persistente de respuestas (0 = sin límite de tamaño/antigüedad)
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", "llm_cache.db")
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "0"))
+LLM_CACHE_MAX_DAYS = float(os.getenv("LLM_CACHE_MAX_DAYS", "0"))
+
+# Instrucciones (completas o compactas) y recorte del texto al presupuesto de tokens
+constructor = ConstructorPrompt()
+
+backend = crear_backend(
+    LLM_BACKEND,
+    api_key=GOOGLE_API_KEY,
+    latencia=MOCK_LATENCIA,
+    tasa_503=MOCK_TASA_503,
+    tasa_429=MOCK_TASA_429,
+)
+# Todos los modelos que puede usar el planificador: primario, fallback, rápido y fuerte
+MODELOS = list(dict.fromkeys(filter(None, [MODEL_NAME, FALLBACK_MODEL, LLM_MODELO_RAPIDO, LLM_MODELO_FUERTE])))
+
+# Clientes de todos los modelos creados una sola vez, antes de la primera factura
+backend.precalentar(MODELOS, MAX_OUTPUT_TOKENS, TEMPERATURE)
+
+# Limitador compartido por todos los hilos que llaman a Gemini
+rate_limiter = RateLimiter(
+    LLM_RPM, LLM_TPM,
+    factor_minimo=LLM_RITMO_MINIMO,
+    pausa_base=BACKOFF_BASE,
+    pausa_maxima=BACKOFF_MAX,
+)
+
+# Un circuit breaker por modelo para desviar tráfico al fallback
+breakers = {
+    modelo: CircuitBreaker(modelo, CB_FALLOS, CB_APERTURA, CB_APERTURA_MAX)
+    for modelo in MODELOS
+}
+
+# Modelo de cada solicitud según tamaño, precisión por proveedor y salud; cupos por modelo
+planificador = Planificador(
+    MODEL_NAME,
+    FALLBACK_MODEL,
+    rapido=LLM_MODELO_RAPIDO,
+    fuerte=LLM_MODELO_FUERTE,
+    umbral_tokens=PLANIFICADOR_UMBRAL_TOKENS,
+    concurrencia=leer_concurrencia(PLANIFICADOR_CONCURRENCIA),
+    prioridad=PLANIFICADOR_PRIORIDAD,
+    breakers=breakers,
+)
+
+# Métricas en memoria; los sinks se abren con configurar_metricas(), no al importar
+metricas = Metricas(
+    intervalo=LLM_METRICS_FLUSH_SEGUNDOS,
+    precio_entrada=LLM_PRECIO_ENTRADA_1M,
+    precio_salida=LLM_PRECIO_SALIDA_1M,
+)
+
+# Estimación de tokens de salida por fila, ajustada con el uso real
+_tokens_por_fila = LLM_BATCH_TOKENS_POR_FILA
+_batch_lock = threading.Lock()
+
+# Probar las plantillas locales antes de llamar al LLM
+usar_plantillas = True
+
+# Caché de respuestas; se activa explícitamente con configurar_cache()
+llm_cache = None
 
-genai.configure(api_key=GOOGLE_API_KEY)
+def configurar_cache(refrescar=False):
+    """Abre la caché de respuestas del LLM y aplica la política de purgado"""
+    global llm_cache
+    llm_cache = LLMCache(
+        LLM_CACHE_DB,
+        (constructor.instrucciones, TEMPERATURE, MAX_OUTPUT_TOKENS),
+        max_mb=LLM_CACHE_MAX_MB,
+        max_dias=LLM_CACHE_MAX_DAYS,
+    )
+    llm_cache.refrescar = refrescar
+    llm_cache.purgar()
+    return llm_cache
 
-def log_llm_usage(model_name, prompt_tokens, completion_tokens, total_tokens, success=True):
-    """Registra métricas de uso del LLM en CSV"""
+def configurar_metricas():
+    """Conecta los sinks de LLM_METRICS_SINKS; se vuelcan en segundo plano desde el primer registro"""
+    metricas.conectar(crear_sinks(LLM_METRICS_SINKS, LLM_METRICS_CSV, LLM_METRICS_DB, LLM_METRICS_JSONL))
+    return metricas
+
+def estimar_tokens(texto):
+    """Estimación local de tokens (ver construccion_prompt.contar_tokens)"""
+    return contar_tokens(texto)
+
+def log_llm_usage(model_name, prompt_tokens, completion_tokens, total_tokens, success=True,
+                  latencia=None, intento=None, archivo=None, cache=None, tokens_prompt=None):
+    """Registra métricas de uso del LLM (se vuelcan en segundo plano a los sinks).
+
+    tokens_prompt es el par estimado (original, enviado) del constructor de prompts.
+    """
+    tokens_original, tokens_enviado = tokens_prompt or (None, None)
     try:
-        file_exists = os.path.exists(LLM_METRICS_CSV)
-        
-        with open(LLM_METRICS_CSV, 'a', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['timestamp', 'model', 'prompt_tokens', 'completion_tokens', 
-                         'total_tokens', 'success']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            
-            if not file_exists:
-                writer.writeheader()
-            
-            writer.writerow({
-                'timestamp': datetime.now().isoformat(),
-                'model': model_name,
-                'prompt_tokens': prompt_tokens,
-                'completion_tokens': completion_tokens,
-                'total_tokens': total_tokens,
-                'success': success
-            })
+        metricas.registrar(
+            model_name, prompt_tokens, completion_tokens, total_tokens, success,
+            latencia=latencia, intento=intento, archivo=archivo, cache=cache,
+            tokens_prompt_original=tokens_original, tokens_prompt_enviado=tokens_enviado,
+        )
     except Exception as e:
         logger.warning(f"No se pudo registrar métricas LLM: {e}")
 
-def extraer_texto_pdf(ruta_pdf):
-    """Extrae texto de un archivo PDF"""
+def _estado_cache():
+    if llm_cache is None:
+        return "desactivada"
+    return "refresh" if llm_cache.refrescar else "miss"
+
+def extraer_texto_pdf(ruta_pdf, max_pages=None, max_chars=None, parar_en_total=None, modo=None):
+    """Extrae texto de un archivo PDF página a página, con límites opcionales.
+
+    Las páginas escaneadas pasan por el pool de OCR; un documento sin
+    texto utilizable lanza ocr.SinTexto.
+    """
     try:
-        doc = fitz.open(ruta_pdf)
-        text = "\n".join([page.get_text("text") for page in doc])
-        doc.close()
-        logger.debug(f"Texto extraído de {ruta_pdf}: {len(text)} caracteres")
+        with perfil.etapa("extraccion_pdf"):
+            doc = fitz.open(ruta_pdf)
+            text, paginas = extraer_texto_documento(doc, max_pages, max_chars, parar_en_total, modo)
+            doc.close()
+        perfil.contar("paginas", paginas)
+        text = ocr.completar(ruta_pdf, text)
+        logger.debug(f"Texto extraído de {ruta_pdf}: {len(text)} caracteres de {paginas} páginas")
         return text
     except Exception as e:
         logger.error(f"Error extrayendo texto de {ruta_pdf}: {e}")
         raise
 
-def estructurar_texto(texto):
-    """Envía el texto a Gemini con reintentos y fallback"""
+def _es_throttle(error):
+    """429 / cuota agotada"""
+    mensaje = str(error).lower()
+    return "429" in mensaje or "resource has been exhausted" in mensaje or "quota" in mensaje
+
+def _es_sobrecarga(error):
+    """503 / modelo no disponible"""
+    mensaje = str(error).lower()
+    return "503" in mensaje or "unavailable" in mensaje or "overloaded" in mensaje
+
+def _registrar_uso(respuesta, modelo, inicio, attempt, archivo, tokens_prompt=None):
+    """Métricas de una llamada correcta, si la respuesta trae usage_metadata"""
+    try:
+        usage = respuesta.usage_metadata
+        if usage:
+            log_llm_usage(
+                modelo,
+                usage.prompt_token_count,
+                usage.candidates_token_count,
+                usage.total_token_count,
+                True,
+                latencia=time.perf_counter() - inicio,
+                intento=attempt + 1,
+                archivo=archivo,
+                cache=_estado_cache(),
+                tokens_prompt=tokens_prompt,
+            )
+    except AttributeError:
+        logger.debug("Métricas de uso no disponibles")
+
+def _tratar_fallo(e, attempt, current_model, inicio, archivo, tokens_prompt=None):
+    """Registra un intento fallido y decide el siguiente.
+
+    Devuelve None si no quedan intentos o los segundos de backoff antes de
+    reintentar (0 para reintentar ya: throttle o cambio de modelo).
+    """
+    logger.warning(f"Intento {attempt + 1} falló: {e}")
     
-    current_model = MODEL_NAME
+    # Registrar fallo en métricas
+    log_llm_usage(
+        current_model, 0, 0, 0, False,
+        latencia=time.perf_counter() - inicio if inicio else None,
+        intento=attempt + 1,
+        archivo=archivo,
+        cache=_estado_cache(),
+        tokens_prompt=tokens_prompt,
+    )
+    
+    if attempt == LLM_RETRIES - 1:
+        logger.error("Todos los intentos fallaron para estructurar texto")
+        return None
+    
+    perfil.contar("reintentos_llm")
+    
+    if _es_throttle(e):
+        # El limitador compartido frena a todos los hilos a la vez;
+        # el siguiente intento esperará en rate_limiter.adquirir()
+        pausa = rate_limiter.registrar_throttle()
+        logger.info(f"Cuota agotada, pausa global de {pausa:.1f}s y ritmo al {rate_limiter.factor:.0%}")
+        return 0.0
+    
+    if _es_sobrecarga(e):
+        if breakers[current_model].registrar_fallo():
+            logger.warning(f"Circuito abierto para {current_model}")
+        
+        # Si hay error de sobrecarga y otro modelo disponible, reintentar ya con él
+        # (desde el fallback, que es el último recurso, se espera el backoff)
+        alternativa = next(
+            (modelo for modelo in MODELOS if modelo != current_model and breakers[modelo].estado != "abierto"),
+            None,
+        )
+        if alternativa and current_model != FALLBACK_MODEL:
+            logger.info(f"Cambiando de modelo tras sobrecarga de {current_model}")
+            return 0.0
+    
+    # Backoff exponencial con jitter
+    delay = min(BACKOFF_BASE * (2 ** attempt), BACKOFF_MAX)
+    jitter = random.uniform(0, BACKOFF_JITTER)
+    sleep_time = delay + jitter
+    
+    logger.info(f"Esperando {sleep_time:.1f}s antes del siguiente intento...")
+    return sleep_time
+
+def _generar(full_prompt, archivo=None, tokens_prompt=None):
+    """Llama a Gemini con reintentos, backoff y fallback; devuelve (respuesta, modelo que respondió) o None"""
+    
+    modelo_sobrecargado = None
+    tokens_enviados = tokens_prompt[1] if tokens_prompt else estimar_tokens(full_prompt)
     
     for attempt in range(LLM_RETRIES):
+        # Modelo y cupo según tamaño, proveedor y salud; en cola por prioridad si está lleno
+        with perfil.etapa("espera_modelo"):
+            turno = planificador.ocupar(tokens_enviados, archivo, modelo_sobrecargado)
+        current_model = turno.modelo
+        inicio = None
+        valida = None
+        
         try:
-            logger.debug(f"Intento {attempt + 1}/{LLM_RETRIES} con modelo {current_model}")
+            # El turno se devuelve una sola vez, antes de registrar el uso o de esperar el backoff
+            try:
+                logger.debug(f"Intento {attempt + 1}/{LLM_RETRIES} con modelo {current_model}")
+                
+                # Respetar las cuotas RPM/TPM compartidas antes de llamar
+                with perfil.etapa("espera_cuota"):
+                    rate_limiter.adquirir(tokens_enviados + MAX_OUTPUT_TOKENS)
+                
+                inicio = time.perf_counter()
+                perfil.contar("llamadas_llm")
+                with perfil.etapa("llm"):
+                    respuesta = backend.generar(current_model, full_prompt, MAX_OUTPUT_TOKENS, TEMPERATURE)
+                valida = respuesta.text.strip().lower() != "error"
+            finally:
+                planificador.liberar(turno, exito=valida is not None, valida=valida)
             
-            model = genai.GenerativeModel(
-                current_model,
-                generation_config=genai.types.GenerationConfig(
-                    max_output_tokens=MAX_OUTPUT_TOKENS,
-                    temperature=TEMPERATURE
-                )
-            )
+            rate_limiter.registrar_exito()
+            breakers[current_model].registrar_exito()
+            _registrar_uso(respuesta, current_model, inicio, attempt, archivo, tokens_prompt)
             
-            full_prompt = prompt + "\n Este es el texto a parsear:\n" + texto
+            logger.debug(f"Respuesta obtenida: {len(respuesta.text)} caracteres")
             
-            respuesta = model.generate_content(full_prompt)
+            return respuesta, current_model
             
-            # Intentar extraer métricas de uso si están disponibles
-            try:
-                usage = respuesta.usage_metadata
-                if usage:
-                    log_llm_usage(
-                        current_model,
-                        usage.prompt_token_count,
-                        usage.candidates_token_count,
-                        usage.total_token_count,
-                        True
-                    )
-            except AttributeError:
-                logger.debug("Métricas de uso no disponibles")
+        except Exception as e:
+            if _es_sobrecarga(e):
+                modelo_sobrecargado = current_model
             
-            csv_respuesta = respuesta.text.strip()
-            logger.debug(f"Respuesta obtenida: {len(csv_respuesta)} caracteres")
+            espera = _tratar_fallo(e, attempt, current_model, inicio, archivo, tokens_prompt)
+            if espera is None:
+                return None
+            if espera:
+                with perfil.etapa("backoff"):
+                    time.sleep(espera)
+    
+    return None
+
+async def _generar_async(full_prompt, archivo=None, tokens_prompt=None):
+    """Como _generar pero sin bloquear el event loop y leyendo la respuesta en streaming.
+
+    Las líneas CSV se separan según llegan los fragmentos; si el modelo
+    empieza contestando "error" se deja de leer en ese momento. Devuelve
+    (LineasIncrementales de la respuesta, modelo que respondió) o None si
+    fallan todos los intentos.
+    """
+    
+    modelo_sobrecargado = None
+    tokens_enviados = tokens_prompt[1] if tokens_prompt else estimar_tokens(full_prompt)
+    
+    for attempt in range(LLM_RETRIES):
+        with perfil.etapa("espera_modelo"):
+            turno = await planificador.ocupar_async(tokens_enviados, archivo, modelo_sobrecargado)
+        current_model = turno.modelo
+        inicio = None
+        valida = None
+        
+        try:
+            # try/finally y no except Exception: una tarea cancelada (CancelledError)
+            # también devuelve su turno, y nunca dos veces
+            try:
+                logger.debug(f"Intento {attempt + 1}/{LLM_RETRIES} con modelo {current_model} (async)")
+                
+                with perfil.etapa("espera_cuota"):
+                    await rate_limiter.adquirir_async(tokens_enviados + MAX_OUTPUT_TOKENS)
+                
+                inicio = time.perf_counter()
+                perfil.contar("llamadas_llm")
+                lineas = LineasIncrementales()
+                with perfil.etapa("llm"):
+                    respuesta = await backend.generar_async(current_model, full_prompt, MAX_OUTPUT_TOKENS, TEMPERATURE)
+                    fragmentos = aiter(respuesta)
+                    try:
+                        async for fragmento in fragmentos:
+                            lineas.alimentar(fragmento.text)
+                            if lineas.error:
+                                perfil.contar("respuestas_cortadas")
+                                break
+                        else:
+                            lineas.terminar()
+                    finally:
+                        # Cortada, fallida o cancelada: no dejar el stream abierto
+                        await backend.cerrar_stream(respuesta, fragmentos)
+                valida = not lineas.error
+            finally:
+                planificador.liberar(turno, exito=valida is not None, valida=valida)
             
-            return csv_respuesta
+            rate_limiter.registrar_exito()
+            breakers[current_model].registrar_exito()
+            _registrar_uso(respuesta, current_model, inicio, attempt, archivo, tokens_prompt)
             
-        except Exception as e:
-            logger.warning(f"Intento {attempt + 1} falló: {e}")
+            logger.debug(f"Respuesta en streaming: {len(lineas.lineas)} líneas")
             
-            # Si hay error de sobrecarga y tenemos modelo fallback
-            if ("503" in str(e) or "unavailable" in str(e).lower()) and FALLBACK_MODEL and current_model != FALLBACK_MODEL:
-                logger.info(f"Cambiando a modelo fallback: {FALLBACK_MODEL}")
-                current_model = FALLBACK_MODEL
+            return lineas, current_model
             
-            # Registrar fallo en métricas
-            log_llm_usage(current_model, 0, 0, 0, False)
+        except Exception as e:
+            if _es_sobrecarga(e):
+                modelo_sobrecargado = current_model
             
-            if attempt < LLM_RETRIES - 1:
-                # Backoff exponencial con jitter
-                delay = min(BACKOFF_BASE * (2 ** attempt), BACKOFF_MAX)
-                jitter = random.uniform(0, BACKOFF_JITTER)
-                sleep_time = delay + jitter
-                
-                logger.info(f"Esperando {sleep_time:.1f}s antes del siguiente intento...")
-                time.sleep(sleep_time)
-            else:
-                logger.error(f"Todos los intentos fallaron para estructurar texto")
-                return "error"
+            espera = _tratar_fallo(e, attempt, current_model, inicio, archivo, tokens_prompt)
+            if espera is None:
+                return None
+            if espera:
+                with perfil.etapa("backoff"):
+                    await asyncio.sleep(espera)
     
-    return "error"
+    return None
 
-def csv_a_dataframe(csv):
-    """Convierte el texto CSV en un DataFrame de pandas, asegurando que 'importe' sea numérico."""
+def _respuesta_previa(texto, archivo=None, modo="individual"):
+    """CSV de una plantilla local o de la caché, o None si hay que llamar al LLM.
+
+    Devuelve (CSV o None, texto recortado para el LLM, tokens estimados del
+    texto original). La caché se consulta con el texto recortado, que es lo
+    que de verdad se envía, y sólo acepta respuestas de los modelos
+    configurados en el mismo modo de solicitud.
+    """
+    
+    # Vía rápida: formatos conocidos se estructuran sin LLM
+    if usar_plantillas:
+        with perfil.etapa("plantillas"):
+            csv_plantilla = extraer_con_plantillas(texto)
+        if csv_plantilla is not None:
+            logger.debug("Texto estructurado con plantilla local")
+            log_llm_usage(MODEL_NAME, 0, 0, 0, True, latencia=0.0, archivo=archivo, cache="plantilla")
+            return csv_plantilla, None, None
+    
+    with perfil.etapa("construccion_prompt"):
+        texto_llm, tokens_original = constructor.recortar(texto)
+    
+    if llm_cache is not None:
+        with perfil.etapa("cache_llm"):
+            en_cache = llm_cache.obtener(texto_llm, MODELOS, modo)
+        if en_cache is not None:
+            csv_cache, modelo_cache = en_cache
+            logger.debug(f"Respuesta de {modelo_cache} obtenida de la caché")
+            log_llm_usage(modelo_cache, 0, 0, 0, True, latencia=0.0, archivo=archivo, cache="hit")
+            return csv_cache, texto_llm, tokens_original
+    
+    return None, texto_llm, tokens_original
+
+def estructurar_texto(texto, archivo=None):
+    """Envía el texto a Gemini con reintentos y fallback"""
+    
+    csv_previo, texto_llm, tokens_original = _respuesta_previa(texto, archivo)
+    if csv_previo is not None:
+        return csv_previo
+    
+    return _estructurar_individual(texto_llm, archivo, tokens_original)
+
+def _estructurar_individual(texto, archivo=None, tokens_original=None):
+    """Consulta a Gemini por un único texto (ya recortado) y guarda la respuesta en la caché"""
+    
+    full_prompt, tokens_prompt = constructor.individual(texto, tokens_original)
+    
+    generado = _generar(full_prompt, archivo, tokens_prompt)
+    if generado is None:
+        return "error"
+    
+    respuesta, modelo = generado
+    csv_respuesta = respuesta.text.strip()
+    
+    if llm_cache is not None and csv_respuesta.lower() != "error":
+        llm_cache.guardar(texto, csv_respuesta, modelo)
+    
+    return csv_respuesta
+
+async def estructurar_texto_async(texto, archivo=None):
+    """Versión asyncio de estructurar_texto: mismas plantillas, caché y reintentos.
+
+    Devuelve el CSV (con cabecera) o "error". Mientras espera a Gemini no
+    ocupa ningún hilo, así un solo proceso puede tener miles de facturas
+    en vuelo.
+    """
+    
+    csv_previo, texto_llm, tokens_original = _respuesta_previa(texto, archivo)
+    if csv_previo is not None:
+        return csv_previo
+    
+    full_prompt, tokens_prompt = constructor.individual(texto_llm, tokens_original)
+    generado = await _generar_async(full_prompt, archivo, tokens_prompt)
+    if generado is None:
+        return "error"
+    
+    lineas, modelo = generado
+    csv_respuesta = lineas.csv()
+    
+    if llm_cache is not None and csv_respuesta != "error":
+        llm_cache.guardar(texto_llm, csv_respuesta, modelo)
+    
+    return csv_respuesta
+
+async def estructurar_textos_async(textos, archivos=None, concurrencia=None):
+    """Estructura varios textos a la vez con estructurar_texto_async.
+
+    Como mucho `concurrencia` solicitudes en vuelo (LLM_ASYNC_CONCURRENCIA
+    por defecto). Devuelve una lista alineada con textos con el CSV de cada
+    uno, "error" o la excepción que lo impidió.
+    """
+    archivos = list(archivos) if archivos else [None] * len(textos)
+    cupo = asyncio.Semaphore(concurrencia or LLM_ASYNC_CONCURRENCIA)
+    
+    async def uno(texto, archivo):
+        async with cupo:
+            return await estructurar_texto_async(texto, archivo)
+    
+    return await asyncio.gather(
+        *(uno(texto, archivo) for texto, archivo in zip(textos, archivos)),
+        return_exceptions=True,
+    )
+
+def planificar_lotes(textos):
+    """Agrupa los índices de textos en lotes que caben en el presupuesto de tokens.
+
+    El límite de salida se mide contra MAX_OUTPUT_TOKENS usando la estimación
+    actual de tokens por fila, que se ajusta con el uso real de cada lote.
+    """
+    lotes = []
+    actual = []
+    tokens_entrada = 0
+    
+    for i, texto in enumerate(textos):
+        tokens_texto = constructor.tokens_texto(texto)
+        tokens_salida = (len(actual) + 1) * _tokens_por_fila
+        
+        if actual and (
+            len(actual) >= LLM_BATCH_SIZE
+            or tokens_salida > MAX_OUTPUT_TOKENS
+            or tokens_entrada + tokens_texto > LLM_BATCH_MAX_INPUT_TOKENS
+        ):
+            lotes.append(actual)
+            actual = []
+            tokens_entrada = 0
+        
+        actual.append(i)
+        tokens_entrada += tokens_texto
     
+    if actual:
+        lotes.append(actual)
+    
+    return lotes
+
+def _actualizar_tokens_por_fila(usage, filas):
+    """Media móvil de tokens de salida por fila observada en los lotes"""
+    global _tokens_por_fila
     try:
-        # Definir los tipos de datos para cada columna
-        dtype_cols = {
-            "fecha_factura": str,
-            "proveedor": str,
-            "concepto": str,
-            "importe": str,  # Se leerá primero como str para poder limpiar comas
-            "moneda": str,
-        }
-
-        # Leer el CSV en un DataFrame con los tipos especificados
-        df_temp = pd.read_csv(StringIO(csv), delimiter=";", dtype=dtype_cols)
-
-        # Convertir 'importe' a float, asegurando que los valores con coma se conviertan correctamente
-        df_temp["importe"] = pd.to_numeric(
-            df_temp["importe"].str.replace(",", "."), errors="coerce"
-        )
+        observado = usage.candidates_token_count / max(filas, 1)
+    except AttributeError:
+        return
+    with _batch_lock:
+        _tokens_por_fila = 0.7 * _tokens_por_fila + 0.3 * observado
+
+def _separar_respuesta_lote(csv_lote, ids):
+    """Reparte las filas del CSV de un lote por id de documento.
+
+    Devuelve {id: csv} o None si la respuesta no cuadra con los documentos
+    enviados (ids ausentes, desconocidos o filas mal formadas).
+    """
+    filas = {id_doc: [] for id_doc in ids}
+    
+    for linea in csv_lote.strip().splitlines():
+        linea = linea.strip()
+        if not linea or linea.startswith("id_documento"):
+            continue
         
-        logger.debug(f"DataFrame creado con {len(df_temp)} filas")
-        return df_temp
+        id_doc, _, resto = linea.partition(";")
+        id_doc = id_doc.strip()
+        if id_doc not in filas:
+            return None
         
-    except Exception as e:
-        logger.error(f"Error convirtiendo CSV a DataFrame: {e}")
-        raise
+        if resto.strip().lower() == "error":
+            filas[id_doc].append("error")
+        elif resto.count(";") == 4:
+            filas[id_doc].append(resto)
+        else:
+            return None
+    
+    if any(not lineas for lineas in filas.values()):
+        return None
+    
+    return {
+        id_doc: "error" if "error" in lineas else CABECERA_CSV + "\n" + "\n".join(lineas)
+        for id_doc, lineas in filas.items()
+    }
+
+def _estructurar_lote_llm(textos, archivos, tokens_originales):
+    """Envía varios textos (ya recortados) en una sola llamada; divide el lote si la respuesta no cuadra.
+
+    Si la llamada falla tras todos los reintentos (cuota, 503, circuito
+    abierto) no se divide: cada mitad volvería a chocar con el mismo fallo.
+    """
+    
+    if len(textos) == 1:
+        return [_estructurar_individual(textos[0], archivos[0], tokens_originales[0])]
+    
+    full_prompt, ids, tokens_prompt = constructor.lote(textos, tokens_originales)
+    
+    generado = _generar(full_prompt, "|".join(filter(None, archivos)) or None, tokens_prompt)
+    if generado is None:
+        return ["error"] * len(textos)
+    
+    respuesta, modelo = generado
+    por_id = _separar_respuesta_lote(respuesta.text, ids)
+    if por_id is None:
+        mitad = len(textos) // 2
+        logger.info(f"Respuesta de lote no coincide con {len(textos)} documentos, dividiendo")
+        return (_estructurar_lote_llm(textos[:mitad], archivos[:mitad], tokens_originales[:mitad])
+                + _estructurar_lote_llm(textos[mitad:], archivos[mitad:], tokens_originales[mitad:]))
+    
+    _actualizar_tokens_por_fila(respuesta.usage_metadata, len(textos))
+    
+    resultados = [por_id[id_doc] for id_doc in ids]
+    if llm_cache is not None:
+        for texto, csv_respuesta in zip(textos, resultados):
+            if csv_respuesta != "error":
+                llm_cache.guardar(texto, csv_respuesta, modelo, "lote")
+    
+    return resultados
+
+def estructurar_lote(textos, archivos=None):
+    """Estructura varios textos empaquetándolos en una sola solicitud a Gemini.
+
+    Devuelve una lista alineada con textos con el CSV de cada uno (con la
+    cabecera habitual) o "error", igual que estructurar_texto.
+    """
+    archivos = list(archivos) if archivos else [None] * len(textos)
+    resultados = [None] * len(textos)
+    pendientes = []
+    textos_llm = {}
+    
+    for i, texto in enumerate(textos):
+        csv_previo, texto_llm, tokens_original = _respuesta_previa(texto, archivos[i], "lote")
+        
+        if csv_previo is not None:
+            resultados[i] = csv_previo
+        else:
+            pendientes.append(i)
+            textos_llm[i] = (texto_llm, tokens_original)
+    
+    if pendientes:
+        respuestas = _estructurar_lote_llm(
+            [textos_llm[i][0] for i in pendientes],
+            [archivos[i] for i in pendientes],
+            [textos_llm[i][1] for i in pendientes],
+        )
+        for i, csv_respuesta in zip(pendientes, respuestas):
+            resultados[i] = csv_respuesta
+    
+    return resultados
+
+def csv_a_dataframe(csv):
+    """Convierte el texto CSV en un DataFrame de pandas con fecha, importe y moneda ya validados.
+
+    Las filas que no pasan la validación se descartan con un aviso; el ETL
+    las guarda en la tabla cuarentena (ver pipeline.parsear_en_bloques).
+    """
+    with perfil.etapa("csv_a_dataframe"):
+        lineas = lineas_csv(csv)
+        df_temp, descartadas = parsear_lineas(lineas, [None] * len(lineas))
+
+    for _, linea, motivo in descartadas:
+        logger.warning(f"Fila descartada ({motivo}): {linea}")
+
+    logger.debug(f"DataFrame creado con {len(df_temp)} filas")
+    return df_temp.drop(columns="archivo")
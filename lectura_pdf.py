@@ -0,0 +1,88 @@
+import os
+from dotenv import load_dotenv
+import ocr
+from construccion_prompt import PATRON_RELEVANTE, PATRON_TOTAL
+
+load_dotenv(".env")
+
+# Extracción de PDF (0 = sin límite)
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "0"))
+PDF_MAX_CHARS = int(os.getenv("PDF_MAX_CHARS", "0"))
+PDF_PARAR_EN_TOTAL = os.getenv("PDF_PARAR_EN_TOTAL", "false").lower() == "true"
+PDF_MODO = os.getenv("PDF_MODO", "texto")  # texto | bloques
+
+# Líneas del principio y del final de cada página que se tratan como cabecera/pie
+LINEAS_CABECERA_PIE = 3
+
+
+def _texto_pagina(page, modo, primera):
+    """Texto de una página; en modo 'bloques' sólo las regiones relevantes"""
+    if modo != "bloques":
+        return page.get_text("text")
+
+    alto = page.rect.height
+    bloques = []
+    for x0, y0, x1, y1, texto, *_ in page.get_text("blocks", sort=True):
+        # El emisor suele estar arriba de la primera página
+        if (primera and y0 < alto * 0.25) or PATRON_RELEVANTE.search(texto):
+            bloques.append(texto.strip())
+    return "\n".join(bloques)
+
+
+
+def iterar_paginas(doc, max_pages=0, parar_en_total=False, modo="texto"):
+    """Genera el texto de cada página quitando cabeceras y pies repetidos.
+
+    Una línea que ya apareció en la cabecera o el pie de una página anterior
+    se elimina de las siguientes. Con parar_en_total se detiene tras la
+    primera página que contiene la sección de totales.
+    """
+    vistas = set()
+
+    for numero, page in enumerate(doc):
+        if max_pages and numero >= max_pages:
+            break
+
+        texto = _texto_pagina(page, modo, numero == 0)
+        lineas = texto.splitlines()
+        bordes = lineas[:LINEAS_CABECERA_PIE] + lineas[-LINEAS_CABECERA_PIE:]
+
+        if numero > 0:
+            filtradas = [linea for linea in lineas if linea.strip() not in vistas]
+            if len(filtradas) != len(lineas):
+                texto = "\n".join(filtradas)
+        vistas.update(linea.strip() for linea in bordes if linea.strip())
+
+        yield texto
+
+        if parar_en_total and PATRON_TOTAL.search(texto):
+            break
+
+
+
+def extraer_texto_documento(doc, max_pages=None, max_chars=None, parar_en_total=None, modo=None):
+    """Extrae el texto de un documento fitz ya abierto; devuelve (texto, páginas leídas).
+
+    Las páginas escaneadas (casi sin texto y con imágenes) quedan como una
+    marca que ocr.completar() sustituye por su texto reconocido.
+    """
+    max_pages = PDF_MAX_PAGES if max_pages is None else max_pages
+    max_chars = PDF_MAX_CHARS if max_chars is None else max_chars
+    parar_en_total = PDF_PARAR_EN_TOTAL if parar_en_total is None else parar_en_total
+    modo = PDF_MODO if modo is None else modo
+
+    paginas = []
+    caracteres = 0
+
+    for numero, texto_pagina in enumerate(iterar_paginas(doc, max_pages, parar_en_total, modo)):
+        if ocr.OCR_ACTIVO and ocr.pagina_escaneada(doc[numero], texto_pagina):
+            texto_pagina = ocr.marca(numero)
+        paginas.append(texto_pagina)
+        caracteres += len(texto_pagina) + 1
+        if max_chars and caracteres >= max_chars:
+            break
+
+    text = "\n".join(paginas)
+    if max_chars:
+        text = text[:max_chars]
+    return text, len(paginas)
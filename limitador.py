@@ -0,0 +1,178 @@
+import asyncio
+import threading
+import time
+
+
+class RateLimiter:
+    """Limitador compartido de solicitudes y tokens por minuto (token bucket).
+
+    Es adaptativo: cada 429 reduce el ritmo efectivo y pausa a todos los
+    hilos a la vez; los éxitos lo recuperan poco a poco hasta el límite
+    configurado.
+    """
+
+    def __init__(self, rpm=0, tpm=0, factor_minimo=0.1, pausa_base=1.0, pausa_maxima=30.0):
+        # Un límite de 0 desactiva el control de esa cuota
+        self.rpm = rpm
+        self.tpm = tpm
+        self.factor_minimo = factor_minimo
+        self.pausa_base = pausa_base
+        self.pausa_maxima = pausa_maxima
+        self.factor = 1.0
+        self.throttles = 0
+        self._throttles_seguidos = 0
+        self._pausa_hasta = 0.0
+        self._solicitudes = float(rpm)
+        self._tokens = float(tpm)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _recargar(self):
+        """Recarga los cubos en proporción al tiempo transcurrido y al factor actual"""
+        ahora = time.monotonic()
+        transcurrido = ahora - self._ultimo
+        self._ultimo = ahora
+
+        if self.rpm:
+            self._solicitudes = min(
+                self.rpm, self._solicitudes + transcurrido * self.rpm * self.factor / 60.0
+            )
+        if self.tpm:
+            self._tokens = min(
+                self.tpm, self._tokens + transcurrido * self.tpm * self.factor / 60.0
+            )
+
+    def _reservar(self, tokens):
+        """Descuenta la cuota si la hay; si no, devuelve los segundos a esperar"""
+        # Una solicitud mayor que el TPM completo nunca cabría en el cubo
+        if self.tpm:
+            tokens = min(tokens, self.tpm)
+
+        with self._lock:
+            espera = self._pausa_hasta - time.monotonic()
+            if espera > 0:
+                return espera
+
+            if not self.rpm and not self.tpm:
+                return 0.0
+
+            self._recargar()
+
+            falta_solicitud = 1 - self._solicitudes if self.rpm else 0
+            falta_tokens = tokens - self._tokens if self.tpm else 0
+
+            if falta_solicitud <= 0 and falta_tokens <= 0:
+                if self.rpm:
+                    self._solicitudes -= 1
+                if self.tpm:
+                    self._tokens -= tokens
+                return 0.0
+
+            espera = 0.0
+            if falta_solicitud > 0:
+                espera = max(espera, falta_solicitud * 60.0 / (self.rpm * self.factor))
+            if falta_tokens > 0:
+                espera = max(espera, falta_tokens * 60.0 / (self.tpm * self.factor))
+            return espera
+
+    def adquirir(self, tokens=0):
+        """Bloquea hasta que haya cuota para una solicitud con los tokens estimados"""
+        while True:
+            espera = self._reservar(tokens)
+            if espera <= 0:
+                return
+            time.sleep(espera)
+
+    async def adquirir_async(self, tokens=0):
+        """Igual que adquirir() pero cede el event loop mientras espera"""
+        while True:
+            espera = self._reservar(tokens)
+            if espera <= 0:
+                return
+            await asyncio.sleep(espera)
+
+    def registrar_throttle(self):
+        """Un 429: reduce el ritmo a la mitad y pausa a todos los hilos"""
+        with self._lock:
+            self.throttles += 1
+            self._throttles_seguidos += 1
+            self.factor = max(self.factor_minimo, self.factor / 2)
+
+            pausa = min(self.pausa_base * 2 ** (self._throttles_seguidos - 1), self.pausa_maxima)
+            self._pausa_hasta = max(self._pausa_hasta, time.monotonic() + pausa)
+
+            # Vaciar los cubos para no soltar una ráfaga al terminar la pausa
+            self._recargar()
+            self._solicitudes = min(self._solicitudes, 0.0)
+            self._tokens = min(self._tokens, 0.0)
+            return pausa
+
+    def registrar_exito(self):
+        """Una llamada correcta: recupera el ritmo de forma gradual"""
+        with self._lock:
+            self._throttles_seguidos = 0
+            self.factor = min(1.0, self.factor + 0.05)
+
+
+class CircuitBreaker:
+    """Corta el tráfico a un modelo tras varios fallos seguidos y lo vuelve a probar más tarde.
+
+    Estados: 'cerrado' (sano), 'abierto' (no recibe tráfico) y 'semiabierto'
+    (deja pasar una única solicitud de prueba).
+    """
+
+    def __init__(self, modelo, fallos_para_abrir=3, apertura=30.0, apertura_maxima=300.0):
+        self.modelo = modelo
+        self.fallos_para_abrir = fallos_para_abrir
+        self.apertura_base = apertura
+        self.apertura_maxima = apertura_maxima
+        self.estado = "cerrado"
+        self._apertura = apertura
+        self._fallos = 0
+        self._reabrir_en = 0.0
+        self._sonda_en_curso = False
+        self._sonda_desde = 0.0
+        self._lock = threading.Lock()
+
+    def permite(self):
+        """Indica si se puede enviar una solicitud a este modelo ahora"""
+        with self._lock:
+            if self.estado == "cerrado":
+                return True
+
+            if self.estado == "abierto" and time.monotonic() >= self._reabrir_en:
+                self.estado = "semiabierto"
+                self._sonda_en_curso = False
+
+            # Si la sonda anterior nunca informó, se permite otra pasado el plazo
+            ahora = time.monotonic()
+            sonda_vencida = ahora - self._sonda_desde >= self._apertura
+            if self.estado == "semiabierto" and (not self._sonda_en_curso or sonda_vencida):
+                self._sonda_en_curso = True
+                self._sonda_desde = ahora
+                return True
+
+            return False
+
+    def registrar_exito(self):
+        with self._lock:
+            self.estado = "cerrado"
+            self._fallos = 0
+            self._apertura = self.apertura_base
+            self._sonda_en_curso = False
+
+    def registrar_fallo(self):
+        """Devuelve True si este fallo ha abierto el circuito"""
+        with self._lock:
+            self._fallos += 1
+
+            if self.estado == "semiabierto":
+                # La sonda falló: volver a abrir con más tiempo de espera
+                self._apertura = min(self._apertura * 2, self.apertura_maxima)
+            elif self._fallos < self.fallos_para_abrir or self.estado == "abierto":
+                return False
+
+            self.estado = "abierto"
+            self._reabrir_en = time.monotonic() + self._apertura
+            self._sonda_en_curso = False
+            return True
@@ -0,0 +1,230 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+import google.generativeai as genai
+from plantillas import CABECERA_CSV, detectar_moneda, normalizar_fecha, normalizar_importe, normalizar_proveedor
+
+
+class RegistroClientes:
+    """Un cliente por (modelo, max_output_tokens, temperature), creado una vez y compartido.
+
+    obtener() es una búsqueda en un diccionario salvo la primera vez que
+    aparece una combinación; los hilos que llegan a la vez esperan al mismo
+    cliente en lugar de construir uno cada uno. Primario y fallback quedan
+    creados al arrancar con precalentar(), así cambiar de modelo no
+    reconstruye nada.
+    """
+
+    def __init__(self, fabrica):
+        self._fabrica = fabrica
+        self._clientes = {}
+        self._lock = threading.Lock()
+        self.creados = 0
+
+    def obtener(self, modelo, max_output_tokens, temperature):
+        clave = (modelo, max_output_tokens, temperature)
+        cliente = self._clientes.get(clave)
+        if cliente is None:
+            with self._lock:
+                cliente = self._clientes.get(clave)
+                if cliente is None:
+                    cliente = self._fabrica(modelo, max_output_tokens, temperature)
+                    self._clientes[clave] = cliente
+                    self.creados += 1
+        return cliente
+
+    def precalentar(self, modelos, max_output_tokens, temperature):
+        for modelo in modelos:
+            self.obtener(modelo, max_output_tokens, temperature)
+
+
+def crear_cliente_gemini(modelo, max_output_tokens, temperature):
+    return genai.GenerativeModel(
+        modelo,
+        generation_config=genai.types.GenerationConfig(
+            max_output_tokens=max_output_tokens,
+            temperature=temperature
+        )
+    )
+
+
+class BackendGemini:
+    """Backend real: llama a la API de Gemini.
+
+    Los GenerativeModel salen del registro de clientes; todos comparten el
+    cliente HTTP/gRPC por defecto de google-generativeai, que mantiene las
+    conexiones abiertas entre llamadas.
+    """
+
+    nombre = "gemini"
+
+    def __init__(self, api_key=None):
+        genai.configure(api_key=api_key)
+        self.clientes = RegistroClientes(crear_cliente_gemini)
+
+    def precalentar(self, modelos, max_output_tokens, temperature):
+        self.clientes.precalentar(modelos, max_output_tokens, temperature)
+
+    def generar(self, modelo, full_prompt, max_output_tokens, temperature):
+        cliente = self.clientes.obtener(modelo, max_output_tokens, temperature)
+        return cliente.generate_content(full_prompt)
+
+    async def generar_async(self, modelo, full_prompt, max_output_tokens, temperature):
+        """Solicitud en streaming: la respuesta se recorre con async for por fragmentos"""
+        cliente = self.clientes.obtener(modelo, max_output_tokens, temperature)
+        return await cliente.generate_content_async(full_prompt, stream=True)
+
+    async def cerrar_stream(self, respuesta, fragmentos):
+        """Deja de leer una respuesta en streaming: cierra el iterador de fragmentos
+        y el flujo gRPC de debajo, que si no seguiría abierto hasta que lo recoja el GC"""
+        await fragmentos.aclose()
+        flujo = getattr(respuesta, "_iterator", None)
+        if hasattr(flujo, "aclose"):
+            await flujo.aclose()
+
+
+PATRON_DOCUMENTO = re.compile(r"<<<DOCUMENTO (\d+)>>>\n(.*?)\n<<<FIN DOCUMENTO \1>>>", re.DOTALL)
+PATRON_FECHA = re.compile(r"\b(\d{1,2}[/-]\d{1,2}[/-]\d{4}|\d{4}-\d{2}-\d{2})\b")
+PATRON_EMPRESA = re.compile(r"^\s*(?:Empresa|Raz[oó]n social|Proveedor|Emisor):\s*(.+)$", re.MULTILINE | re.IGNORECASE)
+PATRON_CONCEPTO = re.compile(r"^\s*(?:Descripci[oó]n|Concepto|Servicio):\s*(.+)$", re.MULTILINE | re.IGNORECASE)
+PATRON_TOTAL = re.compile(r"^.*total.*$", re.MULTILINE | re.IGNORECASE)
+PATRON_IMPORTE = re.compile(r"\d[\d.,]*")
+
+
+def _fila_simulada(texto):
+    """Extrae una fila CSV plausible de un texto de factura con heurísticas simples"""
+    fecha = PATRON_FECHA.search(texto)
+    empresa = PATRON_EMPRESA.search(texto)
+    concepto = PATRON_CONCEPTO.search(texto)
+
+    # La última línea con "total" y una cifra suele ser el total a pagar
+    totales = [linea for linea in PATRON_TOTAL.findall(texto) if PATRON_IMPORTE.search(linea)]
+
+    if not (fecha and empresa and totales):
+        return None
+
+    linea_total = totales[-1]
+    return ";".join([
+        normalizar_fecha(fecha.group(1)) or fecha.group(1),
+        normalizar_proveedor(empresa.group(1)),
+        (concepto.group(1).strip() if concepto else "servicio").replace(";", ","),
+        normalizar_importe(PATRON_IMPORTE.findall(linea_total)[-1]) or "0,00",
+        detectar_moneda(linea_total + "\n" + texto),
+    ])
+
+
+class BackendMock:
+    """Backend local para pruebas y benchmarks sin red.
+
+    Devuelve CSV realista a partir del texto de la factura y simula latencia,
+    errores 503/429 y uso de tokens. Es seguro usarlo desde varios hilos.
+    """
+
+    nombre = "mock"
+
+    def __init__(self, latencia=0.5, jitter=0.2, tasa_503=0.0, tasa_429=0.0, semilla=None):
+        self.latencia = latencia
+        self.jitter = jitter
+        self.tasa_503 = tasa_503
+        self.tasa_429 = tasa_429
+        self._random = random.Random(semilla)
+        self._lock = threading.Lock()
+        self.llamadas = 0
+        self.errores = {"503": 0, "429": 0}
+
+    def _sortear(self):
+        with self._lock:
+            self.llamadas += 1
+            espera = max(0.0, self.latencia + self._random.uniform(-self.jitter, self.jitter))
+            azar = self._random.random()
+            error = None
+            if azar < self.tasa_503:
+                error = "503"
+            elif azar < self.tasa_503 + self.tasa_429:
+                error = "429"
+            if error:
+                self.errores[error] += 1
+        return espera, error
+
+    def precalentar(self, modelos, max_output_tokens, temperature):
+        pass
+
+    def _responder(self, full_prompt, max_output_tokens, error):
+        """Texto de la respuesta simulada y su uso de tokens, o la excepción sorteada"""
+        if error == "503":
+            raise RuntimeError("503 The model is overloaded. Please try again later. (unavailable)")
+        if error == "429":
+            raise RuntimeError("429 Resource has been exhausted (e.g. check quota).")
+
+        documentos = PATRON_DOCUMENTO.findall(full_prompt)
+        if documentos:
+            lineas = ["id_documento;" + CABECERA_CSV]
+            for id_doc, texto in documentos:
+                lineas.append(f"{id_doc};{_fila_simulada(texto) or 'error'}")
+            texto_respuesta = "\n".join(lineas)
+        else:
+            texto = full_prompt.split("Este es el texto a parsear:\n", 1)[-1]
+            fila = _fila_simulada(texto)
+            texto_respuesta = f"{CABECERA_CSV}\n{fila}" if fila else "error"
+
+        prompt_tokens = len(full_prompt) // 4 + 1
+        completion_tokens = min(len(texto_respuesta) // 4 + 1, max_output_tokens)
+        return texto_respuesta, SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=completion_tokens,
+            total_token_count=prompt_tokens + completion_tokens,
+        )
+
+    def generar(self, modelo, full_prompt, max_output_tokens, temperature):
+        espera, error = self._sortear()
+        time.sleep(espera)
+
+        texto_respuesta, usage = self._responder(full_prompt, max_output_tokens, error)
+        return SimpleNamespace(text=texto_respuesta, usage_metadata=usage)
+
+    async def generar_async(self, modelo, full_prompt, max_output_tokens, temperature):
+        """Como generar() pero en streaming: la mitad de la latencia hasta el primer fragmento"""
+        espera, error = self._sortear()
+        await asyncio.sleep(espera / 2)
+
+        texto_respuesta, usage = self._responder(full_prompt, max_output_tokens, error)
+        return RespuestaStreamMock(texto_respuesta, usage, espera / 2)
+
+    async def cerrar_stream(self, respuesta, fragmentos):
+        await fragmentos.aclose()
+
+
+class RespuestaStreamMock:
+    """Respuesta en streaming del mock con la forma de la del SDK.
+
+    Se recorre con async for; cada fragmento tiene .text y llega repartido
+    en `duracion` segundos. usage_metadata está disponible desde el inicio.
+    """
+
+    TAMAÑO_FRAGMENTO = 24
+
+    def __init__(self, texto, usage_metadata, duracion):
+        self.text = texto
+        self.usage_metadata = usage_metadata
+        self.duracion = duracion
+
+    async def __aiter__(self):
+        fragmentos = [
+            self.text[inicio:inicio + self.TAMAÑO_FRAGMENTO]
+            for inicio in range(0, len(self.text), self.TAMAÑO_FRAGMENTO)
+        ]
+        for fragmento in fragmentos:
+            await asyncio.sleep(self.duracion / len(fragmentos))
+            yield SimpleNamespace(text=fragmento)
+
+
+def crear_backend(nombre, api_key=None, **opciones_mock):
+    """Crea el backend indicado en LLM_BACKEND ('gemini' o 'mock')"""
+    if nombre == "mock":
+        return BackendMock(**opciones_mock)
+    if nombre == "gemini":
+        return BackendGemini(api_key)
+    raise ValueError(f"Backend LLM desconocido: {nombre}")
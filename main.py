@@ -1,158 +1,481 @@
 import funciones
-import pandas as pd
+import concurrencia
+import pipeline
+import plantillas
+import ocr
+from manifiesto import Manifiesto
+from duplicados import Deduplicador, imprimir_grupos
+from trabajos import RegistroTrabajos
+from descubrimiento import DESCUBRIMIENTO_PROFUNDIDAD, Descubrimiento
+from vigilancia import Vigilante
+from extraccion import PoolExtraccion
+from almacen import Cuarentena, crear_engine
+from monedas import crear_conversor
+from perfilado import perfil
+from planificador import priorizar
+from collections import Counter
 import os
 import argparse
-from sqlalchemy import create_engine
-from dotenv import load_dotenv
+import cProfile
+import signal
+import time
 
-# Cargar variables de entorno
-load_dotenv(".env")
+EMOJI_MONEDA = {"dolares": "💵", "euros": "💶"}
 
-# Obtener tasas de conversión desde .env
-FALLBACK_RATE_USD_COP = float(os.getenv("FALLBACK_RATE_USD_COP", "4500"))
-FALLBACK_RATE_EUR_COP = float(os.getenv("FALLBACK_RATE_EUR_COP", "4900"))
-
-def procesar_facturas_directas(carpeta_facturas):
-    """Procesa PDFs que están directamente en la carpeta facturas"""
-    facturas_procesadas = []
-    
-    for archivo in os.listdir(carpeta_facturas):
-        if not archivo.lower().endswith('.pdf'):
-            continue
-            
-        ruta_pdf = os.path.join(carpeta_facturas, archivo)
-        
-        if not os.path.isfile(ruta_pdf):
-            continue
-            
+def anunciar(rutas_pdf):
+    """Muestra cada PDF a medida que el descubrimiento lo encuentra"""
+    for ruta_pdf in rutas_pdf:
         print(f"📄 Procesando factura: {ruta_pdf}")
-        facturas_procesadas.append(ruta_pdf)
-    
-    return facturas_procesadas
+        yield ruta_pdf
 
-def procesar_facturas_subcarpetas(carpeta_facturas):
-    """Procesa PDFs que están en subcarpetas dentro de facturas"""
-    facturas_procesadas = []
-    
-    for carpeta in sorted(os.listdir(carpeta_facturas)):
-        ruta_carpeta = os.path.join(carpeta_facturas, carpeta)
-        
-        if not os.path.isdir(ruta_carpeta):
-            continue
-
-        # Recorrer todos los archivos dentro de la carpeta
-        for archivo in os.listdir(ruta_carpeta):
-            if not archivo.lower().endswith('.pdf'):
-                continue
-                
-            ruta_pdf = os.path.join(ruta_carpeta, archivo)
-
-            print(f"📄 Procesando factura: {ruta_pdf}")
-            facturas_procesadas.append(ruta_pdf)
-    
-    return facturas_procesadas
+def estructurar(rutas_pdf, args, registro, pool_pdf=None, duplicados=None, stats=None):
+    """Extrae y estructura las facturas en serie, por lotes, con pools concurrentes o con asyncio"""
+    # Reparto por PLANIFICADOR_PRIORIDAD (por defecto los PDFs más recientes primero)
+    rutas_pdf = priorizar(rutas_pdf, stats)
+    if args.batch:
+        respuestas = concurrencia.procesar_facturas_por_lotes(rutas_pdf, args.workers, registro, pool_pdf, duplicados)
+    elif args.asincrono:
+        respuestas = concurrencia.procesar_facturas_async(rutas_pdf, args.asincrono, registro, pool_pdf, duplicados)
+    elif args.workers > 1:
+        respuestas = concurrencia.procesar_facturas_concurrente(rutas_pdf, args.workers, registro, pool_pdf, duplicados)
+    else:
+        respuestas = concurrencia.procesar_facturas_serie(rutas_pdf, registro, duplicados)
+    return registro.seguir(respuestas)
+
+def crear_sinks(args, engine, manifiesto, registro):
+    """Destinos SQLite y/o Parquet según --output; None si falta pyarrow"""
+    sink = None
+    if args.output in ('sqlite', 'ambos'):
+        sink = pipeline.SinkSQLite(engine, reemplazar=args.overwrite, manifiesto=manifiesto,
+                                   registro=registro if args.output == 'sqlite' else None)
+
+    sink_parquet = None
+    if args.output in ('parquet', 'ambos'):
+        try:
+            from salida_parquet import SinkParquet
+        except ImportError:
+            print("❌ --output parquet necesita pyarrow: pip install pyarrow")
+            return None
+        # Con ambos destinos el manifiesto ya lo actualiza el sink SQLite; el registro
+        # de trabajos lo marca Parquet, que es el último en confirmar cada fila
+        sink_parquet = SinkParquet(
+            reemplazar=args.overwrite,
+            manifiesto=manifiesto if sink is None else None,
+            registro=registro,
+        )
+    return sink, sink_parquet
+
+def crear_deduplicador(args, engine):
+    """Deduplicador con --dedup (vacío si además se pasa --overwrite); si no, None"""
+    if not args.dedup:
+        return None
+    duplicados = Deduplicador(engine)
+    if args.overwrite:
+        duplicados.vaciar()
+    return duplicados
+
+def cerrar_deduplicacion(duplicados, manifiesto):
+    """Guarda las huellas y devuelve los duplicados omitidos desde la última llamada.
+
+    En modo incremental los duplicados quedan en el manifiesto, así no se
+    vuelven a extraer mientras no cambien.
+    """
+    if duplicados is None:
+        return []
+    duplicados.volcar()
+    omitidas, duplicados.duplicados = duplicados.duplicados, []
+    if manifiesto is not None and omitidas:
+        manifiesto.marcar_procesados([ruta for ruta, _, _ in omitidas])
+    return omitidas
+
+def guardar_bloque(df, conversor, sink, sink_parquet):
+    """Convierte a COP y escribe un bloque; devuelve (df, convertidas, sin tasa)"""
+    # Convertir monedas a pesos colombianos (COP)
+    df, convertidas, sin_convertir = pipeline.convertir_monedas(df, conversor)
+
+    # Columnas esenciales más el importe y la moneda originales y el PDF de origen
+    columnas = list(df.columns[0:4]) + ["importe_original", "moneda_original", "archivo"]
+
+    # Guardar en base de datos y/o Parquet (que conserva la moneda)
+    if sink is not None:
+        sink.escribir(df[columnas])
+    if sink_parquet is not None:
+        sink_parquet.escribir(df[columnas + ["moneda"]])
+    return df, convertidas, sin_convertir
 
 def main():
     # Configurar argumentos
     parser = argparse.ArgumentParser(description='Procesar facturas PDF a base de datos')
     parser.add_argument('--overwrite', action='store_true', 
                        help='Reemplazar tabla existente en lugar de anexar')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='Facturas procesadas en paralelo (1 = modo en serie)')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='No usar la caché de respuestas del LLM')
+    parser.add_argument('--refresh', action='store_true',
+                       help='Ignorar la caché existente y volver a consultar el LLM')
+    parser.add_argument('--batch', action='store_true',
+                       help='Empaquetar varias facturas en cada solicitud al LLM')
+    parser.add_argument('--async', dest='asincrono', type=int, nargs='?', default=0,
+                       const=funciones.LLM_ASYNC_CONCURRENCIA, metavar='N',
+                       help='Estructurar con asyncio y respuestas en streaming, hasta N solicitudes en vuelo')
+    parser.add_argument('--dedup', action='store_true',
+                       help='No enviar al LLM las facturas casi idénticas a otra ya procesada')
+    parser.add_argument('--no-templates', action='store_true',
+                       help='Enviar todas las facturas al LLM sin probar plantillas locales')
+    parser.add_argument('--incremental', action='store_true',
+                       help='Procesar sólo PDFs nuevos o modificados desde la última ejecución')
+    parser.add_argument('--resume', action='store_true',
+                       help='Continuar la última ejecución: omitir lo guardado y reintentar lo fallido')
+    parser.add_argument('--watch', action='store_true',
+                       help='Quedarse vigilando ./facturas y procesar cada PDF nuevo al llegar (Ctrl+C para salir)')
+    parser.add_argument('--max-depth', type=int, default=DESCUBRIMIENTO_PROFUNDIDAD,
+                       help='Niveles de carpetas a recorrer en ./facturas (1 = sólo la raíz, 0 = sin límite)')
+    parser.add_argument('--include', action='append', metavar='PATRON',
+                       help='Glob de archivos a procesar, relativo a ./facturas (repetible, por defecto *.pdf)')
+    parser.add_argument('--exclude', action='append', metavar='PATRON',
+                       help='Glob de archivos o carpetas a ignorar (repetible)')
+    parser.add_argument('--chunk-size', type=int, default=pipeline.CHUNK_SIZE,
+                       help='Filas acumuladas antes de cada escritura en la base de datos')
+    parser.add_argument('--output', choices=['sqlite', 'parquet', 'ambos'], default='sqlite',
+                       help='Destino: facturas.db, dataset Parquet particionado o ambos')
+    parser.add_argument('--profile', action='store_true',
+                       help='Medir cada etapa y mostrar el desglose de tiempos al terminar')
+    parser.add_argument('--profile-out', default='perfil_etl.json',
+                       help='Informe JSON de --profile (por defecto perfil_etl.json)')
+    parser.add_argument('--cprofile', metavar='RUTA',
+                       help='Volcar un perfil cProfile de toda la ejecución (pstats/snakeviz)')
     args = parser.parse_args()
 
+    if args.profile:
+        perfil.activar()
+
+    # Los sinks de métricas se abren aquí y no al importar funciones (workers, pruebas)
+    funciones.configurar_metricas()
+
+    perfilador = None
+    if args.cprofile:
+        perfilador = cProfile.Profile()
+        perfilador.enable()
+
+    try:
+        if args.watch:
+            vigilar(args)
+        else:
+            ejecutar(args)
+    finally:
+        ocr.cerrar()
+        if perfilador is not None:
+            perfilador.disable()
+            perfilador.dump_stats(args.cprofile)
+            print(f"🧪 Perfil cProfile guardado en {args.cprofile}")
+
+        if args.profile:
+            reporte = perfil.reporte()
+            perfil.imprimir(reporte)
+            perfil.guardar(reporte, args.profile_out)
+            print(f"   Informe guardado en {args.profile_out}")
+
+def _interrumpir(*_):
+    raise KeyboardInterrupt
+
+def vigilar(args):
+    """Servicio: procesa los PDFs que llegan a ./facturas en micro-lotes hasta Ctrl+C.
+
+    Engine, sinks, tasas, caché LLM, cliente del modelo y pool de extracción
+    se crean una vez y se reutilizan en todos los lotes. Cada factura se
+    confirma en facturas.db en cuanto está lista y queda en el manifiesto,
+    así al reiniciar sólo se procesa lo que llegó mientras estaba parado.
+    """
+    if not os.path.exists("./facturas"):
+        print("❌ Carpeta './facturas' no encontrada")
+        return
+
+    if args.resume:
+        print("❌ --watch ya retoma lo pendiente al arrancar; no se combina con --resume")
+        return
+
+    descubrimiento = Descubrimiento(
+        "./facturas",
+        profundidad=args.max_depth,
+        incluir=args.include,
+        excluir=args.exclude,
+    )
+    # Los avisos se activan antes del recorrido inicial para no perder nada entre medias
+    vigilante = Vigilante(descubrimiento)
+
+    engine = crear_engine("facturas.db")
+    manifiesto = Manifiesto(engine)
+    if args.overwrite:
+        manifiesto.vaciar()
+    pendientes = list(manifiesto.filtrar_pendientes(descubrimiento, descubrimiento.stats))
+    vigilante.conocer(descubrimiento.stats)
+
+    registro = RegistroTrabajos(engine)
+    duplicados = crear_deduplicador(args, engine)
+    funciones.usar_plantillas = not args.no_templates
+    if not args.no_cache:
+        funciones.configurar_cache(refrescar=args.refresh)
+
+    cuarentena = Cuarentena(engine)
+    sinks = crear_sinks(args, engine, manifiesto, registro)
+    if sinks is None:
+        return
+    sink, sink_parquet = sinks
+    conversor = crear_conversor(engine)
+    pool_pdf = PoolExtraccion() if args.workers > 1 or args.asincrono else None
+
+    signal.signal(signal.SIGTERM, _interrumpir)
+    print(f"👀 Vigilando ./facturas con {vigilante.modo} ({len(pendientes)} pendientes al arrancar). "
+          f"Ctrl+C para salir")
+
+    guardadas = 0
+    try:
+        for lote in vigilante.lotes(pendientes):
+            inicio = time.perf_counter()
+            rutas = registro.filtrar(anunciar(manifiesto.filtrar_pendientes(lote)))
+            respuestas = estructurar(rutas, args, registro, pool_pdf, duplicados)
+
+            # Bloques de una fila: cada factura se confirma en cuanto se estructura
+            filas = 0
+            for df in pipeline.parsear_en_bloques(respuestas, 1, cuarentena):
+                df, _, _ = guardar_bloque(df, conversor, sink, sink_parquet)
+                filas += len(df)
+            if sink_parquet is not None:
+                sink_parquet.cerrar()
+            registro.volcar()
+            omitidas = cerrar_deduplicacion(duplicados, manifiesto)
+
+            guardadas += filas
+            print(f"💾 {filas} filas de {len(lote)} facturas en {time.perf_counter() - inicio:.1f}s "
+                  f"({guardadas} desde el arranque)")
+            for ruta, original, parecido in omitidas:
+                print(f"🧬 {ruta} repite {original} ({parecido:.2f}), no se envió al LLM")
+    except KeyboardInterrupt:
+        print("🛑 Deteniendo la vigilancia...")
+    finally:
+        vigilante.detener()
+        if sink is not None:
+            sink.cerrar()
+        if sink_parquet is not None:
+            sink_parquet.cerrar()
+        if pool_pdf is not None:
+            pool_pdf.cerrar()
+        registro.cerrar()
+        if duplicados is not None:
+            duplicados.volcar()
+        funciones.metricas.volcar()
+        engine.dispose()
+
+    print(f"✅ {guardadas} filas guardadas mientras estuvo vigilando")
+    if funciones.metricas.descartados:
+        print(f"⚠️ {funciones.metricas.descartados} registros de métricas descartados con el buffer lleno")
+
+def ejecutar(args):
+    """Descubre, extrae, estructura y guarda las facturas según los argumentos"""
     # Verificar que existe la carpeta facturas
     if not os.path.exists("./facturas"):
         print("❌ Carpeta './facturas' no encontrada")
         return
 
-    # Crear un DataFrame vacío para almacenar todas las facturas
-    df = pd.DataFrame()
+    if args.resume and args.overwrite:
+        print("❌ --resume no se puede combinar con --overwrite")
+        return
 
     print("🔍 Buscando facturas...")
     
-    # Buscar PDFs directamente en ./facturas/
-    facturas_directas = procesar_facturas_directas("./facturas")
-    
-    # Buscar PDFs en subcarpetas de ./facturas/
-    facturas_subcarpetas = procesar_facturas_subcarpetas("./facturas")
-    
-    # Combinar todas las facturas encontradas
-    todas_las_facturas = facturas_directas + facturas_subcarpetas
-    
-    if not todas_las_facturas:
-        print("❌ No se encontraron archivos PDF para procesar")
+    # Las facturas se descubren a medida que el pipeline las consume, recorriendo
+    # las subcarpetas en paralelo hasta --max-depth niveles
+    descubrimiento = Descubrimiento(
+        "./facturas",
+        profundidad=args.max_depth,
+        incluir=args.include,
+        excluir=args.exclude,
+    )
+    todas_las_facturas = perfil.medir_iterador("descubrimiento", anunciar(descubrimiento))
+
+    engine = crear_engine("facturas.db")
+
+    # En modo incremental sólo se procesan PDFs nuevos o modificados
+    manifiesto = None
+    if args.incremental:
+        print("🔁 Modo incremental: sólo facturas nuevas o modificadas")
+        manifiesto = Manifiesto(engine)
+        if args.overwrite:
+            manifiesto.vaciar()
+        todas_las_facturas = manifiesto.filtrar_pendientes(todas_las_facturas, descubrimiento.stats)
+
+    # Estado de cada PDF en facturas.db para poder reanudar tras una caída
+    registro = RegistroTrabajos(engine, reanudar=args.resume)
+    if registro.reanudada:
+        print(f"⏯️ Reanudando la ejecución {registro.ejecucion}")
+    todas_las_facturas = registro.filtrar(todas_las_facturas)
+
+    duplicados = crear_deduplicador(args, engine)
+    if duplicados is not None:
+        print(f"🧬 Deduplicación activa (similitud >= {duplicados.umbral:.2f}): "
+              f"{len(duplicados)} facturas ya registradas")
+
+    funciones.usar_plantillas = not args.no_templates
+
+    if not args.no_cache:
+        funciones.configurar_cache(refrescar=args.refresh)
+
+    # Procesar facturas en serie, por lotes o con pools concurrentes
+    if args.batch:
+        print(f"📦 Modo lote (hasta {funciones.LLM_BATCH_SIZE} facturas por solicitud)")
+    elif args.asincrono:
+        print(f"🌊 Modo asíncrono con hasta {args.asincrono} solicitudes en vuelo")
+    elif args.workers > 1:
+        print(f"⚡ Modo concurrente con {args.workers} workers")
+    respuestas = estructurar(todas_las_facturas, args, registro, duplicados=duplicados,
+                             stats=descubrimiento.stats)
+
+    # Etapas en streaming: parseo y validación por bloques → conversión de moneda → SQLite/Parquet
+    cuarentena = Cuarentena(engine)
+    bloques = pipeline.parsear_en_bloques(respuestas, args.chunk_size, cuarentena)
+
+    sinks = crear_sinks(args, engine, manifiesto, registro)
+    if sinks is None:
         return
+    sink, sink_parquet = sinks
 
-    print(f"✅ Encontradas {len(todas_las_facturas)} facturas para procesar")
+    # Tasas de cambio por fecha desde CSV, facturas.db o las tasas fijas del .env
+    conversor = crear_conversor(engine)
 
-    # Procesar cada factura encontrada
-    for ruta_pdf in todas_las_facturas:
-        try:
-            # Extraer texto de la factura
-            texto_no_estructurado = funciones.extraer_texto_pdf(ruta_pdf)
+    guardadas = 0
+    conversiones = Counter()
+    sin_tasa = Counter()
+    resumen_monedas = Counter()
+    muestra = None
+
+    try:
+        for df in bloques:
+            df, convertidas, sin_convertir = guardar_bloque(df, conversor, sink, sink_parquet)
+            conversiones.update(convertidas)
+            sin_tasa.update(sin_convertir)
+            resumen_monedas.update({moneda: cantidad for moneda, cantidad in df["moneda"].value_counts().items() if cantidad})
+            guardadas += len(df)
+            print(f"💾 Guardadas {guardadas} filas...")
+
+            if muestra is None:
+                muestra = df[df.columns[0:4]].head()
 
-            # Estructurar el texto de la factura
-            texto_estructurado = funciones.estructurar_texto(texto_no_estructurado)
-            
-            if texto_estructurado.lower().strip() == "error":
-                print(f"❌ Error procesando {ruta_pdf}")
-                continue
+        if sink is not None:
+            sink.cerrar()
+        if sink_parquet is not None:
+            sink_parquet.cerrar()
+        registro.cerrar()
+    finally:
+        # Tras una interrupción el registro conserva lo que alcanzó a confirmarse
+        registro.volcar()
+        omitidas = cerrar_deduplicacion(duplicados, manifiesto)
+    estados = registro.resumen()
+    reintentables = registro.reintentables()
+    engine.dispose()
+
+    if registro.omitidos:
+        print(f"⏯️ Omitidas {registro.omitidos['guardadas']} facturas ya guardadas; "
+              f"{registro.omitidos['reintentadas']} fallidas reintentadas, "
+              f"{registro.omitidos['sin_reintentos']} sin reintentos disponibles")
+        if registro.omitidos["duplicadas"]:
+            print(f"   y {registro.omitidos['duplicadas']} duplicadas de otras facturas")
+    if estados.get("fallido"):
+        print(f"⚠️ {estados['fallido']} facturas fallidas en la ejecución {registro.ejecucion}")
+    if reintentables:
+        print(f"   python3 main.py --resume reintentará {reintentables} de ellas")
 
-            # Convertir texto estructurado en dataframe
-            df_factura = funciones.csv_a_dataframe(texto_estructurado)
+    if cuarentena.filas:
+        print(f"🧪 {cuarentena.filas} filas inválidas guardadas en la tabla '{cuarentena.tabla}'")
 
-            # Anexar el dataframe de la factura al dataframe general
-            df = pd.concat([df, df_factura], ignore_index=True)
+    if ocr.estadisticas["paginas"]:
+        print(f"🔎 OCR: {ocr.estadisticas['paginas']} páginas escaneadas en "
+              f"{ocr.estadisticas['documentos']} documentos ({ocr.estadisticas['cache']} desde la caché)")
+    if ocr.estadisticas["sin_texto"]:
+        print(f"📭 {ocr.estadisticas['sin_texto']} PDFs sin texto no se enviaron al LLM")
 
-        except Exception as e:
-            print(f"❌ Error procesando {ruta_pdf}: {str(e)}")
-            continue
+    if omitidas:
+        grupos = {}
+        for ruta, original, parecido in omitidas:
+            grupos.setdefault(original, []).append((ruta, parecido))
+        print(f"🧬 {len(omitidas)} facturas duplicadas no se enviaron al LLM ({len(grupos)} grupos):")
+        imprimir_grupos(grupos, limite=10)
 
-    if df.empty:
-        print("❌ No se procesaron facturas exitosamente")
+    if guardadas == 0:
+        if args.resume:
+            print("✅ No quedan facturas pendientes de la ejecución anterior")
+        elif args.incremental:
+            print("✅ No hay facturas nuevas que procesar")
+        else:
+            print("❌ No se procesaron facturas exitosamente")
         return
 
-    print(f"✅ Se procesaron {len(df)} facturas correctamente")
+    print(f"✅ Se procesaron {guardadas} facturas correctamente")
 
-    # Convertir monedas a pesos colombianos (COP)
-    print("💱 Convirtiendo monedas a COP...")
-    
-    # Convertir dólares a COP
-    mask_dolares = df["moneda"] == "dolares"
-    if mask_dolares.any():
-        df.loc[mask_dolares, "importe"] *= FALLBACK_RATE_USD_COP
-        df.loc[mask_dolares, "moneda"] = "pesos"
-        print(f"   💵 Convertidas {mask_dolares.sum()} facturas de dólares a COP")
-    
-    # Convertir euros a COP  
-    mask_euros = df["moneda"] == "euros"
-    if mask_euros.any():
-        df.loc[mask_euros, "importe"] *= FALLBACK_RATE_EUR_COP
-        df.loc[mask_euros, "moneda"] = "pesos"
-        print(f"   💶 Convertidas {mask_euros.sum()} facturas de euros a COP")
+    print(f"💱 Conversión de monedas a COP (tasas: {conversor.origen}):")
+    for moneda, cantidad in conversiones.most_common():
+        print(f"   {EMOJI_MONEDA.get(moneda, '💱')} Convertidas {cantidad} facturas de {moneda} a COP")
+    for moneda, cantidad in sin_tasa.most_common():
+        print(f"   ⚠️ {cantidad} facturas en {moneda} sin tasa de cambio, se guardan sin convertir")
 
     # Mostrar resumen por monedas
     print("📊 Resumen por monedas:")
-    print(df["moneda"].value_counts().to_string())
-
-    # Eliminar las columnas no esenciales (mantener solo las primeras 4)
-    df = df.iloc[:, 0:4]
+    for moneda, cantidad in resumen_monedas.most_common():
+        print(f"{moneda:<10}{cantidad}")
 
-    # Guardar en base de datos
-    print("💾 Guardando en base de datos...")
-    engine = create_engine("sqlite:///facturas.db")
+    print("✅ Proceso completado exitosamente.")
+    destinos = []
+    if sink is not None:
+        destinos.append("'facturas.db'")
+    if sink_parquet is not None:
+        destinos.append(f"'{sink_parquet.ruta}/'")
+    print(f"📊 {guardadas} facturas procesadas y guardadas en {' y '.join(destinos)}.")
     
-    # Determinar si reemplazar o anexar
-    if_exists = "replace" if args.overwrite else "append"
+    if plantillas.estadisticas["intentos"]:
+        intentos = plantillas.estadisticas["intentos"]
+        aciertos = plantillas.estadisticas["aciertos"]
+        ms_medio = plantillas.estadisticas["segundos"] / intentos * 1000
+        print(f"🧩 Plantillas locales: {aciertos}/{intentos} aciertos "
+              f"({aciertos / intentos:.0%}), {ms_medio:.2f} ms por factura")
     
-    df.to_sql("facturas", engine, if_exists=if_exists, index=False)
-    engine.dispose()
+    if funciones.rate_limiter.throttles:
+        print(f"🚦 Respuestas 429: {funciones.rate_limiter.throttles}, "
+              f"ritmo final al {funciones.rate_limiter.factor:.0%}")
+    for modelo, breaker in funciones.breakers.items():
+        if breaker.estado != "cerrado":
+            print(f"⚡ Circuito {breaker.estado} para {modelo}")
+    
+    if funciones.llm_cache is not None:
+        print(f"🗃️ Caché LLM: {funciones.llm_cache.hits} hits, {funciones.llm_cache.misses} misses")
+    
+    # Las métricas pendientes se escriben ya, sin esperar al hilo de fondo
+    funciones.metricas.volcar()
+    resumen_llm = funciones.metricas.resumen()
+    for modelo, fila in resumen_llm.items():
+        print(f"🤖 {modelo}: {fila['llamadas']} llamadas, {fila['tasa_error']:.0%} errores, "
+              f"{fila['tokens_por_segundo']:.0f} tokens/s, {fila['latencia_media']:.2f}s de media, "
+              f"~{fila['coste']:.4f} USD")
+    if funciones.metricas.descartados:
+        print(f"⚠️ {funciones.metricas.descartados} registros de métricas descartados con el buffer lleno")
 
-    print("✅ Proceso completado exitosamente.")
-    print(f"📊 {len(df)} facturas procesadas y guardadas en 'facturas.db'.")
+    # Reparto del planificador: rendimiento de cada modelo y espera por su cupo
+    for modelo, fila in funciones.planificador.resumen().items():
+        reparto = ""
+        if funciones.planificador.umbral_tokens:
+            reparto = f" ({fila['cortas']} cortas, {fila['largas']} largas)"
+        limite = f" (cupo de {fila['limite']})" if fila['limite'] else ""
+        print(f"🧭 {modelo}: {fila['solicitudes']} solicitudes{reparto}, {fila['por_segundo']:.2f}/s, "
+              f"{fila['latencia_media']:.2f}s de latencia, {fila['espera_media']:.2f}s esperando cupo{limite}")
+
+    tokens_original = sum(fila['tokens_prompt_original'] for fila in resumen_llm.values())
+    tokens_enviado = sum(fila['tokens_prompt_enviado'] for fila in resumen_llm.values())
+    if tokens_enviado < tokens_original:
+        print(f"✂️ Prompt {funciones.constructor.variante}: ~{tokens_enviado} tokens de entrada "
+              f"en lugar de ~{tokens_original} ({1 - tokens_enviado / tokens_original:.0%} menos)")
     
     # Mostrar muestra de los datos guardados
     print("\n📋 Muestra de datos guardados:")
-    print(df.head().to_string())
+    print(muestra.to_string())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,130 @@
+import hashlib
+import os
+from datetime import datetime
+from sqlalchemy import text
+
+
+def hash_archivo(ruta, tamaño_bloque=1 << 20):
+    """SHA-256 del contenido de un archivo leído por bloques"""
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(tamaño_bloque), b""):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+class Manifiesto:
+    """Registro de PDFs ya procesados dentro de facturas.db.
+
+    Guarda ruta, tamaño, mtime y hash de contenido de cada archivo para que
+    las ejecuciones incrementales sólo procesen PDFs nuevos o modificados.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._firmas = {}
+
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS archivos_procesados (
+                    ruta TEXT PRIMARY KEY,
+                    tamano INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    hash TEXT NOT NULL,
+                    procesado_en TEXT NOT NULL
+                )
+            """))
+
+    def vaciar(self):
+        """Olvida todos los archivos registrados (p. ej. con --overwrite)"""
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM archivos_procesados"))
+
+    def filtrar_pendientes(self, rutas_pdf, stats=None):
+        """Genera sólo las rutas nuevas o modificadas desde la última ejecución.
+
+        stats puede traer ruta → (tamaño, mtime) ya obtenidos al descubrir
+        los archivos; las rutas que no estén ahí se consultan con os.stat.
+        """
+        stats = {} if stats is None else stats
+        with self.engine.connect() as conn:
+            registrados = {
+                ruta: (tamano, mtime, hash_)
+                for ruta, tamano, mtime, hash_ in conn.execute(
+                    text("SELECT ruta, tamano, mtime, hash FROM archivos_procesados")
+                )
+            }
+
+        sin_cambios = []
+
+        for ruta_pdf in rutas_pdf:
+            if ruta_pdf in stats:
+                tamano, mtime = stats[ruta_pdf]
+            else:
+                stat = os.stat(ruta_pdf)
+                tamano, mtime = stat.st_size, stat.st_mtime
+            previo = registrados.get(ruta_pdf)
+
+            # Mismo tamaño y mtime: se asume sin cambios sin leer el archivo
+            if previo and previo[0] == tamano and previo[1] == mtime:
+                continue
+
+            hash_ = hash_archivo(ruta_pdf)
+            self._firmas[ruta_pdf] = (tamano, mtime, hash_)
+
+            # Archivo tocado pero con el mismo contenido: sólo se actualiza la firma
+            if previo and previo[2] == hash_:
+                sin_cambios.append(ruta_pdf)
+                continue
+
+            yield ruta_pdf
+
+        if sin_cambios:
+            self._registrar(sin_cambios)
+
+    def guardar(self, df, almacen, reemplazar=False):
+        """Sustituye las filas de cada archivo en el almacén y lo marca como procesado.
+
+        df debe incluir la columna 'archivo' con la ruta de origen de cada fila.
+        """
+        rutas = list(df["archivo"].unique())
+
+        with self.engine.begin() as conn:
+            almacen.preparar_tabla(conn, reemplazar)
+            if not reemplazar:
+                almacen.borrar_archivos(rutas, conn)
+
+            almacen.escribir(df, conn=conn)
+            self._registrar(rutas, conn)
+
+    def marcar_procesados(self, rutas):
+        """Registra como procesados archivos guardados fuera de la tabla (p. ej. en Parquet)"""
+        self._registrar(rutas)
+
+    def _registrar(self, rutas, conn=None):
+        if conn is None:
+            with self.engine.begin() as conn:
+                return self._registrar(rutas, conn)
+
+        ahora = datetime.now().isoformat()
+        conn.execute(
+            text("""
+                INSERT INTO archivos_procesados (ruta, tamano, mtime, hash, procesado_en)
+                VALUES (:ruta, :tamano, :mtime, :hash, :procesado_en)
+                ON CONFLICT(ruta) DO UPDATE SET
+                    tamano = excluded.tamano,
+                    mtime = excluded.mtime,
+                    hash = excluded.hash,
+                    procesado_en = excluded.procesado_en
+            """),
+            [
+                {
+                    "ruta": ruta,
+                    "tamano": self._firmas[ruta][0],
+                    "mtime": self._firmas[ruta][1],
+                    "hash": self._firmas[ruta][2],
+                    "procesado_en": ahora,
+                }
+                for ruta in rutas
+            ],
+        )
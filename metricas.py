@@ -0,0 +1,245 @@
+import atexit
+import csv
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+CAMPOS = [
+    "timestamp", "model", "prompt_tokens", "completion_tokens", "total_tokens",
+    "success", "latencia", "intento", "archivo", "cache",
+    "tokens_prompt_original", "tokens_prompt_enviado",
+]
+
+
+class SinkCSV:
+    """Anexa las métricas a un CSV escribiendo la cabecera una sola vez"""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._rotar_si_cambia_cabecera()
+
+    def _rotar_si_cambia_cabecera(self):
+        if not os.path.exists(self.ruta):
+            return
+        with open(self.ruta, newline="", encoding="utf-8") as f:
+            cabecera = next(csv.reader(f), None)
+        if cabecera and cabecera != CAMPOS:
+            # CSV de una versión anterior con otras columnas: se conserva aparte
+            base, extension = os.path.splitext(self.ruta)
+            destino = f"{base}.{datetime.now():%Y%m%d%H%M%S}{extension}"
+            os.replace(self.ruta, destino)
+            logger.info(f"Métricas antiguas movidas a {destino}")
+
+    def escribir(self, registros):
+        nuevo = not os.path.exists(self.ruta)
+        with open(self.ruta, "a", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=CAMPOS)
+            if nuevo:
+                writer.writeheader()
+            writer.writerows(registros)
+
+
+class SinkJSONL:
+    """Una línea JSON por llamada"""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+
+    def escribir(self, registros):
+        with open(self.ruta, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(registro, ensure_ascii=False) + "\n" for registro in registros)
+
+
+class SinkSQLite:
+    """Tabla llm_usage dentro de una base SQLite (por defecto facturas.db)"""
+
+    def __init__(self, ruta_db):
+        self.ruta_db = ruta_db
+        with sqlite3.connect(ruta_db) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_usage (
+                    timestamp TEXT, model TEXT, prompt_tokens INTEGER,
+                    completion_tokens INTEGER, total_tokens INTEGER, success INTEGER,
+                    latencia REAL, intento INTEGER, archivo TEXT, cache TEXT,
+                    tokens_prompt_original INTEGER, tokens_prompt_enviado INTEGER
+                )
+            """)
+            # Tablas de versiones anteriores: se añaden las columnas que falten
+            existentes = {fila[1] for fila in conn.execute("PRAGMA table_info(llm_usage)")}
+            for campo in CAMPOS:
+                if campo not in existentes:
+                    conn.execute(f"ALTER TABLE llm_usage ADD COLUMN {campo} INTEGER")
+
+    def escribir(self, registros):
+        with sqlite3.connect(self.ruta_db, timeout=30) as conn:
+            conn.executemany(
+                f"INSERT INTO llm_usage ({', '.join(CAMPOS)}) VALUES ({', '.join('?' * len(CAMPOS))})",
+                [tuple(registro[campo] for campo in CAMPOS) for registro in registros],
+            )
+
+
+class Metricas:
+    """Buffer circular de métricas LLM con volcado por lotes en un hilo de fondo.
+
+    registrar() sólo añade a memoria; el hilo vuelca a los sinks cada
+    `intervalo` segundos o cuando el buffer alcanza `tamaño_lote`. Los sinks
+    se conectan con conectar() y el hilo arranca con el primer registro
+    posterior; sin sinks sólo se mantienen los agregados por modelo para el
+    resumen de la ejecución. Si el buffer se llena se descartan los
+    registros más antiguos y se cuentan en `descartados`.
+    """
+
+    def __init__(self, sinks=(), intervalo=2.0, tamaño_lote=200, capacidad=10000,
+                 precio_entrada=0.0, precio_salida=0.0):
+        self.sinks = list(sinks)
+        self.intervalo = intervalo
+        self.tamaño_lote = tamaño_lote
+        self.precio_entrada = precio_entrada
+        self.precio_salida = precio_salida
+        self.descartados = 0
+        self.inicio = time.monotonic()
+        self._buffer = deque(maxlen=capacidad)
+        self._agregados = {}
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._parar = threading.Event()
+        self._hilo = None
+
+    def registrar(self, model, prompt_tokens=0, completion_tokens=0, total_tokens=0,
+                  success=True, latencia=None, intento=None, archivo=None, cache=None,
+                  tokens_prompt_original=None, tokens_prompt_enviado=None):
+        registro = {
+            "timestamp": datetime.now().isoformat(),
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": total_tokens,
+            "success": success,
+            "latencia": round(latencia, 4) if latencia is not None else None,
+            "intento": intento,
+            "archivo": archivo,
+            "cache": cache,
+            "tokens_prompt_original": tokens_prompt_original,
+            "tokens_prompt_enviado": tokens_prompt_enviado,
+        }
+
+        with self._lock:
+            pendientes = 0
+            if self.sinks:
+                if self._hilo is None and not self._parar.is_set():
+                    self._hilo = threading.Thread(target=self._bucle, name="metricas-llm", daemon=True)
+                    self._hilo.start()
+                if len(self._buffer) == self._buffer.maxlen:
+                    self.descartados += 1
+                    if self.descartados == 1:
+                        logger.warning(f"Buffer de métricas lleno ({self._buffer.maxlen} registros): "
+                                       f"se descartan los más antiguos sin escribirlos")
+                self._buffer.append(registro)
+                pendientes = len(self._buffer)
+
+            agregado = self._agregados.setdefault(model, {
+                "llamadas": 0, "errores": 0, "prompt_tokens": 0,
+                "completion_tokens": 0, "latencia": 0.0,
+                "tokens_prompt_original": 0, "tokens_prompt_enviado": 0,
+            })
+            # Los aciertos de caché/plantilla no son llamadas al modelo
+            if cache not in ("hit", "plantilla"):
+                agregado["llamadas"] += 1
+                agregado["errores"] += not success
+                agregado["prompt_tokens"] += prompt_tokens or 0
+                agregado["completion_tokens"] += completion_tokens or 0
+                agregado["latencia"] += latencia or 0.0
+                agregado["tokens_prompt_original"] += tokens_prompt_original or 0
+                agregado["tokens_prompt_enviado"] += tokens_prompt_enviado or 0
+
+        if pendientes >= self.tamaño_lote:
+            self._despertar.set()
+
+    def conectar(self, sinks):
+        """Empieza a volcar en los sinks y deja programado el volcado final al salir"""
+        with self._lock:
+            self.sinks = list(sinks)
+        atexit.register(self.cerrar)
+
+    def _bucle(self):
+        while not self._parar.is_set():
+            self._despertar.wait(self.intervalo)
+            self._despertar.clear()
+            self.volcar()
+
+    def volcar(self):
+        """Escribe en los sinks todo lo acumulado en el buffer"""
+        with self._lock:
+            registros = list(self._buffer)
+            self._buffer.clear()
+
+        if not registros:
+            return
+
+        for sink in self.sinks:
+            try:
+                sink.escribir(registros)
+            except Exception as e:
+                logger.warning(f"No se pudo registrar métricas LLM en {type(sink).__name__}: {e}")
+
+    def cerrar(self):
+        """Detiene el hilo de fondo y vuelca lo pendiente"""
+        with self._lock:
+            if self._parar.is_set():
+                return
+            self._parar.set()
+        self._despertar.set()
+        if self._hilo is not None:
+            self._hilo.join()
+        self.volcar()
+
+    def resumen(self):
+        """Agregados por modelo: llamadas, tasa de error, tokens/s, latencia media, coste
+        y tokens de entrada estimados antes y después de compactar/recortar el prompt"""
+        segundos = max(time.monotonic() - self.inicio, 1e-9)
+        filas = {}
+
+        with self._lock:
+            for modelo, agregado in self._agregados.items():
+                if not agregado["llamadas"]:
+                    continue
+                tokens = agregado["prompt_tokens"] + agregado["completion_tokens"]
+                filas[modelo] = {
+                    "llamadas": agregado["llamadas"],
+                    "tasa_error": agregado["errores"] / agregado["llamadas"],
+                    "tokens": tokens,
+                    "tokens_por_segundo": tokens / segundos,
+                    "latencia_media": agregado["latencia"] / agregado["llamadas"],
+                    "coste": (agregado["prompt_tokens"] * self.precio_entrada
+                              + agregado["completion_tokens"] * self.precio_salida) / 1_000_000,
+                    "tokens_prompt_original": agregado["tokens_prompt_original"],
+                    "tokens_prompt_enviado": agregado["tokens_prompt_enviado"],
+                }
+        return filas
+
+
+def crear_sinks(nombres_sinks, ruta_csv, ruta_db, ruta_jsonl):
+    """Sinks de métricas con los nombres indicados (csv, sqlite, jsonl)"""
+    constructores = {
+        "csv": lambda: SinkCSV(ruta_csv),
+        "sqlite": lambda: SinkSQLite(ruta_db),
+        "jsonl": lambda: SinkJSONL(ruta_jsonl),
+    }
+
+    sinks = []
+    for nombre in nombres_sinks:
+        nombre = nombre.strip().lower()
+        if not nombre:
+            continue
+        if nombre not in constructores:
+            logger.warning(f"Sink de métricas desconocido: {nombre}")
+            continue
+        sinks.append(constructores[nombre]())
+    return sinks
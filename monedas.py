@@ -0,0 +1,169 @@
+import argparse
+import logging
+import os
+import pandas as pd
+from dotenv import load_dotenv
+from sqlalchemy import inspect, text
+from parseo import a_fechas, por_valor_unico
+
+logger = logging.getLogger(__name__)
+
+load_dotenv(".env")
+
+# Tasas fijas de respaldo cuando no hay tabla de tipos de cambio
+FALLBACK_RATE_USD_COP = float(os.getenv("FALLBACK_RATE_USD_COP", "4500"))
+FALLBACK_RATE_EUR_COP = float(os.getenv("FALLBACK_RATE_EUR_COP", "4900"))
+
+# Tabla de tipos de cambio: CSV (moneda;fecha;tasa) o tabla en facturas.db
+TASAS_CAMBIO_CSV = os.getenv("TASAS_CAMBIO_CSV", "tasas_cambio.csv")
+TASAS_CAMBIO_TABLA = os.getenv("TASAS_CAMBIO_TABLA", "tasas_cambio")
+
+MONEDA_BASE = "pesos"
+
+# Códigos ISO aceptados en la tabla de tasas para las monedas del prompt
+ALIAS = {"usd": "dolares", "eur": "euros", "cop": "pesos"}
+
+
+def normalizar_tasas(tasas):
+    """DataFrame moneda/fecha/tasa limpio y ordenado por fecha para merge_asof"""
+    tasas = tasas.rename(columns=str.lower)[["moneda", "fecha", "tasa"]].copy()
+    tasas["moneda"] = _monedas(tasas["moneda"])
+    tasas["fecha"] = a_fechas(tasas["fecha"])
+    tasas["tasa"] = pd.to_numeric(tasas["tasa"], errors="coerce")
+    tasas = tasas.dropna().drop_duplicates(["moneda", "fecha"], keep="last")
+    return tasas.sort_values("fecha", ignore_index=True)
+
+
+def _monedas(monedas):
+    """Nombre de moneda normalizado (minúsculas, alias ISO resueltos)"""
+    return por_valor_unico(monedas, lambda unicas: unicas.str.strip().str.lower().replace(ALIAS))
+
+
+def _conteo(monedas):
+    """Filas por moneda, sin las categorías que no aparecen"""
+    return {moneda: cantidad for moneda, cantidad in monedas.value_counts().items() if cantidad}
+
+
+def leer_tasas_csv(ruta):
+    with open(ruta, encoding="utf-8") as f:
+        separador = ";" if ";" in f.readline() else ","
+    return normalizar_tasas(pd.read_csv(ruta, sep=separador, dtype=str))
+
+
+def leer_tasas_db(engine, tabla=TASAS_CAMBIO_TABLA):
+    return normalizar_tasas(pd.read_sql(text(f"SELECT moneda, fecha, tasa FROM {tabla}"), engine))
+
+
+def guardar_tasas_db(tasas, engine, tabla=TASAS_CAMBIO_TABLA):
+    """Anexa o actualiza tasas en la tabla (clave moneda + fecha)"""
+    tasas = normalizar_tasas(tasas)
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {tabla} (
+                moneda TEXT NOT NULL,
+                fecha DATE NOT NULL,
+                tasa REAL NOT NULL,
+                PRIMARY KEY (moneda, fecha)
+            )
+        """))
+        conn.exec_driver_sql(
+            f"INSERT INTO {tabla} (moneda, fecha, tasa) VALUES (?, ?, ?) "
+            f"ON CONFLICT(moneda, fecha) DO UPDATE SET tasa = excluded.tasa",
+            list(zip(tasas["moneda"], tasas["fecha"].dt.strftime("%Y-%m-%d"), tasas["tasa"])),
+        )
+    return len(tasas)
+
+
+def tasas_fijas():
+    """Las tasas FALLBACK_RATE_* como tabla con una única fecha muy antigua"""
+    return normalizar_tasas(pd.DataFrame({
+        "moneda": ["dolares", "euros"],
+        "fecha": ["1900-01-01", "1900-01-01"],
+        "tasa": [FALLBACK_RATE_USD_COP, FALLBACK_RATE_EUR_COP],
+    }))
+
+
+class ConversorMonedas:
+    """Convierte importes a pesos con la tasa vigente en la fecha de cada factura.
+
+    Todas las filas de un bloque se resuelven con un único merge_asof por
+    (moneda, fecha): se usa la última tasa publicada en o antes de
+    fecha_factura y, si la factura es anterior a la primera tasa, la más
+    antigua disponible. Sirve para cualquier moneda presente en la tabla.
+    """
+
+    def __init__(self, tasas, origen="tabla"):
+        self.tasas = tasas
+        self.origen = origen
+
+    def convertir(self, df):
+        """Devuelve (df, conversiones por moneda, filas sin tasa por moneda).
+
+        df conserva importe_original y moneda_original; importe y moneda
+        quedan en pesos en las filas convertidas. La tasa se busca por
+        moneda_original (el código que trajo la factura, p. ej. gbp), no por
+        la categoría de moneda, que agrupa las no previstas en "otros".
+        """
+        if "importe_original" not in df.columns:
+            df["importe_original"] = df["importe"]
+        if "moneda_original" not in df.columns:
+            df["moneda_original"] = df["moneda"]
+
+        monedas = _monedas(df["moneda_original"])
+        pendientes = (monedas != MONEDA_BASE) & monedas.notna()
+        if not pendientes.any():
+            return df, {}, {}
+
+        consulta = pd.DataFrame({
+            "fila": df.index[pendientes],
+            "moneda": monedas[pendientes].to_numpy(),
+            "fecha": a_fechas(df.loc[pendientes, "fecha_factura"]).to_numpy(),
+        })
+        con_fecha = consulta.dropna(subset=["fecha"]).sort_values("fecha")
+
+        tasas = pd.merge_asof(
+            con_fecha, self.tasas, on="fecha", by="moneda", direction="backward"
+        ).set_index("fila")["tasa"]
+
+        # Anteriores a la primera tasa o sin fecha válida: la tasa más antigua de su moneda
+        primeras = self.tasas.groupby("moneda")["tasa"].first()
+        tasas = tasas.reindex(consulta["fila"])
+        tasas = tasas.fillna(pd.Series(consulta["moneda"].map(primeras).to_numpy(), index=consulta["fila"]))
+
+        convertibles = tasas.dropna()
+        df.loc[convertibles.index, "importe"] = df.loc[convertibles.index, "importe_original"] * convertibles
+        df.loc[convertibles.index, "moneda"] = MONEDA_BASE
+
+        conversiones = _conteo(monedas[convertibles.index])
+        sin_tasa = _conteo(monedas[tasas.index[tasas.isna()]])
+        return df, conversiones, sin_tasa
+
+
+def crear_conversor(engine=None):
+    """Tasas desde TASAS_CAMBIO_CSV, desde la tabla de facturas.db o, si no hay ninguna, las fijas"""
+    if os.path.exists(TASAS_CAMBIO_CSV):
+        logger.info(f"Tasas de cambio desde {TASAS_CAMBIO_CSV}")
+        return ConversorMonedas(leer_tasas_csv(TASAS_CAMBIO_CSV), TASAS_CAMBIO_CSV)
+
+    if engine is not None and inspect(engine).has_table(TASAS_CAMBIO_TABLA):
+        logger.info(f"Tasas de cambio desde la tabla {TASAS_CAMBIO_TABLA}")
+        return ConversorMonedas(leer_tasas_db(engine), TASAS_CAMBIO_TABLA)
+
+    return ConversorMonedas(tasas_fijas(), "FALLBACK_RATE_*")
+
+
+def main():
+    from almacen import crear_engine
+
+    parser = argparse.ArgumentParser(description='Importar tasas de cambio a facturas.db')
+    parser.add_argument('csv', help='CSV con columnas moneda;fecha;tasa (pesos por unidad)')
+    args = parser.parse_args()
+
+    engine = crear_engine("facturas.db")
+    cantidad = guardar_tasas_db(leer_tasas_csv(args.csv), engine)
+    engine.dispose()
+    print(f"✅ {cantidad} tasas importadas en la tabla {TASAS_CAMBIO_TABLA}")
+
+
+if __name__ == "__main__":
+    main()
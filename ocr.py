@@ -0,0 +1,269 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import fitz  # PyMuPDF
+from dotenv import load_dotenv
+from perfilado import perfil
+
+load_dotenv(".env")
+
+logger = logging.getLogger(__name__)
+
+# OCR local (Tesseract a través de PyMuPDF) para las páginas escaneadas
+OCR_ACTIVO = os.getenv("OCR_ACTIVO", "true").lower() == "true"
+OCR_IDIOMA = os.getenv("OCR_IDIOMA", "spa+eng")
+OCR_DPI = int(os.getenv("OCR_DPI", "300"))
+# Una página con imágenes y menos caracteres que esto se considera escaneada;
+# un documento con menos caracteres que esto en total no se envía al LLM
+OCR_MIN_CARACTERES = int(os.getenv("OCR_MIN_CARACTERES", "25"))
+# Procesos dedicados al OCR, aparte de los de extracción
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "2"))
+OCR_CACHE_DB = os.getenv("OCR_CACHE_DB", "ocr_cache.db")
+
+# Marca que deja la extracción en lugar del texto de una página escaneada
+MARCA = "\x0cOCR{}\x0c"
+PATRON_MARCA = re.compile(r"\x0cOCR(\d+)\x0c")
+# Una marca cortada por PDF_MAX_CHARS al final del texto
+PATRON_MARCA_CORTADA = re.compile(r"\x0c(?:O(?:C(?:R\d*)?)?)?$")
+
+# Páginas reconocidas, leídas de la caché y documentos sin texto en este proceso
+estadisticas = Counter()
+
+_pool = None
+_pool_lock = threading.Lock()
+_aviso_error = False
+
+
+class SinTexto(Exception):
+    """Documento sin texto utilizable ni siquiera tras el OCR; no se envía al LLM"""
+
+
+def pagina_escaneada(page, texto):
+    """Página casi sin texto pero con imágenes: candidata a OCR.
+
+    Sólo mira la longitud del texto ya extraído y la lista de imágenes, sin
+    renderizar nada; una página en blanco sin imágenes no se reconoce.
+    """
+    return len(texto.strip()) < OCR_MIN_CARACTERES and bool(page.get_images())
+
+
+def marca(numero):
+    return MARCA.format(numero)
+
+
+def paginas_pendientes(texto):
+    """Números de página marcadas para OCR en un texto extraído"""
+    return [int(numero) for numero in PATRON_MARCA.findall(texto)]
+
+
+def clave_pagina(page, dpi):
+    """Hash del contenido de la página (operadores y flujos de sus imágenes) sin renderizarla.
+
+    Dos PDFs con la misma página escaneada comparten la entrada aunque el
+    resto del archivo cambie.
+    """
+    h = hashlib.sha256()
+    h.update(page.read_contents())
+    for imagen in page.get_images():
+        h.update(page.parent.xref_stream_raw(imagen[0]) or b"")
+    h.update(f"{page.rect}:{dpi}".encode())
+    return h.hexdigest()
+
+
+class CacheOCR:
+    """Imágenes renderizadas y textos reconocidos, guardados en SQLite.
+
+    La imagen de cada página se guarda por el hash de su contenido en el
+    PDF, y el texto por el hash de la imagen y el idioma. Volver a procesar
+    una página ya vista no renderiza ni reconoce nada; cambiar de idioma
+    reutiliza la imagen. La comparten todos los procesos de OCR.
+    """
+
+    def __init__(self, ruta_db=OCR_CACHE_DB):
+        self.ruta_db = ruta_db
+        self._conn = sqlite3.connect(ruta_db, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS ocr_imagenes (
+                clave TEXT PRIMARY KEY,
+                hash_imagen TEXT NOT NULL,
+                png BLOB NOT NULL,
+                creado REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS ocr_textos (
+                hash_imagen TEXT NOT NULL,
+                idioma TEXT NOT NULL,
+                texto TEXT NOT NULL,
+                creado REAL NOT NULL,
+                PRIMARY KEY (hash_imagen, idioma)
+            )
+        """)
+        self._conn.commit()
+
+    def imagen(self, clave):
+        """(hash de la imagen, PNG) de una página ya renderizada, o None"""
+        return self._conn.execute(
+            "SELECT hash_imagen, png FROM ocr_imagenes WHERE clave = ?", (clave,)
+        ).fetchone()
+
+    def guardar_imagen(self, clave, hash_imagen, png):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO ocr_imagenes VALUES (?, ?, ?, ?)",
+            (clave, hash_imagen, png, time.time()),
+        )
+        self._conn.commit()
+
+    def texto(self, hash_imagen, idioma):
+        fila = self._conn.execute(
+            "SELECT texto FROM ocr_textos WHERE hash_imagen = ? AND idioma = ?", (hash_imagen, idioma)
+        ).fetchone()
+        return None if fila is None else fila[0]
+
+    def guardar_texto(self, hash_imagen, idioma, texto):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO ocr_textos VALUES (?, ?, ?, ?)",
+            (hash_imagen, idioma, texto, time.time()),
+        )
+        self._conn.commit()
+
+    def cerrar(self):
+        self._conn.close()
+
+
+# Caché abierta una vez por proceso de OCR
+_cache = None
+
+
+def reconocer_pagina(page, cache, idioma=OCR_IDIOMA, dpi=OCR_DPI):
+    """Texto de una página escaneada; devuelve (texto, si salió entero de la caché)"""
+    clave = clave_pagina(page, dpi)
+
+    guardada = cache.imagen(clave)
+    if guardada is not None:
+        hash_imagen, png = guardada
+        texto = cache.texto(hash_imagen, idioma)
+        if texto is not None:
+            return texto, True
+    else:
+        png = page.get_pixmap(dpi=dpi).tobytes("png")
+        hash_imagen = hashlib.sha256(png).hexdigest()
+        cache.guardar_imagen(clave, hash_imagen, png)
+        texto = cache.texto(hash_imagen, idioma)
+        if texto is not None:
+            return texto, True
+
+    # Tesseract sobre la imagen: PyMuPDF devuelve un PDF de una página con capa de texto
+    with fitz.open("pdf", fitz.Pixmap(png).pdfocr_tobytes(language=idioma)) as reconocido:
+        texto = reconocido[0].get_text("text")
+    cache.guardar_texto(hash_imagen, idioma, texto)
+    return texto, False
+
+
+def reconocer_paginas(ruta_pdf, numeros, idioma=OCR_IDIOMA, dpi=OCR_DPI, ruta_cache=OCR_CACHE_DB):
+    """Reconoce varias páginas de un PDF; se ejecuta en el pool de OCR.
+
+    Devuelve ({número: texto}, páginas servidas por la caché, error o None).
+    Si Tesseract no está disponible las páginas quedan sin texto.
+    """
+    global _cache
+    if _cache is None:
+        _cache = CacheOCR(ruta_cache)
+
+    textos = {}
+    desde_cache = 0
+    try:
+        with fitz.open(ruta_pdf) as doc:
+            for numero in numeros:
+                textos[numero], en_cache = reconocer_pagina(doc[numero], _cache, idioma, dpi)
+                desde_cache += en_cache
+    except Exception as e:
+        return textos, desde_cache, f"{type(e).__name__}: {e}"
+    return textos, desde_cache, None
+
+
+def _obtener_pool():
+    """Pool de OCR, creado la primera vez que aparece una página escaneada.
+
+    En ese momento el proceso ya tiene hilos en marcha, así que los procesos
+    se arrancan con spawn en lugar de fork para no heredar locks tomados.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=max(OCR_WORKERS, 1), mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def enviar(ruta_pdf, numeros):
+    """Programa el OCR de unas páginas en el pool dedicado"""
+    return _obtener_pool().submit(reconocer_paginas, ruta_pdf, numeros)
+
+
+def _fusionar(ruta_pdf, texto, resultado):
+    """Sustituye las marcas por el texto reconocido y valida el documento"""
+    global _aviso_error
+
+    textos, desde_cache, error = resultado
+    if error and not _aviso_error:
+        _aviso_error = True
+        logger.warning(f"OCR no disponible o fallido ({error}); las páginas escaneadas quedan sin texto")
+
+    estadisticas["documentos"] += 1
+    estadisticas["paginas"] += len(textos)
+    estadisticas["cache"] += desde_cache
+    perfil.contar("paginas_ocr", len(textos))
+
+    texto = PATRON_MARCA.sub(lambda m: textos.get(int(m.group(1)), "").strip(), texto)
+    return _exigir_texto(ruta_pdf, texto)
+
+
+def _exigir_texto(ruta_pdf, texto):
+    texto = PATRON_MARCA_CORTADA.sub("", texto)
+    if len(texto.strip()) < OCR_MIN_CARACTERES:
+        estadisticas["sin_texto"] += 1
+        raise SinTexto(f"{ruta_pdf}: sin texto extraíble (¿PDF escaneado sin OCR?)")
+    return texto
+
+
+def completar(ruta_pdf, texto):
+    """Texto final de un PDF: las páginas marcadas pasan por el OCR.
+
+    Lanza SinTexto si el documento sigue (casi) vacío, así nunca llega al LLM.
+    """
+    numeros = paginas_pendientes(texto)
+    if not numeros:
+        return _exigir_texto(ruta_pdf, texto)
+    with perfil.etapa("ocr"):
+        resultado = enviar(ruta_pdf, numeros).result()
+    return _fusionar(ruta_pdf, texto, resultado)
+
+
+async def completar_async(ruta_pdf, texto):
+    """Como completar() pero cediendo el event loop mientras trabaja el pool de OCR"""
+    numeros = paginas_pendientes(texto)
+    if not numeros:
+        return _exigir_texto(ruta_pdf, texto)
+    with perfil.etapa("ocr"):
+        resultado = await asyncio.wrap_future(enviar(ruta_pdf, numeros))
+    return _fusionar(ruta_pdf, texto, resultado)
+
+
+def cerrar():
+    """Detiene el pool de OCR si llegó a crearse"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
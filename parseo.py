@@ -0,0 +1,167 @@
+import numpy as np
+import pandas as pd
+from plantillas import CABECERA_CSV
+
+CAMPOS = CABECERA_CSV.split(";")
+
+# Categorías fijas de moneda (las del prompt) y variantes que se aceptan; otras
+# monedas llegan como código ISO y caen en "otros" sólo para validar y resumir
+MONEDAS_VALIDAS = ["pesos", "dolares", "euros", "otros"]
+TIPO_MONEDA = pd.CategoricalDtype(MONEDAS_VALIDAS)
+ALIAS_MONEDA = {
+    "cop": "pesos", "peso": "pesos", "col$": "pesos",
+    "usd": "dolares", "dolar": "dolares", "dólar": "dolares", "dólares": "dolares", "us$": "dolares",
+    "eur": "euros", "euro": "euros", "€": "euros",
+}
+
+
+def por_valor_unico(serie, funcion):
+    """Aplica funcion (vectorizada) sólo a los valores distintos de la serie y los reparte.
+
+    Fechas y monedas se repiten muchísimo, así que en bloques grandes esto
+    es mucho más rápido que operar sobre la columna completa.
+    """
+    unicas = pd.Series(pd.unique(serie.dropna()))
+    return serie.map(dict(zip(unicas, funcion(unicas.astype(str)))))
+
+
+def _convertir_fechas(fechas):
+    fechas = fechas.str.strip()
+    convertidas = pd.to_datetime(fechas, format="%d/%m/%Y", errors="coerce")
+    faltan = convertidas.isna()
+    if faltan.any():
+        convertidas[faltan] = pd.to_datetime(fechas[faltan], format="%Y-%m-%d", errors="coerce")
+    return convertidas
+
+
+def a_fechas(fechas):
+    """Fechas dd/mm/aaaa o ISO a datetime64 (NaT si no son válidas)"""
+    if pd.api.types.is_datetime64_any_dtype(fechas):
+        return fechas
+    return por_valor_unico(fechas, _convertir_fechas).astype("datetime64[ns]")
+
+
+def a_importes(importes):
+    """Importes en formato español ('1234,56', '1.234,56') o con punto decimal a float"""
+    importes = importes.str.replace(r"[^\d,.\-]", "", regex=True)
+    con_coma = importes.str.contains(",", regex=False)
+    # Con coma decimal los puntos sólo pueden ser separadores de miles
+    importes = importes.where(~con_coma, importes.str.replace(".", "", regex=False))
+    return pd.to_numeric(importes.str.replace(",", ".", regex=False), errors="coerce")
+
+
+def codigos_moneda(monedas):
+    """Moneda tal como vino (minúsculas, alias resueltos): 'gbp' o 'mxn' se conservan para la conversión"""
+    def normalizar(unicas):
+        unicas = unicas.str.strip().str.lower().replace(ALIAS_MONEDA)
+        return unicas.where(unicas != "", "otros")
+
+    return por_valor_unico(monedas, normalizar).fillna("otros")
+
+
+def a_monedas(monedas):
+    """Moneda como categoría fija; lo que no es una de ellas queda como 'otros'"""
+    codigos = codigos_moneda(monedas)
+    return codigos.where(codigos.isin(MONEDAS_VALIDAS), "otros").astype(TIPO_MONEDA)
+
+
+def lineas_csv(texto):
+    """Líneas de datos de una respuesta CSV, sin cabeceras, vallas de código ni líneas vacías"""
+    lineas = []
+    for linea in texto.splitlines():
+        linea = linea.strip()
+        if not linea or linea.startswith("```") or linea.lower().startswith("fecha_factura"):
+            continue
+        lineas.append(linea)
+    return lineas
+
+
+class LineasIncrementales:
+    """Separa en líneas de datos una respuesta CSV que llega por fragmentos.
+
+    alimentar() devuelve las líneas completas nuevas en cuanto llega su
+    salto de línea, y terminar() la última. Si lo primero que contesta el
+    modelo es "error", `error` se activa sin esperar al resto de la
+    respuesta para que quien lee pueda cortarla.
+    """
+
+    def __init__(self):
+        self.lineas = []
+        self.error = False
+        self._resto = ""
+
+    def _agregar(self, texto):
+        nuevas = lineas_csv(texto)
+        if not self.lineas and nuevas and nuevas[0].lower().startswith("error"):
+            self.error = True
+        self.lineas.extend(nuevas)
+        return nuevas
+
+    def alimentar(self, fragmento):
+        completas, salto, self._resto = (self._resto + fragmento).rpartition("\n")
+        nuevas = self._agregar(completas) if salto else []
+
+        # "error" suele llegar sin salto de línea detrás
+        if not self.lineas and self._resto.strip().lower().startswith("error"):
+            self.error = True
+        return nuevas
+
+    def terminar(self):
+        resto, self._resto = self._resto, ""
+        return self._agregar(resto)
+
+    def csv(self):
+        """La respuesta como CSV con cabecera, o 'error'"""
+        if self.error:
+            return "error"
+        return "\n".join([CABECERA_CSV] + self.lineas)
+
+
+def parsear_lineas(lineas, archivos):
+    """Parsea de una vez líneas CSV de muchas respuestas y las valida por columnas.
+
+    archivos va alineado con lineas (ruta de origen de cada una). Devuelve
+    (DataFrame válido, registros de cuarentena). El DataFrame tiene
+    fecha_factura como fecha, importe como float, moneda como categoría,
+    moneda_original con el código recibido (el que usa la conversión) y la
+    columna archivo; cada registro de cuarentena es (archivo, línea, motivo).
+    """
+    partes = [linea.split(";") for linea in lineas]
+    cuarentena = [
+        (archivo, linea, f"{len(campos)} campos en lugar de {len(CAMPOS)}")
+        for archivo, linea, campos in zip(archivos, lineas, partes)
+        if len(campos) != len(CAMPOS)
+    ]
+    indices = [i for i, campos in enumerate(partes) if len(campos) == len(CAMPOS)]
+
+    columnas = list(zip(*(partes[i] for i in indices))) or [()] * len(CAMPOS)
+    crudo = pd.DataFrame({
+        campo: pd.Series(valores, dtype=object).str.strip()
+        for campo, valores in zip(CAMPOS, columnas)
+    })
+
+    df = pd.DataFrame({
+        "fecha_factura": a_fechas(crudo["fecha_factura"]),
+        "proveedor": crudo["proveedor"].str.lower(),
+        "concepto": crudo["concepto"],
+        "importe": a_importes(crudo["importe"]),
+        "moneda": a_monedas(crudo["moneda"]),
+        "moneda_original": codigos_moneda(crudo["moneda"]),
+        "archivo": pd.Series([archivos[i] for i in indices], dtype=object),
+    })
+
+    motivos = pd.Series(np.select(
+        [df["fecha_factura"].isna(), df["importe"].isna(), crudo["proveedor"].fillna("") == ""],
+        ["fecha inválida", "importe inválido", "proveedor vacío"],
+        default="",
+    ), index=df.index)
+    invalidas = motivos != ""
+
+    if invalidas.any():
+        cuarentena.extend(
+            (archivos[indices[i]], lineas[indices[i]], motivos[i])
+            for i in np.flatnonzero(invalidas.to_numpy())
+        )
+        df = df[~invalidas].reset_index(drop=True)
+
+    return df, cuarentena
@@ -0,0 +1,148 @@
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+# Límites superiores (segundos) de los cubos del histograma de cada etapa
+BORDES_HISTOGRAMA = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histograma:
+    """Duraciones de una etapa en cubos fijos, con total, mínimo y máximo"""
+
+    def __init__(self):
+        self.cubos = [0] * (len(BORDES_HISTOGRAMA) + 1)
+        self.n = 0
+        self.total = 0.0
+        self.minimo = float("inf")
+        self.maximo = 0.0
+
+    def observar(self, segundos):
+        i = 0
+        while i < len(BORDES_HISTOGRAMA) and segundos > BORDES_HISTOGRAMA[i]:
+            i += 1
+        self.cubos[i] += 1
+        self.n += 1
+        self.total += segundos
+        self.minimo = min(self.minimo, segundos)
+        self.maximo = max(self.maximo, segundos)
+
+    def percentil(self, p):
+        """Límite superior del cubo que contiene el percentil p (aproximado)"""
+        objetivo = self.n * p / 100
+        acumulado = 0
+        for i, cantidad in enumerate(self.cubos):
+            acumulado += cantidad
+            if acumulado >= objetivo and cantidad:
+                return min(BORDES_HISTOGRAMA[i], self.maximo) if i < len(BORDES_HISTOGRAMA) else self.maximo
+        return self.maximo
+
+    def como_dict(self):
+        etiquetas = [f"<={borde}s" for borde in BORDES_HISTOGRAMA] + [f">{BORDES_HISTOGRAMA[-1]}s"]
+        return {
+            "n": self.n,
+            "total": round(self.total, 6),
+            "media": round(self.total / self.n, 6) if self.n else 0.0,
+            "min": round(self.minimo, 6) if self.n else 0.0,
+            "max": round(self.maximo, 6),
+            "p50": self.percentil(50),
+            "p95": self.percentil(95),
+            "histograma": dict(zip(etiquetas, self.cubos)),
+        }
+
+
+class Perfil:
+    """Temporizadores por etapa, contadores e histogramas de una ejecución.
+
+    Desactivado no mide nada: etapa() sólo cede el control, así la
+    instrumentación puede quedarse en el camino caliente. Es seguro usarlo
+    desde varios hilos; las etapas que corren en paralelo suman su tiempo,
+    por lo que el total de etapas puede superar el tiempo de reloj.
+    """
+
+    def __init__(self):
+        self.activo = False
+        self.inicio = time.perf_counter()
+        self._etapas = {}
+        self._contadores = Counter()
+        self._lock = threading.Lock()
+
+    def activar(self):
+        self.activo = True
+        self.inicio = time.perf_counter()
+
+    @contextmanager
+    def etapa(self, nombre):
+        """Mide el bloque como una observación de la etapa `nombre`"""
+        if not self.activo:
+            yield
+            return
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(nombre, time.perf_counter() - inicio)
+
+    def observar(self, nombre, segundos):
+        if not self.activo:
+            return
+        with self._lock:
+            if nombre not in self._etapas:
+                self._etapas[nombre] = Histograma()
+            self._etapas[nombre].observar(segundos)
+
+    def contar(self, nombre, cantidad=1):
+        if self.activo:
+            with self._lock:
+                self._contadores[nombre] += cantidad
+
+    def medir_iterador(self, nombre, iterable):
+        """Atribuye a `nombre` el tiempo de producir cada elemento del iterable"""
+        if not self.activo:
+            yield from iterable
+            return
+        iterador = iter(iterable)
+        while True:
+            inicio = time.perf_counter()
+            try:
+                elemento = next(iterador)
+            except StopIteration:
+                return
+            finally:
+                self.observar(nombre, time.perf_counter() - inicio)
+            yield elemento
+
+    def reporte(self):
+        """Informe serializable con las etapas ordenadas por tiempo total"""
+        reloj = time.perf_counter() - self.inicio
+        with self._lock:
+            etapas = sorted(self._etapas.items(), key=lambda item: item[1].total, reverse=True)
+            return {
+                "fecha": datetime.now().isoformat(),
+                "argv": sys.argv,
+                "segundos_reloj": round(reloj, 6),
+                "etapas": {nombre: histograma.como_dict() for nombre, histograma in etapas},
+                "contadores": dict(self._contadores),
+            }
+
+    def imprimir(self, reporte):
+        reloj = reporte["segundos_reloj"]
+        print(f"\n⏱️ Perfil por etapas ({reloj:.2f}s de reloj)")
+        print(f"   {'etapa':<20} {'n':>7} {'total s':>9} {'% reloj':>8} {'media ms':>9} {'p95 ms':>8} {'max ms':>8}")
+        for nombre, datos in reporte["etapas"].items():
+            print(f"   {nombre:<20} {datos['n']:>7} {datos['total']:>9.3f} "
+                  f"{datos['total'] / reloj if reloj else 0:>8.0%} {datos['media'] * 1000:>9.2f} "
+                  f"{datos['p95'] * 1000:>8.1f} {datos['max'] * 1000:>8.1f}")
+        if reporte["contadores"]:
+            print("   " + ", ".join(f"{nombre}={valor}" for nombre, valor in sorted(reporte["contadores"].items())))
+
+    def guardar(self, reporte, ruta):
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump(reporte, f, ensure_ascii=False, indent=2)
+
+
+# Perfil compartido por todos los módulos del ETL; main.py lo activa con --profile
+perfil = Perfil()
@@ -0,0 +1,146 @@
+import os
+import pandas as pd
+from dotenv import load_dotenv
+from almacen import AlmacenFacturas
+from monedas import crear_conversor
+from parseo import lineas_csv, parsear_lineas
+from perfilado import perfil
+
+# Cargar variables de entorno
+load_dotenv(".env")
+
+# Filas acumuladas antes de escribir en SQLite
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "500"))
+
+
+def parsear_en_bloques(respuestas, tamaño=CHUNK_SIZE, cuarentena=None):
+    """Convierte las respuestas (ruta, CSV) en bloques de al menos `tamaño` filas.
+
+    Las líneas de muchas respuestas se acumulan en crudo y cada bloque se
+    parsea y valida de una sola vez (parseo.parsear_lineas), en lugar de un
+    read_csv por factura. Las filas inválidas van a `cuarentena` con su PDF
+    de origen; las respuestas "error" o con excepción se descartan.
+    """
+    lineas = []
+    archivos = []
+
+    def bloque():
+        with perfil.etapa("parseo_validacion"):
+            df, invalidas = parsear_lineas(lineas, archivos)
+        for archivo, _, motivo in invalidas:
+            print(f"⚠️ Fila en cuarentena de {archivo}: {motivo}")
+        perfil.contar("filas_cuarentena", len(invalidas))
+        if cuarentena is not None:
+            cuarentena.guardar(invalidas)
+        return df
+
+    for ruta_pdf, texto_estructurado in respuestas:
+        if isinstance(texto_estructurado, Exception):
+            print(f"❌ Error procesando {ruta_pdf}: {str(texto_estructurado)}")
+            perfil.contar("facturas_fallidas")
+            continue
+
+        if texto_estructurado.lower().strip() == "error":
+            print(f"❌ Error procesando {ruta_pdf}")
+            perfil.contar("facturas_fallidas")
+            continue
+
+        nuevas = lineas_csv(texto_estructurado)
+        lineas.extend(nuevas)
+        archivos.extend([ruta_pdf] * len(nuevas))
+        perfil.contar("facturas")
+
+        if len(lineas) >= tamaño:
+            df = bloque()
+            lineas, archivos = [], []
+            if len(df):
+                yield df
+
+    if lineas:
+        df = bloque()
+        if len(df):
+            yield df
+
+
+def agrupar_en_chunks(dataframes, tamaño=CHUNK_SIZE):
+    """Agrupa DataFrames pequeños en bloques de al menos `tamaño` filas.
+
+    Cada bloque se construye con un único pd.concat, en lugar de hacer crecer
+    un DataFrame factura a factura.
+    """
+    pendientes = []
+    filas = 0
+
+    for df in dataframes:
+        pendientes.append(df)
+        filas += len(df)
+
+        if filas >= tamaño:
+            with perfil.etapa("concat"):
+                bloque = pd.concat(pendientes, ignore_index=True)
+            yield bloque
+            pendientes = []
+            filas = 0
+
+    if pendientes:
+        with perfil.etapa("concat"):
+            bloque = pd.concat(pendientes, ignore_index=True)
+        yield bloque
+
+
+def convertir_monedas(df, conversor=None):
+    """Convierte los importes a COP con la tasa vigente en cada fecha.
+
+    Devuelve el DataFrame (con importe_original y moneda_original), las
+    facturas convertidas por moneda y las que no tenían tasa.
+    """
+    global _conversor
+    if conversor is None:
+        if _conversor is None:
+            _conversor = crear_conversor()
+        conversor = _conversor
+
+    with perfil.etapa("conversion_monedas"):
+        return conversor.convertir(df)
+
+
+_conversor = None
+
+
+class SinkSQLite:
+    """Escribe bloques de filas en la tabla facturas a medida que se completan.
+
+    Cada bloque se confirma por separado, así el progreso parcial sobrevive a
+    una interrupción. La escritura la hace AlmacenFacturas (upsert por clave
+    de factura); en modo incremental se delega en el manifiesto para
+    sustituir las filas de los archivos reprocesados. Con un registro de
+    trabajos, los archivos del bloque se marcan como guardados tras confirmarlo.
+    """
+
+    def __init__(self, engine, reemplazar=False, manifiesto=None, tabla="facturas", registro=None):
+        self.engine = engine
+        self.reemplazar = reemplazar
+        self.manifiesto = manifiesto
+        self.registro = registro
+        self.almacen = AlmacenFacturas(engine, tabla)
+        self.filas = 0
+
+    def escribir(self, df):
+        # Sólo el primer bloque reemplaza la tabla; los siguientes anexan
+        reemplazar = self.reemplazar and self.filas == 0
+
+        with perfil.etapa("escritura_db"):
+            if self.manifiesto is not None:
+                self.manifiesto.guardar(df, self.almacen, reemplazar=reemplazar)
+            else:
+                self.almacen.escribir(df, reemplazar=reemplazar)
+
+        self.filas += len(df)
+        if self.registro is not None:
+            self.registro.guardados(df["archivo"].unique())
+
+    def cerrar(self):
+        """Construye los índices que se dejaron para el final de la carga"""
+        if self.almacen.indices_pendientes:
+            with perfil.etapa("indices_db"):
+                self.almacen.crear_indices()
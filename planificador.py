@@ -0,0 +1,366 @@
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv(".env")
+
+# Modelo para solicitudes cortas y para las largas (vacío = MODEL_NAME)
+LLM_MODELO_RAPIDO = os.getenv("LLM_MODELO_RAPIDO") or None
+LLM_MODELO_FUERTE = os.getenv("LLM_MODELO_FUERTE") or None
+# Tokens estimados de la solicitud hasta los que se usa el modelo rápido (0 = no enrutar por tamaño)
+PLANIFICADOR_UMBRAL_TOKENS = int(os.getenv("PLANIFICADOR_UMBRAL_TOKENS", "0"))
+# Solicitudes simultáneas por modelo: "modelo:N,modelo:N" (sin entrada = sin límite)
+PLANIFICADOR_CONCURRENCIA = os.getenv("PLANIFICADOR_CONCURRENCIA", "")
+# Orden de reparto de los PDFs y de la cola cuando un modelo está lleno: recientes | antiguas | llegada
+PLANIFICADOR_PRIORIDAD = os.getenv("PLANIFICADOR_PRIORIDAD", "recientes").lower()
+# PDFs que se reordenan a la vez por prioridad antes de repartirlos (0 = todos)
+PLANIFICADOR_VENTANA = int(os.getenv("PLANIFICADOR_VENTANA", "1000"))
+# Por debajo de esta tasa de respuestas válidas para un proveedor, el
+# modelo preferido cede sus facturas al más preciso (tras PLANIFICADOR_MUESTRAS intentos)
+PLANIFICADOR_PRECISION_MINIMA = float(os.getenv("PLANIFICADOR_PRECISION_MINIMA", "0.8"))
+PLANIFICADOR_MUESTRAS = int(os.getenv("PLANIFICADOR_MUESTRAS", "5"))
+
+PRIORIDADES = ("recientes", "antiguas", "llegada")
+
+# Peso de la última latencia en la media móvil de cada modelo
+SUAVIZADO_LATENCIA = 0.2
+# Cada cuánto revisa su turno una solicitud asyncio en espera
+SONDEO_ASYNC = 0.01
+
+
+def leer_concurrencia(texto):
+    """{modelo: límite} desde "modelo:N,modelo:N"; un límite de 0 no limita"""
+    limites = {}
+    for entrada in filter(None, (parte.strip() for parte in texto.split(","))):
+        modelo, _, limite = entrada.rpartition(":")
+        if not modelo or not limite.isdigit():
+            raise ValueError(f"Entrada de PLANIFICADOR_CONCURRENCIA no válida: {entrada}")
+        limites[modelo] = int(limite)
+    return limites
+
+
+def _mtime(ruta, stats):
+    if stats and ruta in stats:
+        return stats[ruta][1]
+    try:
+        return os.path.getmtime(ruta)
+    except OSError:
+        return 0.0
+
+
+def priorizar(rutas, stats=None, prioridad=PLANIFICADOR_PRIORIDAD, ventana=PLANIFICADOR_VENTANA):
+    """Genera las rutas en orden de prioridad para repartirlas entre los workers.
+
+    Una cola de prioridad con hasta `ventana` rutas (0 = todas) delante de
+    los pools: con "recientes" sale antes el PDF modificado más tarde de
+    los que ya se han descubierto, sin esperar a recorrer la carpeta
+    entera. El mtime se toma de `stats` (el del descubrimiento) si está.
+    """
+    if prioridad == "llegada":
+        yield from rutas
+        return
+    if prioridad not in PRIORIDADES:
+        raise ValueError(f"Prioridad desconocida: {prioridad}")
+
+    signo = -1 if prioridad == "recientes" else 1
+    cola = []
+    for orden, ruta in enumerate(rutas):
+        heapq.heappush(cola, (signo * _mtime(ruta, stats), orden, ruta))
+        if ventana and len(cola) >= ventana:
+            yield heapq.heappop(cola)[2]
+    while cola:
+        yield heapq.heappop(cola)[2]
+
+
+def proveedor_de(archivo):
+    """Carpeta del PDF (./facturas/<proveedor>/...) o None; en un lote, la del primero"""
+    if not archivo:
+        return None
+    carpeta = os.path.basename(os.path.dirname(archivo.split("|", 1)[0]))
+    return carpeta or None
+
+
+class _Modelo:
+    """Cupo, salud y contadores de un modelo"""
+
+    def __init__(self, nombre, limite=0):
+        self.nombre = nombre
+        self.limite = limite
+        self.en_vuelo = 0
+        self.cola = []
+        self.latencia = None
+        self.solicitudes = 0
+        self.errores = 0
+        self.cortas = 0
+        self.largas = 0
+        self.espera = 0.0
+        self.primera = None
+        self.ultima = None
+
+    def libre(self):
+        return not self.limite or self.en_vuelo < self.limite
+
+
+class Turno:
+    """Una solicitud en el planificador: modelo asignado y momento de entrada"""
+
+    def __init__(self, clave, candidatos, corta, archivo):
+        self.clave = clave
+        self.candidatos = candidatos
+        self.corta = corta
+        self.archivo = archivo
+        self.modelo = None
+        self.cola = None
+        self.desde = time.monotonic()
+        self.inicio = None
+        self.liberado = False
+
+    def __lt__(self, otro):
+        return self.clave < otro.clave
+
+
+class Planificador:
+    """Elige el modelo de cada solicitud y reparte los cupos por modelo.
+
+    Las solicitudes de hasta `umbral_tokens` tokens estimados van al modelo
+    rápido y las demás al fuerte; si un proveedor (la carpeta del PDF) suele
+    dar respuestas inválidas con ese modelo, pasan al que mejor le responde.
+    Si el preferido tiene el circuito abierto o acaba de dar un 503, se
+    prueba el resto de modelos por latencia media. Cada modelo
+    admite como mucho `concurrencia[modelo]` solicitudes a la vez; las que
+    esperan salen por prioridad (por defecto los PDFs más recientes
+    primero), la misma con la que priorizar() reparte los PDFs. Sin umbral ni límites se comporta como antes: MODEL_NAME y,
+    si falla, FALLBACK_MODEL.
+    """
+
+    def __init__(self, primario, fallback=None, rapido=None, fuerte=None, umbral_tokens=0,
+                 concurrencia=None, prioridad="recientes", breakers=None,
+                 precision_minima=PLANIFICADOR_PRECISION_MINIMA, muestras=PLANIFICADOR_MUESTRAS):
+        if prioridad not in PRIORIDADES:
+            raise ValueError(f"Prioridad desconocida: {prioridad}")
+
+        self.primario = primario
+        self.fallback = fallback
+        self.rapido = rapido or primario
+        self.fuerte = fuerte or primario
+        self.umbral_tokens = umbral_tokens
+        self.prioridad = prioridad
+        self.breakers = breakers or {}
+        self.precision_minima = precision_minima
+        self.muestras = muestras
+
+        concurrencia = concurrencia or {}
+        nombres = dict.fromkeys(filter(None, [primario, fallback, self.rapido, self.fuerte]))
+        self.modelos = {nombre: _Modelo(nombre, concurrencia.get(nombre, 0)) for nombre in nombres}
+        # Sin límites nunca se forma cola y el orden de espera no importa
+        self._ordenar_cola = prioridad != "llegada" and any(m.limite for m in self.modelos.values())
+        # (modelo, proveedor) → (respuestas válidas, intentos)
+        self._precision = {}
+        self._secuencia = itertools.count()
+        self._lock = threading.Lock()
+        self._hay_cupo = threading.Condition(self._lock)
+
+    def _clave(self, archivo):
+        """Orden en la cola: menor sale antes"""
+        orden = next(self._secuencia)
+        if not self._ordenar_cola or not archivo:
+            return (0.0, orden)
+        try:
+            mtime = os.path.getmtime(archivo.split("|", 1)[0])
+        except OSError:
+            return (0.0, orden)
+        return (-mtime if self.prioridad == "recientes" else mtime, orden)
+
+    def precision(self, modelo, proveedor):
+        """Fracción de respuestas válidas de un modelo para un proveedor (None sin muestras suficientes)"""
+        aciertos, intentos = self._precision.get((modelo, proveedor), (0, 0))
+        if intentos < self.muestras:
+            return None
+        return aciertos / intentos
+
+    def _precision_o_uno(self, modelo, proveedor):
+        precision = self.precision(modelo, proveedor)
+        return 1.0 if precision is None else precision
+
+    def candidatos(self, tokens, archivo=None):
+        """(modelos en orden de preferencia, si la solicitud es corta)"""
+        corta = bool(self.umbral_tokens) and tokens <= self.umbral_tokens
+        if not self.umbral_tokens:
+            preferido = self.primario
+        else:
+            preferido = self.rapido if corta else self.fuerte
+
+        # El fallback configurado es la primera alternativa; después, los más rápidos
+        resto = [nombre for nombre in self.modelos if nombre != preferido]
+        resto.sort(key=lambda nombre: (
+            nombre != self.fallback, self.modelos[nombre].latencia or 0.0
+        ))
+        orden = [preferido] + resto
+
+        proveedor = proveedor_de(archivo)
+        precision = self.precision(preferido, proveedor) if proveedor else None
+        if precision is not None and precision < self.precision_minima:
+            # Los modelos sin historial para este proveedor se tratan como perfectos
+            orden.sort(key=lambda nombre: -self._precision_o_uno(nombre, proveedor))
+
+        return orden, corta
+
+    def _cerrado(self, nombre):
+        """Circuito sano, sin consumir la solicitud de prueba de uno semiabierto"""
+        breaker = self.breakers.get(nombre)
+        return breaker is None or breaker.estado == "cerrado"
+
+    def _sano(self, nombre):
+        breaker = self.breakers.get(nombre)
+        return breaker is None or breaker.permite()
+
+    def _esperar(self, turno, nombre):
+        """Deja el turno en la cola del modelo cuyo cupo espera"""
+        if turno.cola == nombre:
+            return False
+        self._salir_de_cola(turno)
+        turno.cola = nombre
+        heapq.heappush(self.modelos[nombre].cola, turno)
+        return False
+
+    def _salir_de_cola(self, turno):
+        if turno.cola is not None:
+            cola = self.modelos[turno.cola].cola
+            cola.remove(turno)
+            heapq.heapify(cola)
+            turno.cola = None
+            # El siguiente de esa cola puede tener ya cupo
+            self._hay_cupo.notify_all()
+
+    def _intentar(self, turno, evitar):
+        """Asigna un modelo al turno si puede (con el lock tomado); True si lo asignó.
+
+        Un modelo sano pero lleno no se cambia por otro: se espera su cupo en
+        cola, así los cupos también limitan el gasto en el modelo caro. Sólo
+        un circuito abierto o un 503 reciente desvían la solicitud.
+        """
+        # Nadie adelanta a una solicitud con más prioridad que espera el mismo modelo
+        def disponible(nombre):
+            modelo = self.modelos[nombre]
+            return modelo.libre() and (not modelo.cola or modelo.cola[0] is turno)
+
+        elegido = None
+        for nombre in turno.candidatos:
+            if nombre == evitar:
+                continue
+            if not disponible(nombre):
+                if self._cerrado(nombre):
+                    return self._esperar(turno, nombre)
+                continue
+            if self._sano(nombre):
+                elegido = nombre
+                break
+
+        if elegido is None:
+            # Sin alternativa sana se insiste con el preferido respetando su cupo;
+            # el modelo que acaba de dar un 503 sólo si es el único
+            elegido = next((nombre for nombre in turno.candidatos if nombre != evitar), turno.candidatos[0])
+            if not disponible(elegido):
+                return self._esperar(turno, elegido)
+
+        self._salir_de_cola(turno)
+        modelo = self.modelos[elegido]
+        modelo.en_vuelo += 1
+        modelo.espera += time.monotonic() - turno.desde
+        if turno.corta:
+            modelo.cortas += 1
+        else:
+            modelo.largas += 1
+        turno.modelo = elegido
+        turno.inicio = time.monotonic()
+        if modelo.primera is None:
+            modelo.primera = turno.inicio
+        return True
+
+    def _pedir(self, tokens, archivo):
+        candidatos, corta = self.candidatos(tokens, archivo)
+        return Turno(self._clave(archivo), candidatos, corta, archivo)
+
+    def ocupar(self, tokens, archivo=None, evitar=None):
+        """Bloquea hasta tener cupo y devuelve el Turno con el modelo asignado"""
+        turno = self._pedir(tokens, archivo)
+        with self._hay_cupo:
+            while not self._intentar(turno, evitar):
+                # Con espera limitada: un circuito puede pasar a semiabierto sin aviso
+                self._hay_cupo.wait(1.0)
+        return turno
+
+    async def ocupar_async(self, tokens, archivo=None, evitar=None):
+        """Igual que ocupar() pero cede el event loop mientras espera"""
+        turno = self._pedir(tokens, archivo)
+        with self._lock:
+            if self._intentar(turno, evitar):
+                return turno
+        try:
+            while True:
+                await asyncio.sleep(SONDEO_ASYNC)
+                with self._lock:
+                    if self._intentar(turno, evitar):
+                        return turno
+        except asyncio.CancelledError:
+            # Una tarea cancelada no puede quedarse bloqueando la cola
+            with self._lock:
+                self._salir_de_cola(turno)
+            raise
+
+    def liberar(self, turno, exito=True, valida=None):
+        """Devuelve el cupo del turno y registra su latencia y resultado.
+
+        `valida` indica si la respuesta sirvió (no era "error"); alimenta la
+        precisión del modelo para el proveedor del PDF. Liberar dos veces el
+        mismo turno no tiene efecto.
+        """
+        ahora = time.monotonic()
+        with self._hay_cupo:
+            if turno.liberado:
+                return
+            turno.liberado = True
+            modelo = self.modelos[turno.modelo]
+            modelo.en_vuelo -= 1
+            modelo.solicitudes += 1
+            modelo.ultima = ahora
+            if exito:
+                latencia = ahora - turno.inicio
+                if modelo.latencia is None:
+                    modelo.latencia = latencia
+                else:
+                    modelo.latencia += SUAVIZADO_LATENCIA * (latencia - modelo.latencia)
+            else:
+                modelo.errores += 1
+
+            proveedor = proveedor_de(turno.archivo)
+            if proveedor and valida is not None:
+                aciertos, intentos = self._precision.get((turno.modelo, proveedor), (0, 0))
+                self._precision[(turno.modelo, proveedor)] = (aciertos + valida, intentos + 1)
+
+            self._hay_cupo.notify_all()
+
+    def resumen(self):
+        """Por modelo: solicitudes, cortas/largas, errores, solicitudes/s, latencia media y espera en cola"""
+        filas = {}
+        with self._lock:
+            for nombre, modelo in self.modelos.items():
+                if not modelo.solicitudes:
+                    continue
+                segundos = max((modelo.ultima or 0.0) - (modelo.primera or 0.0), 1e-9)
+                asignadas = modelo.cortas + modelo.largas
+                filas[nombre] = {
+                    "solicitudes": modelo.solicitudes,
+                    "cortas": modelo.cortas,
+                    "largas": modelo.largas,
+                    "errores": modelo.errores,
+                    "por_segundo": modelo.solicitudes / segundos,
+                    "latencia_media": modelo.latencia or 0.0,
+                    "espera_media": modelo.espera / max(asignadas, 1),
+                    "limite": modelo.limite,
+                }
+        return filas
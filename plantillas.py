@@ -0,0 +1,145 @@
+import re
+import threading
+import time
+from datetime import datetime
+
+CABECERA_CSV = "fecha_factura;proveedor;concepto;importe;moneda"
+
+# Indicadores de moneda en el orden en que se comprueban (igual que el prompt)
+MONEDAS = [
+    ("euros", re.compile(r"EUR|€|euro", re.IGNORECASE)),
+    ("pesos", re.compile(r"COP|COL\$|peso", re.IGNORECASE)),
+    ("dolares", re.compile(r"USD|US\$|d[oó]lar", re.IGNORECASE)),
+]
+
+
+def normalizar_proveedor(nombre):
+    """Minúsculas y sin signos de puntuación, como pide el prompt"""
+    return re.sub(r"[^\w\s]", "", nombre.lower()).strip()
+
+
+def normalizar_importe(valor):
+    """Convierte '3.500.000', '1,234.56' o '150.00' al formato español sin miles"""
+    valor = re.sub(r"[^\d.,]", "", valor)
+    if not valor:
+        return None
+
+    # El último separador es decimal sólo si le siguen uno o dos dígitos
+    ultimo = max(valor.rfind("."), valor.rfind(","))
+    if ultimo != -1 and len(valor) - ultimo - 1 in (1, 2):
+        entero, decimales = valor[:ultimo], valor[ultimo + 1:]
+    else:
+        entero, decimales = valor, "00"
+
+    entero = re.sub(r"[.,]", "", entero) or "0"
+    return f"{int(entero)},{decimales.ljust(2, '0')}"
+
+
+def normalizar_fecha(fecha):
+    """Convierte fechas dd/mm/aaaa, dd-mm-aaaa o aaaa-mm-dd a dd/mm/aaaa"""
+    for formato in ("%d/%m/%Y", "%d-%m-%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(fecha.strip(), formato).strftime("%d/%m/%Y")
+        except ValueError:
+            continue
+    return None
+
+
+def detectar_moneda(texto):
+    for moneda, patron in MONEDAS:
+        if patron.search(texto):
+            return moneda
+    return "otros"
+
+
+class Plantilla:
+    """Extractor por expresiones regulares para un formato de factura conocido.
+
+    `huella` es la lista de marcadores que deben aparecer todos en el texto
+    para considerar que la factura tiene este formato. Cada campo es una
+    regex con un grupo de captura; la extracción sólo se acepta si todos los
+    campos se encuentran y se pueden normalizar.
+    """
+
+    def __init__(self, nombre, huella, fecha, proveedor, concepto, importe, moneda=None):
+        self.nombre = nombre
+        self.huella = huella
+        self.patrones = {
+            "fecha_factura": re.compile(fecha, re.MULTILINE),
+            "proveedor": re.compile(proveedor, re.MULTILINE),
+            "concepto": re.compile(concepto, re.MULTILINE),
+            "importe": re.compile(importe, re.MULTILINE),
+        }
+        self.patron_moneda = re.compile(moneda, re.MULTILINE) if moneda else None
+
+    def coincide(self, texto):
+        return all(marcador in texto for marcador in self.huella)
+
+    def extraer(self, texto):
+        """Devuelve el CSV de la factura o None si algún campo no es fiable"""
+        valores = {}
+        for campo, patron in self.patrones.items():
+            encontrado = patron.search(texto)
+            if not encontrado:
+                return None
+            valores[campo] = encontrado.group(1).strip()
+
+        fecha = normalizar_fecha(valores["fecha_factura"])
+        importe = normalizar_importe(valores["importe"])
+        proveedor = normalizar_proveedor(valores["proveedor"])
+        concepto = valores["concepto"].replace(";", ",")
+
+        zona_moneda = texto
+        if self.patron_moneda:
+            encontrado = self.patron_moneda.search(texto)
+            zona_moneda = encontrado.group(1) if encontrado else ""
+        moneda = detectar_moneda(zona_moneda)
+
+        if not (fecha and importe and proveedor and concepto) or moneda == "otros":
+            return None
+
+        return f"{CABECERA_CSV}\n{fecha};{proveedor};{concepto};{importe};{moneda}"
+
+
+PLANTILLAS = []
+
+# Contadores de uso de las plantillas en la ejecución actual
+estadisticas = {"intentos": 0, "aciertos": 0, "segundos": 0.0}
+_lock = threading.Lock()
+
+
+def registrar_plantilla(plantilla):
+    """Añade una plantilla al registro (se prueban en orden de registro)"""
+    PLANTILLAS.append(plantilla)
+    return plantilla
+
+
+def extraer_con_plantillas(texto):
+    """Intenta estructurar el texto sin LLM; devuelve el CSV o None"""
+    inicio = time.perf_counter()
+    csv_plantilla = None
+
+    for plantilla in PLANTILLAS:
+        if plantilla.coincide(texto):
+            csv_plantilla = plantilla.extraer(texto)
+            if csv_plantilla is not None:
+                break
+
+    with _lock:
+        estadisticas["intentos"] += 1
+        estadisticas["aciertos"] += csv_plantilla is not None
+        estadisticas["segundos"] += time.perf_counter() - inicio
+
+    return csv_plantilla
+
+
+# Formato de las facturas generadas por setup_demo.crear_pdf_factura
+registrar_plantilla(Plantilla(
+    nombre="factura_electronica_demo",
+    huella=["FACTURA ELECTRÓNICA", "DATOS DEL EMISOR:", "Empresa:", "NIT/ID:", "VALOR TOTAL:"],
+    fecha=r"^Fecha de emisión:\s*(\S+)",
+    proveedor=r"^Empresa:\s*(.+)$",
+    concepto=r"^Descripción:\s*(.+)$",
+    importe=r"^VALOR TOTAL:\s*\D*?([\d.,]+)",
+    moneda=r"^(VALOR TOTAL:.*)$",
+))
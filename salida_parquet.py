@@ -0,0 +1,164 @@
+import os
+import shutil
+import uuid
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from almacen import fechas_iso
+from perfilado import perfil
+
+# Carpeta del dataset y máximo de filas por archivo Parquet
+PARQUET_DIR = os.getenv("PARQUET_DIR", "facturas_parquet")
+PARQUET_FILAS_POR_ARCHIVO = int(os.getenv("PARQUET_FILAS_POR_ARCHIVO", "100000"))
+PARQUET_COMPRESION = os.getenv("PARQUET_COMPRESION", "zstd")
+
+ESQUEMA = pa.schema([
+    ("fecha_factura", pa.date32()),
+    ("proveedor", pa.dictionary(pa.int32(), pa.string())),
+    ("concepto", pa.string()),
+    ("importe", pa.float64()),
+    ("moneda", pa.dictionary(pa.int32(), pa.string())),
+    ("importe_original", pa.float64()),
+    ("moneda_original", pa.dictionary(pa.int32(), pa.string())),
+    ("archivo", pa.string()),
+    ("anio", pa.int16()),
+    ("mes", pa.int8()),
+])
+
+PARTICIONES = ds.partitioning(
+    pa.schema([("anio", pa.int16()), ("mes", pa.int8())]), flavor="hive"
+)
+
+
+def _columna(df, nombre):
+    if nombre not in df.columns:
+        return [None] * len(df)
+    serie = df[nombre]
+    return serie.astype(object).where(serie.notna(), None).tolist()
+
+
+class SinkParquet:
+    """Escribe las facturas en un dataset Parquet particionado por año y mes.
+
+    Cada bloque se escribe al llegar en archivos nuevos dentro de
+    anio=AAAA/mes=M y sólo entonces se marcan sus PDFs en el manifiesto y
+    en el registro de trabajos, así una caída no pierde lo ya confirmado.
+    Como en SQLite, las filas de un PDF que se vuelve a procesar sustituyen
+    a las anteriores: sólo se reescriben los archivos Parquet que tenían
+    filas suyas, el resto del dataset no se toca. proveedor y moneda van
+    codificados como diccionario, que es lo que más reduce el tamaño y el
+    tiempo de escaneo.
+    """
+
+    def __init__(self, ruta=PARQUET_DIR, reemplazar=False, manifiesto=None,
+                 filas_por_archivo=PARQUET_FILAS_POR_ARCHIVO, registro=None):
+        self.ruta = ruta
+        self.manifiesto = manifiesto
+        self.registro = registro
+        self.filas_por_archivo = filas_por_archivo
+        self.filas = 0
+        self._por_archivo = None
+        self._ejecucion = uuid.uuid4().hex[:12]
+        self._tandas = 0
+        self._formato = ds.ParquetFileFormat().make_write_options(
+            compression=PARQUET_COMPRESION,
+            use_dictionary=["proveedor", "moneda", "moneda_original"],
+        )
+
+        if reemplazar and os.path.isdir(ruta):
+            shutil.rmtree(ruta)
+
+    def escribir(self, df):
+        if df.empty:
+            return
+
+        archivos = list(df["archivo"].dropna().unique()) if "archivo" in df.columns else []
+        escritos = []
+
+        with perfil.etapa("escritura_parquet"):
+            # Todas las filas de un PDF llegan en el mismo bloque: las anteriores sobran
+            self._quitar_anteriores(archivos)
+
+            # Nombres únicos por ejecución y bloque: nunca se pisa un archivo existente
+            ds.write_dataset(
+                self._tabla(df),
+                self.ruta,
+                format="parquet",
+                partitioning=PARTICIONES,
+                basename_template=f"parte-{self._ejecucion}-{self._tandas:04d}-{{i}}.parquet",
+                existing_data_behavior="overwrite_or_ignore",
+                file_options=self._formato,
+                max_rows_per_file=self.filas_por_archivo,
+                max_rows_per_group=self.filas_por_archivo,
+                file_visitor=lambda escrito: escritos.append(escrito.path),
+            )
+        self._tandas += 1
+        self.filas += len(df)
+
+        for ruta_parte in escritos:
+            for archivo in self._archivos_de(ruta_parte):
+                self._por_archivo.setdefault(archivo, set()).add(ruta_parte)
+
+        if self.manifiesto is not None and archivos:
+            self.manifiesto.marcar_procesados(archivos)
+        if self.registro is not None and archivos:
+            self.registro.guardados(archivos)
+
+    @staticmethod
+    def _archivos_de(ruta_parte):
+        columna = pq.read_table(ruta_parte, columns=["archivo"], partitioning=None).column("archivo")
+        return [archivo for archivo in pc.unique(columna).to_pylist() if archivo is not None]
+
+    def _indice(self):
+        """{PDF: archivos Parquet con filas suyas}; se lee del disco la primera vez"""
+        if self._por_archivo is None:
+            self._por_archivo = {}
+            if os.path.isdir(self.ruta):
+                for ruta_parte in ds.dataset(self.ruta, format="parquet", partitioning=PARTICIONES).files:
+                    for archivo in self._archivos_de(ruta_parte):
+                        self._por_archivo.setdefault(archivo, set()).add(ruta_parte)
+        return self._por_archivo
+
+    def _quitar_anteriores(self, archivos):
+        """Reescribe sin las filas de esos PDFs los archivos Parquet que las contienen"""
+        indice = self._indice()
+        afectadas = set()
+        for archivo in archivos:
+            afectadas |= indice.pop(archivo, set())
+        if not afectadas:
+            return
+
+        quitar = pa.array(archivos, pa.string())
+        for ruta_parte in afectadas:
+            tabla = pq.read_table(ruta_parte, partitioning=None)
+            resto = tabla.filter(pc.invert(pc.is_in(tabla["archivo"], value_set=quitar)))
+            if resto.num_rows == 0:
+                os.remove(ruta_parte)
+                continue
+
+            # Se escribe aparte (con "_" delante no forma parte del dataset) y se cambia de un golpe
+            carpeta, nombre = os.path.split(ruta_parte)
+            temporal = os.path.join(carpeta, f"_{nombre}")
+            pq.write_table(resto, temporal, compression=PARQUET_COMPRESION,
+                           use_dictionary=["proveedor", "moneda", "moneda_original"])
+            os.replace(temporal, ruta_parte)
+
+    def _tabla(self, df):
+        fechas = fechas_iso(df["fecha_factura"])
+        return pa.table({
+            "fecha_factura": pa.array(fechas, pa.string()).cast(pa.date32()),
+            "proveedor": pa.array(_columna(df, "proveedor"), pa.string()).dictionary_encode(),
+            "concepto": pa.array(_columna(df, "concepto"), pa.string()),
+            "importe": pa.array(pd.to_numeric(df["importe"], errors="coerce"), pa.float64()),
+            "moneda": pa.array(_columna(df, "moneda"), pa.string()).dictionary_encode(),
+            "importe_original": pa.array(_columna(df, "importe_original"), pa.float64()),
+            "moneda_original": pa.array(_columna(df, "moneda_original"), pa.string()).dictionary_encode(),
+            "archivo": pa.array(_columna(df, "archivo"), pa.string()),
+            "anio": pa.array([int(fecha[:4]) if fecha else None for fecha in fechas], pa.int16()),
+            "mes": pa.array([int(fecha[5:7]) if fecha else None for fecha in fechas], pa.int8()),
+        }, schema=ESQUEMA)
+
+    def cerrar(self):
+        """Nada que escribir: cada bloque se confirma en escribir()"""
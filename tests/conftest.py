@@ -0,0 +1,33 @@
+import os
+import sys
+
+# La configuración se lee al importar los módulos: backend simulado sin
+# latencia ni errores, y sin escribir métricas ni cachés
+os.environ["LLM_BACKEND"] = "mock"
+os.environ["MOCK_LATENCIA"] = "0"
+os.environ["MOCK_TASA_503"] = "0"
+os.environ["MOCK_TASA_429"] = "0"
+os.environ["LLM_METRICS_SINKS"] = ""
+os.environ["PLANIFICADOR_CONCURRENCIA"] = ""
+os.environ["OCR_ACTIVO"] = "false"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+from almacen import crear_engine  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def directorio_temporal(tmp_path_factory):
+    """Los archivos que generan las pruebas (facturas.db, cachés...) quedan fuera del repo"""
+    anterior = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("trabajo"))
+    yield
+    os.chdir(anterior)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = crear_engine(str(tmp_path / "facturas.db"))
+    yield engine
+    engine.dispose()
@@ -0,0 +1,76 @@
+import pandas as pd
+from sqlalchemy import text
+from almacen import AlmacenFacturas
+
+
+def facturas(*filas):
+    return pd.DataFrame(filas, columns=["fecha_factura", "proveedor", "concepto", "importe", "archivo"])
+
+
+def leer(engine):
+    return pd.read_sql(text("SELECT * FROM facturas ORDER BY id"), engine)
+
+
+def test_upsert_no_duplica_al_recargar(engine):
+    almacen = AlmacenFacturas(engine)
+    df = facturas(
+        ("10/01/2024", "acme", "hosting", 20.0, "a.pdf"),
+        ("11/01/2024", "acme", "soporte", 35.0, "a.pdf"),
+    )
+    almacen.escribir(df)
+    almacen.escribir(df)
+    # La clave usa el importe original: convertir con otra tasa actualiza la fila
+    almacen.escribir(df.assign(importe=[90000.0, 157500.0], importe_original=[20.0, 35.0],
+                               moneda_original="dolares"))
+
+    tabla = leer(engine)
+    assert len(tabla) == 2
+    assert tabla["importe"].tolist() == [90000.0, 157500.0]
+    assert tabla["fecha_factura"].tolist() == ["2024-01-10", "2024-01-11"]
+
+
+def test_lineas_identicas_no_se_fusionan(engine):
+    fila = ("10/01/2024", "acme", "licencia", 20.0)
+    AlmacenFacturas(engine).escribir(facturas((*fila, "a.pdf"), (*fila, "a.pdf"), (*fila, "b.pdf")))
+
+    tabla = leer(engine)
+    assert len(tabla) == 3
+    assert tabla[["archivo", "linea"]].values.tolist() == [["a.pdf", 0], ["a.pdf", 1], ["b.pdf", 0]]
+
+
+def test_migra_tabla_antigua_sin_deduplicar(engine):
+    fila = ("10/01/2024", "acme", "licencia", 20.0)
+    antigua = facturas((*fila, "a.pdf"), (*fila, "a.pdf"), ("12/01/2024", "beta", "x", 5.0, None))
+    antigua.to_sql("facturas", engine, index=False)
+
+    almacen = AlmacenFacturas(engine)
+    almacen.escribir(antigua.iloc[:0])
+
+    tabla = leer(engine)
+    assert len(tabla) == 3
+    assert tabla["clave"].is_unique
+    assert tabla["linea"].tolist() == [0, 1, 0]
+
+    # Recargar tras migrar actualiza las mismas filas
+    almacen.escribir(antigua.iloc[:2])
+    assert len(leer(engine)) == 3
+
+
+def test_migra_clave_sin_archivo_ni_linea(engine):
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE facturas (
+                id INTEGER PRIMARY KEY, clave INTEGER NOT NULL UNIQUE, fecha_factura DATE,
+                proveedor TEXT, concepto TEXT, importe REAL, archivo TEXT,
+                importe_original REAL, moneda_original TEXT
+            )
+        """))
+        conn.execute(text(
+            "INSERT INTO facturas VALUES (1, 42, '2024-01-10', 'acme', 'hosting', 20.0, 'a.pdf', 20.0, 'pesos')"
+        ))
+
+    AlmacenFacturas(engine).escribir(facturas(("10/01/2024", "acme", "hosting", 20.0, "a.pdf")))
+
+    tabla = leer(engine)
+    assert len(tabla) == 1
+    assert tabla.loc[0, "clave"] != 42
@@ -0,0 +1,63 @@
+import asyncio
+import pytest
+import funciones
+
+FACTURA = """Empresa: Servicios Web SAS
+Fecha: 10/01/2024
+Descripción: Hosting anual
+TOTAL: 1.428.000 COP
+"""
+
+
+@pytest.fixture(autouse=True)
+def sin_plantillas_ni_cache(monkeypatch):
+    monkeypatch.setattr(funciones, "usar_plantillas", False)
+    monkeypatch.setattr(funciones, "llm_cache", None)
+
+
+@pytest.fixture
+def streams_cerrados(monkeypatch):
+    cerrados = []
+    original = funciones.backend.cerrar_stream
+
+    async def cerrar_stream(respuesta, fragmentos):
+        cerrados.append(respuesta)
+        await original(respuesta, fragmentos)
+
+    monkeypatch.setattr(funciones.backend, "cerrar_stream", cerrar_stream)
+    return cerrados
+
+
+def en_vuelo():
+    return sum(modelo.en_vuelo for modelo in funciones.planificador.modelos.values())
+
+
+def test_estructura_en_streaming(streams_cerrados):
+    csv = asyncio.run(funciones.estructurar_texto_async(FACTURA, "a.pdf"))
+
+    assert csv.splitlines()[1] == "10/01/2024;servicios web sas;Hosting anual;1428000,00;pesos"
+    assert len(streams_cerrados) == 1
+    assert en_vuelo() == 0
+
+
+def test_respuesta_error_cierra_el_stream(streams_cerrados):
+    assert asyncio.run(funciones.estructurar_texto_async("texto sin datos de factura")) == "error"
+
+    assert len(streams_cerrados) == 1
+    assert en_vuelo() == 0
+
+
+def test_cancelar_devuelve_el_turno(monkeypatch):
+    monkeypatch.setattr(funciones.backend, "latencia", 5.0)
+    monkeypatch.setattr(funciones.backend, "jitter", 0.0)
+
+    async def escenario():
+        tarea = asyncio.create_task(funciones.estructurar_texto_async(FACTURA))
+        await asyncio.sleep(0.1)
+        assert en_vuelo() == 1
+        tarea.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await tarea
+
+    asyncio.run(escenario())
+    assert en_vuelo() == 0
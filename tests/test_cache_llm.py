@@ -0,0 +1,49 @@
+from cache_llm import LLMCache
+
+CONFIG = ("instrucciones", 0.1, 1024)
+CSV = "fecha_factura;proveedor;concepto;importe;moneda\n10/01/2024;acme;hosting;20,00;dolares"
+
+
+def test_fallo_y_acierto(tmp_path):
+    cache = LLMCache(str(tmp_path / "cache.db"), CONFIG)
+
+    assert cache.obtener("texto", ["primario"]) is None
+    cache.guardar("texto", CSV, "primario")
+
+    assert cache.obtener("texto", ["primario"]) == (CSV, "primario")
+    assert cache.obtener("otro texto", ["primario"]) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_clave_incluye_modelo_y_modo(tmp_path):
+    cache = LLMCache(str(tmp_path / "cache.db"), CONFIG)
+    cache.guardar("texto", CSV, "fallback")
+
+    # Sólo se acepta la respuesta de un modelo configurado y del mismo modo
+    assert cache.obtener("texto", ["primario"]) is None
+    assert cache.obtener("texto", ["primario", "fallback"], "lote") is None
+    assert cache.obtener("texto", ["primario", "fallback"]) == (CSV, "fallback")
+
+
+def test_prefiere_el_primer_modelo(tmp_path):
+    cache = LLMCache(str(tmp_path / "cache.db"), CONFIG)
+    cache.guardar("texto", CSV + " fallback", "fallback")
+    cache.guardar("texto", CSV, "primario")
+
+    assert cache.obtener("texto", ["primario", "fallback"]) == (CSV, "primario")
+
+
+def test_cambiar_la_configuracion_invalida(tmp_path):
+    ruta = str(tmp_path / "cache.db")
+    LLMCache(ruta, CONFIG).guardar("texto", CSV, "primario")
+
+    assert LLMCache(ruta, CONFIG).obtener("texto", ["primario"]) == (CSV, "primario")
+    assert LLMCache(ruta, ("otras instrucciones", 0.1, 1024)).obtener("texto", ["primario"]) is None
+
+
+def test_refrescar_ignora_las_entradas(tmp_path):
+    cache = LLMCache(str(tmp_path / "cache.db"), CONFIG)
+    cache.guardar("texto", CSV, "primario")
+    cache.refrescar = True
+
+    assert cache.obtener("texto", ["primario"]) is None
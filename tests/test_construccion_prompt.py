@@ -0,0 +1,63 @@
+import pytest
+from construccion_prompt import ConstructorPrompt, contar_tokens, recortar_texto
+
+FACTURA = "\n".join(
+    ["ACME SAS", "NIT 900.123.456-7", "Fecha: 10/01/2024"]
+    + [f"Lorem ipsum dolor sit amet adipiscing elit {chr(97 + i % 26)}{chr(97 + i // 26)}" for i in range(60)]
+    + ["Hosting anual 1.200.000", "TOTAL A PAGAR: 1.428.000 COP"]
+)
+
+
+def test_cuenta_digitos_y_signos():
+    assert contar_tokens("1.428.000") > contar_tokens("hosting")
+    assert contar_tokens("") == 1
+
+
+def test_recorte_conserva_totales_importes_y_emisor():
+    recortado = recortar_texto(FACTURA, 120)
+    lineas = recortado.splitlines()
+
+    assert contar_tokens(recortado) <= 120 + len(lineas)
+    assert lineas[0] == "ACME SAS"
+    assert "NIT 900.123.456-7" in lineas
+    assert "Hosting anual 1.200.000" in lineas
+    assert lineas[-1] == "TOTAL A PAGAR: 1.428.000 COP"
+    assert len(lineas) < FACTURA.count("\n") + 1
+
+
+def test_quita_espacios_y_lineas_repetidas():
+    assert recortar_texto("a   b\n\n\na b\nc", 1000) == "a b\nc"
+
+
+def test_sin_presupuesto_no_recorta():
+    constructor = ConstructorPrompt(presupuesto=0)
+
+    assert constructor.recortar(FACTURA) == (FACTURA, contar_tokens(FACTURA))
+
+
+def test_texto_que_cabe_va_sin_tocar():
+    constructor = ConstructorPrompt(presupuesto=10000)
+
+    assert constructor.recortar(FACTURA)[0] == FACTURA
+
+
+def test_con_presupuesto_se_recorta_y_se_mide():
+    constructor = ConstructorPrompt(presupuesto=120)
+    texto, tokens_original = constructor.recortar(FACTURA)
+
+    assert tokens_original == contar_tokens(FACTURA)
+    assert "TOTAL A PAGAR" in texto
+    _, (original, enviado) = constructor.individual(texto, tokens_original)
+    assert enviado < original
+
+
+def test_lote_numera_los_documentos():
+    prompt, ids, _ = ConstructorPrompt().lote(["uno", "dos"])
+
+    assert ids == ["1", "2"]
+    assert "<<<DOCUMENTO 2>>>\ndos\n<<<FIN DOCUMENTO 2>>>" in prompt
+
+
+def test_variante_desconocida():
+    with pytest.raises(ValueError):
+        ConstructorPrompt("breve")
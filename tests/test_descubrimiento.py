@@ -0,0 +1,52 @@
+import os
+import pytest
+from descubrimiento import Descubrimiento, patrones
+
+
+@pytest.fixture
+def raiz(tmp_path):
+    for relativa in ["a.pdf", "B.PDF", "notas.txt", "2023/c.pdf", "2023/enero/d.pdf",
+                     "2019/viejo.pdf", "borradores/e.pdf"]:
+        ruta = tmp_path / relativa
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        ruta.write_bytes(b"%PDF-1.4 " + relativa.encode())
+    return tmp_path
+
+
+def relativas(descubrimiento, raiz):
+    return sorted(os.path.relpath(ruta, raiz).replace(os.sep, "/") for ruta in descubrimiento)
+
+
+def test_recorre_todas_las_subcarpetas(raiz):
+    descubrimiento = Descubrimiento(str(raiz), profundidad=0, incluir=["*.pdf"], excluir=[], hilos=2)
+
+    assert relativas(descubrimiento, raiz) == [
+        "2019/viejo.pdf", "2023/c.pdf", "2023/enero/d.pdf", "B.PDF", "a.pdf", "borradores/e.pdf"]
+    assert descubrimiento.descartados == 1
+    assert descubrimiento.carpetas == 5
+
+
+def test_limita_la_profundidad(raiz):
+    assert relativas(Descubrimiento(str(raiz), profundidad=1, incluir=["*.pdf"], excluir=[]), raiz) == [
+        "B.PDF", "a.pdf"]
+    assert "2023/enero/d.pdf" not in relativas(
+        Descubrimiento(str(raiz), profundidad=2, incluir=["*.pdf"], excluir=[]), raiz)
+
+
+def test_excluir_no_lee_la_carpeta(raiz):
+    descubrimiento = Descubrimiento(str(raiz), profundidad=0, incluir=["*.pdf"], excluir=["2019/*", "borradores"])
+
+    assert relativas(descubrimiento, raiz) == ["2023/c.pdf", "2023/enero/d.pdf", "B.PDF", "a.pdf"]
+    assert descubrimiento.carpetas == 3
+
+
+def test_incluir_por_carpeta_y_stats(raiz):
+    descubrimiento = Descubrimiento(str(raiz), profundidad=0, incluir=["2023/*"], excluir=[])
+    rutas = list(descubrimiento)
+
+    assert relativas(rutas, raiz) == ["2023/c.pdf", "2023/enero/d.pdf"]
+    assert all(descubrimiento.stats[ruta][0] == os.path.getsize(ruta) for ruta in rutas)
+
+
+def test_patrones():
+    assert patrones(" *.pdf, ,2019/* ") == ["*.pdf", "2019/*"]
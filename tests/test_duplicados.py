@@ -0,0 +1,47 @@
+from duplicados import Deduplicador
+
+FACTURA = """FACTURA N° 1042
+Empresa: Servicios Web SAS
+Fecha: 10/01/2024
+Descripción: Hosting anual del sitio corporativo con soporte técnico incluido
+Subtotal: 1.200.000
+IVA: 228.000
+TOTAL: 1.428.000 COP
+"""
+
+
+def test_texto_identico_es_duplicado(engine):
+    deduplicador = Deduplicador(engine)
+
+    assert deduplicador.comprobar("a.pdf", FACTURA) is None
+    duplicado = deduplicador.comprobar("copia.pdf", FACTURA)
+
+    assert duplicado.original == "a.pdf"
+    assert duplicado.similitud == 1.0
+
+
+def test_reexportado_con_otro_formato_es_duplicado(engine):
+    deduplicador = Deduplicador(engine)
+    deduplicador.comprobar("a.pdf", FACTURA)
+
+    reexportado = "  " + FACTURA.upper().replace("\n", "\n\n")
+    assert deduplicador.comprobar("b.pdf", reexportado).original == "a.pdf"
+
+
+def test_otras_cifras_no_son_duplicado(engine):
+    deduplicador = Deduplicador(engine)
+    deduplicador.comprobar("a.pdf", FACTURA)
+
+    otra = FACTURA.replace("1042", "1043").replace("1.428.000", "1.528.000")
+    assert deduplicador.comprobar("b.pdf", otra) is None
+
+
+def test_el_indice_persiste(engine):
+    primero = Deduplicador(engine)
+    primero.comprobar("a.pdf", FACTURA)
+    primero.comprobar("b.pdf", FACTURA.replace("1042", "2042"))
+    primero.volcar()
+
+    nuevo = Deduplicador(engine)
+    assert len(nuevo) == 2
+    assert nuevo.comprobar("c.pdf", FACTURA).original == "a.pdf"
@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+import fitz  # PyMuPDF
+from extraccion import PoolExtraccion
+from lectura_pdf import extraer_texto_documento, iterar_paginas
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def documento(*paginas):
+    doc = fitz.open()
+    for lineas in paginas:
+        page = doc.new_page()
+        for i, linea in enumerate(lineas):
+            page.insert_text((72, 72 + 14 * i), linea)
+    return doc
+
+
+def test_quita_cabeceras_repetidas():
+    doc = documento(["ACME SAS", "Factura 1", "Hosting"], ["ACME SAS", "Soporte", "TOTAL: 10"])
+
+    paginas = list(iterar_paginas(doc))
+    assert "ACME SAS" in paginas[0]
+    assert "ACME SAS" not in paginas[1]
+    assert "Soporte" in paginas[1]
+
+
+def test_limites_de_paginas_y_total():
+    doc = documento(["Hosting"], ["Total a pagar: 10"], ["Anexo"])
+
+    assert extraer_texto_documento(doc, max_pages=1)[1] == 1
+    assert extraer_texto_documento(doc, parar_en_total=True)[1] == 2
+    assert extraer_texto_documento(doc)[1] == 3
+
+
+def test_pool_extrae_desde_disco(tmp_path):
+    ruta = str(tmp_path / "a.pdf")
+    doc = documento(["ACME SAS", "TOTAL: 10"])
+    doc.save(ruta)
+    doc.close()
+
+    with PoolExtraccion(1) as pool:
+        [(ruta_pdf, texto, paginas)] = list(pool.extraer([ruta]))
+    assert ruta_pdf == ruta
+    assert paginas == 1
+    assert "ACME SAS" in texto
+
+
+def test_los_workers_no_importan_funciones():
+    codigo = "import sys, extraccion; print(sorted({'funciones', 'llm_backend', 'metricas'} & set(sys.modules)))"
+    salida = subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ, capture_output=True, text=True, check=True)
+
+    assert salida.stdout.strip() == "[]"
@@ -0,0 +1,71 @@
+import time
+from limitador import CircuitBreaker, RateLimiter
+
+
+def test_sin_limites_no_espera():
+    limitador = RateLimiter()
+
+    assert all(limitador._reservar(10**6) == 0.0 for _ in range(100))
+
+
+def test_rpm_agota_el_cubo():
+    limitador = RateLimiter(rpm=2)
+
+    assert limitador._reservar(0) == 0.0
+    assert limitador._reservar(0) == 0.0
+    # La tercera solicitud del minuto espera ~30 s (una recarga a 2 por minuto)
+    assert 25 < limitador._reservar(0) <= 30
+
+
+def test_tpm_limita_por_tokens():
+    limitador = RateLimiter(tpm=1000)
+
+    assert limitador._reservar(800) == 0.0
+    assert limitador._reservar(800) > 0
+    # Una solicitud mayor que el TPM completo cuenta como el TPM entero
+    assert RateLimiter(tpm=1000)._reservar(5000) == 0.0
+
+
+def test_throttle_reduce_el_ritmo_y_pausa_a_todos():
+    limitador = RateLimiter(rpm=60, factor_minimo=0.25, pausa_base=1.0)
+
+    assert limitador.registrar_throttle() == 1.0
+    assert limitador.factor == 0.5
+    assert limitador._reservar(0) > 0.5
+    assert limitador.registrar_throttle() == 2.0
+    limitador.registrar_throttle()
+    assert limitador.factor == 0.25
+    assert limitador.throttles == 3
+
+    limitador.registrar_exito()
+    assert limitador.factor == 0.3
+
+
+def test_circuito_se_abre_tras_fallos_seguidos():
+    breaker = CircuitBreaker("modelo", fallos_para_abrir=2, apertura=60)
+
+    assert breaker.registrar_fallo() is False
+    assert breaker.registrar_fallo() is True
+    assert breaker.estado == "abierto"
+    assert not breaker.permite()
+
+
+def test_semiabierto_deja_pasar_una_sonda():
+    breaker = CircuitBreaker("modelo", fallos_para_abrir=1, apertura=0.05, apertura_maxima=1)
+    breaker.registrar_fallo()
+    time.sleep(0.06)
+
+    assert breaker.permite()
+    assert breaker.estado == "semiabierto"
+    assert not breaker.permite()
+
+    # La sonda falla: se reabre con el doble de espera
+    assert breaker.registrar_fallo() is True
+    assert breaker._apertura == 0.1
+    assert not breaker.permite()
+
+    time.sleep(0.11)
+    assert breaker.permite()
+    breaker.registrar_exito()
+    assert breaker.estado == "cerrado"
+    assert breaker._apertura == 0.05
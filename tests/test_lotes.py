@@ -0,0 +1,42 @@
+import pytest
+import funciones
+from limitador import CircuitBreaker
+from llm_backend import BackendMock
+
+FACTURAS = [
+    f"Empresa: Proveedor {i} SAS\nFecha: 1{i}/01/2024\nDescripción: Servicio {i}\nTOTAL: {i}00.000 COP\n"
+    for i in range(1, 5)
+]
+
+
+@pytest.fixture(autouse=True)
+def sin_plantillas_ni_cache(monkeypatch):
+    monkeypatch.setattr(funciones, "usar_plantillas", False)
+    monkeypatch.setattr(funciones, "llm_cache", None)
+
+
+@pytest.fixture
+def caido(monkeypatch):
+    """Backend que siempre responde 503, sin esperas de backoff y con circuitos nuevos"""
+    backend = BackendMock(latencia=0, jitter=0, tasa_503=1.0, semilla=1)
+    monkeypatch.setattr(funciones, "backend", backend)
+    monkeypatch.setattr(funciones.time, "sleep", lambda segundos: None)
+    for modelo in funciones.MODELOS:
+        monkeypatch.setitem(funciones.breakers, modelo, CircuitBreaker(modelo))
+    return backend
+
+
+def test_lote_estructura_cada_factura():
+    resultados = funciones.estructurar_lote(FACTURAS)
+
+    assert len(resultados) == len(FACTURAS)
+    for i, csv in enumerate(resultados, 1):
+        assert f"proveedor {i} sas" in csv.splitlines()[1]
+
+
+def test_lote_caido_no_se_divide(caido):
+    resultados = funciones.estructurar_lote(FACTURAS)
+
+    assert resultados == ["error"] * len(FACTURAS)
+    # Una sola solicitud de lote con sus reintentos, sin repetirla por mitades
+    assert caido.llamadas <= funciones.LLM_RETRIES
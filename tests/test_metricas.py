@@ -0,0 +1,67 @@
+import csv
+import logging
+import os
+import subprocess
+import sys
+from metricas import CAMPOS, Metricas, SinkCSV
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Sink:
+    """Guarda en memoria los lotes volcados"""
+
+    def __init__(self):
+        self.registros = []
+
+    def escribir(self, registros):
+        self.registros.extend(registros)
+
+
+def test_sin_sinks_solo_agrega():
+    metricas = Metricas()
+    metricas.registrar("modelo", 10, 5, 15, latencia=0.5)
+    metricas.registrar("modelo", 0, 0, 0, success=False)
+    metricas.registrar("modelo", cache="hit")
+
+    assert metricas._hilo is None
+    fila = metricas.resumen()["modelo"]
+    assert fila["llamadas"] == 2
+    assert fila["tasa_error"] == 0.5
+    assert fila["tokens"] == 15
+
+
+def test_volcado_en_los_sinks(tmp_path):
+    ruta = str(tmp_path / "llm_usage.csv")
+    metricas = Metricas(intervalo=60)
+    metricas.conectar([SinkCSV(ruta)])
+    metricas.registrar("modelo", 10, 5, 15, archivo="a.pdf")
+    metricas.registrar("modelo", 20, 5, 25, archivo="b.pdf")
+    metricas.cerrar()
+
+    with open(ruta, newline="", encoding="utf-8") as f:
+        filas = list(csv.DictReader(f))
+    assert list(filas[0]) == CAMPOS
+    assert [fila["archivo"] for fila in filas] == ["a.pdf", "b.pdf"]
+
+
+def test_buffer_lleno_avisa_una_vez(caplog):
+    sink = Sink()
+    metricas = Metricas([sink], intervalo=60, tamaño_lote=100, capacidad=2)
+    with caplog.at_level(logging.WARNING, logger="metricas"):
+        for i in range(5):
+            metricas.registrar("modelo", archivo=f"{i}.pdf")
+    metricas.cerrar()
+
+    assert metricas.descartados == 3
+    assert [registro["archivo"] for registro in sink.registros] == ["3.pdf", "4.pdf"]
+    assert len([r for r in caplog.records if "Buffer de métricas lleno" in r.getMessage()]) == 1
+
+
+def test_importar_funciones_no_abre_sinks(tmp_path):
+    entorno = dict(os.environ, LLM_BACKEND="mock", LLM_METRICS_SINKS="csv,jsonl", PYTHONPATH=RAIZ)
+    subprocess.run([sys.executable, "-c", "import funciones; funciones.log_llm_usage('modelo', 1, 1, 2)"],
+                   cwd=tmp_path, env=entorno, check=True)
+
+    assert not (tmp_path / "llm_usage.csv").exists()
+    assert not (tmp_path / "llm_usage.jsonl").exists()
@@ -0,0 +1,83 @@
+import os
+import pytest
+import concurrencia
+import funciones
+import setup_demo
+from extraccion import PoolExtraccion
+from parseo import lineas_csv
+
+
+@pytest.fixture(scope="module")
+def rutas_pdf(tmp_path_factory):
+    carpeta = tmp_path_factory.mktemp("demo")
+    anterior = os.getcwd()
+    os.chdir(carpeta)
+    try:
+        os.mkdir("facturas")
+        setup_demo.crear_facturas_fijas()
+        setup_demo.crear_facturas_aleatorias(6)
+    finally:
+        os.chdir(anterior)
+    return sorted(str(ruta) for ruta in (carpeta / "facturas").glob("*.pdf"))
+
+
+@pytest.fixture(scope="module")
+def pool_pdf():
+    with PoolExtraccion(2) as pool:
+        yield pool
+
+
+@pytest.fixture(scope="module", autouse=True)
+def sin_plantillas_ni_cache():
+    # Todas las facturas pasan por el LLM (simulado) y ninguna sale de la caché
+    with pytest.MonkeyPatch.context() as parche:
+        parche.setattr(funciones, "usar_plantillas", False)
+        parche.setattr(funciones, "llm_cache", None)
+        yield
+
+
+def filas(respuestas):
+    """{ruta: líneas CSV sin cabecera}; falla si alguna factura dio error"""
+    resultado = {}
+    for ruta_pdf, respuesta in respuestas:
+        assert not isinstance(respuesta, Exception), f"{ruta_pdf}: {respuesta!r}"
+        assert respuesta != "error", ruta_pdf
+        resultado[ruta_pdf] = lineas_csv(respuesta)
+    return resultado
+
+
+@pytest.fixture(scope="module")
+def serie(rutas_pdf):
+    return filas(concurrencia.procesar_facturas_serie(rutas_pdf))
+
+
+def test_serie_estructura_todas(rutas_pdf, serie):
+    assert sorted(serie) == rutas_pdf
+    assert all(serie.values())
+
+
+def test_concurrente_igual_que_serie(rutas_pdf, pool_pdf, serie):
+    assert filas(concurrencia.procesar_facturas_concurrente(rutas_pdf, 4, pool_pdf=pool_pdf)) == serie
+
+
+def test_por_lotes_igual_que_serie(rutas_pdf, pool_pdf, serie):
+    assert filas(concurrencia.procesar_facturas_por_lotes(rutas_pdf, 2, pool_pdf=pool_pdf)) == serie
+
+
+def test_async_igual_que_serie(rutas_pdf, pool_pdf, serie):
+    assert filas(concurrencia.procesar_facturas_async(rutas_pdf, 4, pool_pdf=pool_pdf)) == serie
+
+
+def test_async_reutiliza_el_loop_entre_ejecuciones(rutas_pdf, pool_pdf, serie):
+    assert filas(concurrencia.procesar_facturas_async(rutas_pdf, 3, pool_pdf=pool_pdf)) == serie
+    loop = concurrencia.bucle_async()
+    assert filas(concurrencia.procesar_facturas_async(rutas_pdf, 3, pool_pdf=pool_pdf)) == serie
+    assert concurrencia.bucle_async() is loop
+
+
+def test_async_abandonado_devuelve_los_turnos(rutas_pdf, pool_pdf):
+    respuestas = concurrencia.procesar_facturas_async(rutas_pdf, 4, pool_pdf=pool_pdf)
+    next(respuestas)
+    respuestas.close()
+
+    assert all(modelo.en_vuelo == 0 for modelo in funciones.planificador.modelos.values())
@@ -0,0 +1,43 @@
+import pandas as pd
+from monedas import ConversorMonedas, normalizar_tasas
+from parseo import parsear_lineas
+
+
+def conversor(*tasas):
+    return ConversorMonedas(normalizar_tasas(pd.DataFrame(tasas, columns=["moneda", "fecha", "tasa"])))
+
+
+def test_usa_la_tasa_vigente_en_cada_fecha():
+    df = pd.DataFrame({
+        "fecha_factura": ["15/01/2024", "15/02/2024", "15/12/2023", "20/01/2024"],
+        "importe": [10.0, 10.0, 10.0, 7.0],
+        "moneda": ["dolares", "dolares", "dolares", "pesos"],
+    })
+    tasas = conversor(("USD", "2024-01-01", 4000.0), ("USD", "2024-02-01", 4100.0))
+
+    df, convertidas, sin_tasa = tasas.convertir(df)
+
+    # Anterior a la primera tasa: la más antigua; en pesos no se toca
+    assert df["importe"].tolist() == [40000.0, 41000.0, 40000.0, 7.0]
+    assert df["moneda"].tolist() == ["pesos"] * 4
+    assert df["importe_original"].tolist() == [10.0, 10.0, 10.0, 7.0]
+    assert convertidas == {"dolares": 3}
+    assert sin_tasa == {}
+
+
+def test_convierte_por_el_codigo_original():
+    df, cuarentena = parsear_lineas(
+        ["10/01/2024;acme;hosting;10,00;GBP", "10/01/2024;beta;soporte;5,00;USD", "10/01/2024;gama;x;7,00;zzz"],
+        ["a.pdf", "b.pdf", "c.pdf"],
+    )
+    assert not cuarentena
+
+    df, convertidas, sin_tasa = conversor(
+        ("GBP", "2020-01-01", 5000.0), ("USD", "2020-01-01", 4000.0)
+    ).convertir(df)
+
+    assert df["importe"].tolist() == [50000.0, 20000.0, 7.0]
+    assert df["moneda"].tolist() == ["pesos", "pesos", "otros"]
+    assert df["moneda_original"].tolist() == ["gbp", "dolares", "zzz"]
+    assert convertidas == {"gbp": 1, "dolares": 1}
+    assert sin_tasa == {"zzz": 1}
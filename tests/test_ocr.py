@@ -0,0 +1,87 @@
+import hashlib
+import fitz  # PyMuPDF
+import pytest
+import ocr
+from lectura_pdf import extraer_texto_documento
+
+TEXTO = "Empresa: ACME SAS\nFecha: 10/01/2024\nTOTAL A PAGAR: 1.428.000 COP"
+
+
+def png(color=0):
+    pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 20, 20), False)
+    pixmap.clear_with(color)
+    return pixmap.tobytes("png")
+
+
+def documento(*paginas):
+    """Páginas con texto (str) o escaneadas (bytes PNG)"""
+    doc = fitz.open()
+    for contenido in paginas:
+        page = doc.new_page()
+        if isinstance(contenido, bytes):
+            page.insert_image(page.rect, stream=contenido)
+        elif contenido:
+            page.insert_text((72, 72), contenido)
+    return doc
+
+
+def test_detecta_paginas_escaneadas():
+    doc = documento(TEXTO, png(), "")
+
+    assert not ocr.pagina_escaneada(doc[0], doc[0].get_text())
+    assert ocr.pagina_escaneada(doc[1], "")
+    # En blanco y sin imágenes: no hay nada que reconocer
+    assert not ocr.pagina_escaneada(doc[2], "")
+
+
+def test_la_extraccion_marca_las_paginas_escaneadas(monkeypatch):
+    monkeypatch.setattr(ocr, "OCR_ACTIVO", True)
+    texto, paginas = extraer_texto_documento(documento(TEXTO, png()), 0, 0, False, "texto")
+
+    assert paginas == 2
+    assert ocr.paginas_pendientes(texto) == [1]
+
+
+def test_fusionar_sustituye_las_marcas():
+    texto = "ACME SAS\n" + ocr.marca(1) + "\n" + ocr.marca(2)
+    resultado = ({1: "TOTAL A PAGAR: 1.428.000 COP\n", 2: "Fecha: 10/01/2024"}, 1, None)
+
+    assert ocr._fusionar("a.pdf", texto, resultado) == (
+        "ACME SAS\nTOTAL A PAGAR: 1.428.000 COP\nFecha: 10/01/2024")
+
+
+def test_documento_sin_texto_no_llega_al_llm():
+    with pytest.raises(ocr.SinTexto):
+        ocr.completar("vacio.pdf", "  \n ")
+    # Con OCR fallido las marcas quedan vacías
+    with pytest.raises(ocr.SinTexto):
+        ocr._fusionar("escaneado.pdf", ocr.marca(0), ({}, 0, "TesseractNotFound"))
+
+
+def test_marca_cortada_por_el_limite_de_caracteres():
+    assert ocr.completar("a.pdf", TEXTO + "\n\x0cOC") == TEXTO + "\n"
+
+
+def test_la_cache_evita_renderizar_y_reconocer(tmp_path):
+    cache = ocr.CacheOCR(str(tmp_path / "ocr_cache.db"))
+    doc = documento(png(0x33))
+    page = doc[0]
+
+    # Texto ya reconocido para esa imagen: se renderiza pero no pasa por Tesseract
+    imagen = page.get_pixmap(dpi=50).tobytes("png")
+    hash_imagen = hashlib.sha256(imagen).hexdigest()
+    cache.guardar_texto(hash_imagen, "spa", "texto reconocido")
+    assert ocr.reconocer_pagina(page, cache, "spa", 50) == ("texto reconocido", True)
+
+    # La segunda vez tampoco se renderiza: la imagen sale de la caché por el contenido de la página
+    assert cache.imagen(ocr.clave_pagina(page, 50))[0] == hash_imagen
+    assert ocr.reconocer_pagina(documento(png(0x33))[0], cache, "spa", 50) == ("texto reconocido", True)
+    cache.cerrar()
+
+
+def test_clave_depende_del_contenido_y_la_resolucion():
+    clave = ocr.clave_pagina(documento(png(0x11))[0], 300)
+
+    assert ocr.clave_pagina(documento(png(0x11))[0], 300) == clave
+    assert ocr.clave_pagina(documento(png(0x22))[0], 300) != clave
+    assert ocr.clave_pagina(documento(png(0x11))[0], 150) != clave
@@ -0,0 +1,78 @@
+import pandas as pd
+import pipeline
+from almacen import Cuarentena
+from parseo import LineasIncrementales, a_importes, parsear_lineas
+
+
+def test_valida_por_columnas():
+    df, cuarentena = parsear_lineas(
+        [
+            "10/01/2024;Acme;hosting;1.234,56;USD",
+            "2024-01-11;beta;soporte;20.5;euros",
+            "31/02/2024;gama;x;10,00;pesos",
+            "10/01/2024;delta;x;abc;pesos",
+            "10/01/2024;;x;10,00;pesos",
+            "10/01/2024;solo;cuatro;campos",
+        ],
+        ["a.pdf", "b.pdf", "c.pdf", "d.pdf", "e.pdf", "f.pdf"],
+    )
+
+    assert df["archivo"].tolist() == ["a.pdf", "b.pdf"]
+    assert df["proveedor"].tolist() == ["acme", "beta"]
+    assert df["importe"].tolist() == [1234.56, 20.5]
+    assert df["fecha_factura"].tolist() == [pd.Timestamp("2024-01-10"), pd.Timestamp("2024-01-11")]
+    assert df["moneda"].tolist() == ["dolares", "euros"]
+    assert sorted((archivo, motivo) for archivo, _, motivo in cuarentena) == [
+        ("c.pdf", "fecha inválida"),
+        ("d.pdf", "importe inválido"),
+        ("e.pdf", "proveedor vacío"),
+        ("f.pdf", "4 campos en lugar de 5"),
+    ]
+
+
+def test_moneda_no_prevista_conserva_su_codigo():
+    df, _ = parsear_lineas(["10/01/2024;acme;x;10,00;GBP", "10/01/2024;beta;y;5,00;"], ["a.pdf", "b.pdf"])
+
+    assert df["moneda"].tolist() == ["otros", "otros"]
+    assert df["moneda_original"].tolist() == ["gbp", "otros"]
+
+
+def test_importes():
+    serie = pd.Series(["1.234,56", "1234.56", "$ 20,00", "-5"])
+    assert a_importes(serie).tolist() == [1234.56, 1234.56, 20.0, -5.0]
+
+
+def test_filas_invalidas_van_a_cuarentena(engine):
+    cuarentena = Cuarentena(engine)
+    respuestas = [
+        ("a.pdf", "fecha_factura;proveedor;concepto;importe;moneda\n10/01/2024;acme;x;10,00;pesos"),
+        ("b.pdf", "fecha_factura;proveedor;concepto;importe;moneda\nayer;beta;y;10,00;pesos"),
+        ("c.pdf", "error"),
+        ("d.pdf", RuntimeError("fallo")),
+    ]
+
+    bloques = list(pipeline.parsear_en_bloques(respuestas, 500, cuarentena))
+
+    assert [df["archivo"].tolist() for df in bloques] == [["a.pdf"]]
+    guardadas = pd.read_sql("SELECT archivo, linea, motivo FROM cuarentena", engine)
+    assert guardadas.values.tolist() == [["b.pdf", "ayer;beta;y;10,00;pesos", "fecha inválida"]]
+
+
+def test_lineas_incrementales():
+    lineas = LineasIncrementales()
+    for fragmento in ["fecha_factura;proveedor;concepto;importe;moneda\n10/01/20", "24;acme;x;1", "0,00;pesos"]:
+        lineas.alimentar(fragmento)
+    lineas.terminar()
+
+    assert lineas.lineas == ["10/01/2024;acme;x;10,00;pesos"]
+    assert not lineas.error
+
+
+def test_lineas_incrementales_detectan_error_sin_salto():
+    lineas = LineasIncrementales()
+    lineas.alimentar("err")
+    assert not lineas.error
+    lineas.alimentar("or")
+
+    assert lineas.error
+    assert lineas.csv() == "error"
@@ -0,0 +1,110 @@
+import asyncio
+import os
+import pytest
+from planificador import Planificador, leer_concurrencia, priorizar
+
+
+class Breaker:
+    """Circuit breaker fijo para las pruebas"""
+
+    def __init__(self, estado="cerrado"):
+        self.estado = estado
+
+    def permite(self):
+        return self.estado == "cerrado"
+
+
+def test_sin_umbral_usa_el_primario():
+    planificador = Planificador("primario", "fallback")
+
+    turno = planificador.ocupar(100)
+    assert turno.modelo == "primario"
+    planificador.liberar(turno)
+
+
+def test_circuito_abierto_pasa_al_fallback():
+    planificador = Planificador("primario", "fallback", breakers={"primario": Breaker("abierto")})
+
+    assert planificador.ocupar(100).modelo == "fallback"
+
+
+def test_tras_un_503_se_evita_el_modelo():
+    planificador = Planificador("primario", "fallback")
+
+    assert planificador.ocupar(100, evitar="primario").modelo == "fallback"
+
+
+def test_sin_alternativa_sana_no_vuelve_al_modelo_evitado():
+    breakers = {"primario": Breaker("abierto"), "fallback": Breaker("abierto")}
+    planificador = Planificador("primario", "fallback", breakers=breakers)
+
+    assert planificador.ocupar(100, evitar="primario").modelo == "fallback"
+
+
+def test_modelo_evitado_si_es_el_unico():
+    planificador = Planificador("primario", breakers={"primario": Breaker("abierto")})
+
+    assert planificador.ocupar(100, evitar="primario").modelo == "primario"
+
+
+def test_enruta_por_tamaño():
+    planificador = Planificador("primario", "fallback", rapido="rapido", fuerte="fuerte", umbral_tokens=1000)
+
+    assert planificador.ocupar(500).modelo == "rapido"
+    assert planificador.ocupar(5000).modelo == "fuerte"
+
+
+def test_proveedor_con_mala_precision_cambia_de_modelo():
+    planificador = Planificador("primario", "fallback", muestras=2, precision_minima=0.8)
+    archivo = os.path.join("facturas", "acme", "f.pdf")
+    for _ in range(2):
+        planificador.liberar(planificador.ocupar(100, archivo), valida=False)
+
+    assert planificador.ocupar(100, archivo).modelo == "fallback"
+    assert planificador.ocupar(100, os.path.join("facturas", "otro", "f.pdf")).modelo == "primario"
+
+
+def test_liberar_dos_veces_no_descuadra_el_cupo():
+    planificador = Planificador("primario", concurrencia={"primario": 1})
+    turno = planificador.ocupar(100)
+    planificador.liberar(turno)
+    planificador.liberar(turno, exito=False)
+
+    assert planificador.modelos["primario"].en_vuelo == 0
+    assert planificador.modelos["primario"].errores == 0
+
+
+def test_cancelar_una_espera_async_la_saca_de_la_cola():
+    planificador = Planificador("primario", concurrencia={"primario": 1})
+
+    async def escenario():
+        turno = await planificador.ocupar_async(100)
+        esperando = asyncio.create_task(planificador.ocupar_async(100))
+        await asyncio.sleep(0.05)
+        assert len(planificador.modelos["primario"].cola) == 1
+        esperando.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await esperando
+        planificador.liberar(turno)
+
+    asyncio.run(escenario())
+    assert planificador.modelos["primario"].cola == []
+    assert planificador.modelos["primario"].en_vuelo == 0
+
+
+def test_leer_concurrencia():
+    assert leer_concurrencia("models/a:4, models/b:0") == {"models/a": 4, "models/b": 0}
+    with pytest.raises(ValueError):
+        leer_concurrencia("models/a")
+
+
+def test_priorizar_por_mtime():
+    stats = {"vieja.pdf": (1, 100.0), "nueva.pdf": (1, 300.0), "media.pdf": (1, 200.0)}
+    rutas = ["vieja.pdf", "nueva.pdf", "media.pdf"]
+
+    assert list(priorizar(rutas, stats, "recientes")) == ["nueva.pdf", "media.pdf", "vieja.pdf"]
+    assert list(priorizar(rutas, stats, "antiguas")) == ["vieja.pdf", "media.pdf", "nueva.pdf"]
+    assert list(priorizar(rutas, stats, "llegada")) == rutas
+    # Con ventana de 2 la primera sale antes de conocer la tercera
+    assert list(priorizar(["media.pdf", "vieja.pdf", "nueva.pdf"], stats, "recientes", ventana=2)) == [
+        "media.pdf", "nueva.pdf", "vieja.pdf"]
@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+from salida_parquet import SinkParquet  # noqa: E402
+
+
+class Registro:
+    """Anota los PDFs que el sink da por guardados"""
+
+    def __init__(self):
+        self.rutas = []
+
+    def guardados(self, rutas):
+        self.rutas.extend(rutas)
+
+
+def facturas(*filas):
+    return pd.DataFrame(filas, columns=["fecha_factura", "proveedor", "concepto", "importe", "moneda", "archivo"])
+
+
+def leer(ruta):
+    tabla = pd.read_parquet(ruta)
+    return sorted(zip(tabla["archivo"], tabla["concepto"], tabla["anio"].astype(int), tabla["mes"].astype(int)))
+
+
+def test_particiona_por_anio_y_mes(tmp_path):
+    ruta = str(tmp_path / "parquet")
+    sink = SinkParquet(ruta)
+    sink.escribir(facturas(("10/01/2024", "acme", "hosting", 20.0, "pesos", "a.pdf"),
+                           ("05/03/2023", "beta", "soporte", 5.0, "euros", "b.pdf")))
+    sink.cerrar()
+
+    assert leer(ruta) == [("a.pdf", "hosting", 2024, 1), ("b.pdf", "soporte", 2023, 3)]
+    assert (tmp_path / "parquet" / "anio=2024" / "mes=1").is_dir()
+
+
+def test_cada_bloque_se_marca_al_escribirse(tmp_path):
+    registro = Registro()
+    sink = SinkParquet(str(tmp_path / "parquet"), registro=registro)
+
+    sink.escribir(facturas(("10/01/2024", "acme", "hosting", 20.0, "pesos", "a.pdf")))
+    assert registro.rutas == ["a.pdf"]
+    sink.escribir(facturas(("11/01/2024", "beta", "soporte", 5.0, "pesos", "b.pdf")))
+    assert registro.rutas == ["a.pdf", "b.pdf"]
+
+
+def test_pdf_reprocesado_sustituye_sus_filas(tmp_path):
+    ruta = str(tmp_path / "parquet")
+    sink = SinkParquet(ruta)
+    sink.escribir(facturas(("10/01/2024", "acme", "hosting", 20.0, "pesos", "a.pdf"),
+                           ("10/01/2024", "acme", "dominio", 2.0, "pesos", "a.pdf"),
+                           ("12/01/2024", "beta", "soporte", 5.0, "pesos", "b.pdf")))
+
+    # Otra ejecución: el PDF modificado cambia de mes y de líneas
+    SinkParquet(ruta).escribir(facturas(("03/02/2024", "acme", "hosting v2", 25.0, "pesos", "a.pdf")))
+
+    assert leer(ruta) == [("a.pdf", "hosting v2", 2024, 2), ("b.pdf", "soporte", 2024, 1)]
+    assert not list((tmp_path / "parquet").rglob("_*"))
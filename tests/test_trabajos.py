@@ -0,0 +1,59 @@
+from duplicados import Duplicado
+from trabajos import RegistroTrabajos
+
+
+def ejecutar(registro, respuestas, guardadas=()):
+    """Pasa las respuestas por el registro y confirma las rutas de `guardadas`"""
+    rutas = list(registro.filtrar(ruta for ruta, _ in respuestas))
+    list(registro.seguir((ruta, respuesta) for ruta, respuesta in respuestas if ruta in rutas))
+    registro.guardados([ruta for ruta in guardadas if ruta in rutas])
+    registro.cerrar()
+    return rutas
+
+
+def test_estados_de_una_ejecucion(engine):
+    registro = RegistroTrabajos(engine)
+    ejecutar(registro, [
+        ("a.pdf", "fecha_factura;proveedor;concepto;importe;moneda\n10/01/2024;acme;x;1,00;pesos"),
+        ("b.pdf", RuntimeError("PDF dañado")),
+        ("c.pdf", "error"),
+        ("d.pdf", Duplicado("a.pdf", 0.97)),
+        ("e.pdf", "fecha_factura;proveedor;concepto;importe;moneda"),
+    ], guardadas=["a.pdf"])
+
+    # e.pdf se estructuró pero no dejó filas: al cerrar cuenta como fallido
+    assert registro.resumen() == {"guardado": 1, "fallido": 3, "duplicado": 1}
+    assert registro.reintentables() == 3
+
+
+def test_reanudar_omite_lo_resuelto(engine):
+    primera = RegistroTrabajos(engine)
+    ejecutar(primera, [("a.pdf", "csv"), ("b.pdf", RuntimeError("x")), ("d.pdf", Duplicado("a.pdf", 1.0))],
+             guardadas=["a.pdf"])
+
+    registro = RegistroTrabajos(engine, reanudar=True)
+    rutas = list(registro.filtrar(["a.pdf", "b.pdf", "d.pdf", "nuevo.pdf"]))
+
+    assert registro.reanudada
+    assert registro.ejecucion == primera.ejecucion
+    assert rutas == ["b.pdf", "nuevo.pdf"]
+    assert registro.omitidos == {"guardadas": 1, "duplicadas": 1, "reintentadas": 1}
+
+
+def test_presupuesto_de_reintentos(engine):
+    respuestas = [("b.pdf", RuntimeError("x"))]
+    assert ejecutar(RegistroTrabajos(engine, reintentos=1), respuestas) == ["b.pdf"]
+    assert ejecutar(RegistroTrabajos(engine, reanudar=True, reintentos=1), respuestas) == ["b.pdf"]
+
+    registro = RegistroTrabajos(engine, reanudar=True, reintentos=1)
+    assert ejecutar(registro, respuestas) == []
+    assert registro.omitidos["sin_reintentos"] == 1
+    assert registro.reintentables() == 0
+
+
+def test_sin_confirmar_no_cuenta_como_guardado(engine):
+    registro = RegistroTrabajos(engine)
+    list(registro.seguir(zip(registro.filtrar(["a.pdf"]), ["csv"])))
+    # Caída antes de confirmar el bloque: nada llegó a escribirse
+
+    assert list(RegistroTrabajos(engine, reanudar=True).filtrar(["a.pdf"])) == ["a.pdf"]
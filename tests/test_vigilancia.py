@@ -0,0 +1,90 @@
+import os
+import threading
+import time
+import pytest
+from descubrimiento import Descubrimiento
+from vigilancia import Vigilante
+
+
+@pytest.fixture
+def raiz(tmp_path):
+    (tmp_path / "vieja.pdf").write_bytes(b"%PDF vieja")
+    return tmp_path
+
+
+def vigilante(raiz, **opciones):
+    descubrimiento = Descubrimiento(str(raiz), profundidad=0, incluir=["*.pdf"], excluir=[])
+    opciones = {"espera": 0.1, "intervalo": 0.05, "lote": 2, "sondeo": True, **opciones}
+    resultado = Vigilante(descubrimiento, **opciones)
+    list(descubrimiento)
+    resultado.conocer(descubrimiento.stats)
+    return resultado
+
+
+def recoger(vigilante, cantidad, iniciales=(), limite=5.0):
+    """Lotes entregados hasta reunir `cantidad` rutas (o agotar el límite de tiempo)"""
+    reloj = threading.Timer(limite, vigilante.detener)
+    reloj.start()
+    lotes = []
+    try:
+        for lote in vigilante.lotes(iniciales):
+            lotes.append(lote)
+            if sum(map(len, lotes)) >= cantidad:
+                vigilante.detener()
+    finally:
+        reloj.cancel()
+    return lotes
+
+
+def test_sondeo_entrega_solo_lo_nuevo_en_micro_lotes(raiz):
+    vigia = vigilante(raiz)
+    for nombre in ("a.pdf", "b.pdf", "c.pdf", "notas.txt"):
+        (raiz / nombre).write_bytes(b"%PDF " + nombre.encode())
+
+    lotes = recoger(vigia, 3)
+
+    assert vigia.modo == "sondeo"
+    assert all(len(lote) <= 2 for lote in lotes)
+    assert sorted(os.path.basename(ruta) for lote in lotes for ruta in lote) == ["a.pdf", "b.pdf", "c.pdf"]
+
+
+def test_iniciales_se_entregan_aunque_se_conozcan(raiz):
+    vigia = vigilante(raiz)
+    vieja = str(raiz / "vieja.pdf")
+
+    assert recoger(vigia, 1, iniciales=[vieja]) == [[vieja]]
+
+
+def test_espera_a_que_el_archivo_deje_de_cambiar(raiz):
+    vigia = vigilante(raiz, espera=0.2)
+    ruta = raiz / "copiando.pdf"
+    ruta.write_bytes(b"%PDF parte 1")
+    vigia._candidatos[str(ruta)] = (None, time.monotonic())
+
+    assert vigia._estables() == []
+    time.sleep(0.1)
+    with open(ruta, "ab") as f:
+        f.write(b" parte 2")
+    time.sleep(0.15)
+    # Cambió hace menos de `espera`: todavía no está listo
+    assert vigia._estables() == []
+
+    time.sleep(0.25)
+    assert vigia._estables() == [str(ruta)]
+    # Sin cambios posteriores no se vuelve a entregar
+    stat = os.stat(ruta)
+    vigia._candidatos[str(ruta)] = ((stat.st_size, stat.st_mtime), time.monotonic() - 1)
+    assert vigia._estables() == []
+    assert str(ruta) not in vigia._candidatos
+
+
+def test_inotify_ve_las_subcarpetas_nuevas(raiz):
+    vigia = vigilante(raiz, sondeo=False)
+    if vigia.modo != "inotify":
+        pytest.skip("inotify no disponible")
+
+    carpeta = raiz / "2024"
+    carpeta.mkdir()
+    (carpeta / "d.pdf").write_bytes(b"%PDF d")
+
+    assert recoger(vigia, 1) == [[str(carpeta / "d.pdf")]]
@@ -0,0 +1,189 @@
+import json
+import os
+import sys
+import threading
+from collections import Counter
+from datetime import datetime
+from dotenv import load_dotenv
+from sqlalchemy import text
+from duplicados import Duplicado
+
+load_dotenv(".env")
+
+# Veces que --resume vuelve a intentar un PDF que terminó en fallido
+TRABAJOS_REINTENTOS = int(os.getenv("TRABAJOS_REINTENTOS", "2"))
+
+ESTADOS = ("pendiente", "extraido", "estructurado", "guardado", "fallido", "duplicado")
+
+
+class RegistroTrabajos:
+    """Estado de cada PDF de una ejecución, guardado en facturas.db.
+
+    Cada archivo pasa por pendiente → extraido → estructurado → guardado, o
+    termina en fallido con el error, o en duplicado si repite otra factura.
+    Los cambios se acumulan en memoria y se escriben al confirmar cada
+    bloque de facturas, así que tras una caída el registro refleja lo que
+    de verdad quedó guardado. Con reanudar=True se continúa la última
+    ejecución: se omiten los PDFs guardados o duplicados y los fallidos se
+    reintentan hasta agotar `reintentos`.
+    """
+
+    def __init__(self, engine, reanudar=False, reintentos=TRABAJOS_REINTENTOS):
+        self.engine = engine
+        self.reintentos = reintentos
+        self.omitidos = Counter()
+        self._previos = {}
+        self._pendientes = {}
+        self._lock = threading.Lock()
+
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS ejecuciones (
+                    id INTEGER PRIMARY KEY,
+                    iniciada TEXT NOT NULL,
+                    terminada TEXT,
+                    argumentos TEXT
+                )
+            """))
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS trabajos (
+                    ejecucion INTEGER NOT NULL,
+                    ruta TEXT NOT NULL,
+                    estado TEXT NOT NULL,
+                    fallos INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    actualizado TEXT NOT NULL,
+                    PRIMARY KEY (ejecucion, ruta)
+                )
+            """))
+
+            self.ejecucion = None
+            if reanudar:
+                self.ejecucion = conn.execute(text("SELECT MAX(id) FROM ejecuciones")).scalar()
+
+            if self.ejecucion is None:
+                self.reanudada = False
+                self.ejecucion = conn.execute(
+                    text("INSERT INTO ejecuciones (iniciada, argumentos) VALUES (:iniciada, :argumentos)"),
+                    {"iniciada": datetime.now().isoformat(), "argumentos": json.dumps(sys.argv[1:])},
+                ).lastrowid
+            else:
+                self.reanudada = True
+                self._previos = {
+                    ruta: (estado, fallos)
+                    for ruta, estado, fallos in conn.execute(
+                        text("SELECT ruta, estado, fallos FROM trabajos WHERE ejecucion = :ejecucion"),
+                        {"ejecucion": self.ejecucion},
+                    )
+                }
+                conn.execute(
+                    text("UPDATE ejecuciones SET terminada = NULL WHERE id = :ejecucion"),
+                    {"ejecucion": self.ejecucion},
+                )
+
+    def filtrar(self, rutas_pdf):
+        """Registra cada ruta como pendiente y, al reanudar, omite las ya resueltas"""
+        for ruta_pdf in rutas_pdf:
+            estado, fallos = self._previos.get(ruta_pdf, (None, 0))
+
+            if estado == "guardado":
+                self.omitidos["guardadas"] += 1
+                continue
+            if estado == "duplicado":
+                self.omitidos["duplicadas"] += 1
+                continue
+            if estado == "fallido" and fallos > self.reintentos:
+                self.omitidos["sin_reintentos"] += 1
+                continue
+            if estado == "fallido":
+                self.omitidos["reintentadas"] += 1
+
+            self.marcar(ruta_pdf, "pendiente")
+            yield ruta_pdf
+
+    def seguir(self, respuestas):
+        """Marca cada respuesta (ruta, CSV o excepción) como estructurada o fallida.
+
+        Los duplicados quedan marcados con su original y no siguen adelante.
+        """
+        for ruta_pdf, respuesta in respuestas:
+            if isinstance(respuesta, Duplicado):
+                self.marcar(ruta_pdf, "duplicado", str(respuesta))
+                continue
+            if isinstance(respuesta, Exception):
+                self.marcar(ruta_pdf, "fallido", str(respuesta))
+            elif respuesta.lower().strip() == "error":
+                self.marcar(ruta_pdf, "fallido", "el LLM respondió error")
+            else:
+                self.marcar(ruta_pdf, "estructurado")
+            yield ruta_pdf, respuesta
+
+    def marcar(self, ruta_pdf, estado, error=None):
+        with self._lock:
+            self._pendientes[ruta_pdf] = (estado, error)
+
+    def guardados(self, rutas):
+        """Marca como guardados los archivos de un bloque ya confirmado y escribe el registro"""
+        for ruta in rutas:
+            self.marcar(ruta, "guardado")
+        self.volcar()
+
+    def volcar(self):
+        with self._lock:
+            cambios, self._pendientes = self._pendientes, {}
+        if not cambios:
+            return
+
+        ahora = datetime.now().isoformat()
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql(
+                """
+                INSERT INTO trabajos (ejecucion, ruta, estado, fallos, error, actualizado)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(ejecucion, ruta) DO UPDATE SET
+                    estado = excluded.estado,
+                    fallos = trabajos.fallos + excluded.fallos,
+                    error = excluded.error,
+                    actualizado = excluded.actualizado
+                """,
+                [
+                    (self.ejecucion, ruta, estado, int(estado == "fallido"), error, ahora)
+                    for ruta, (estado, error) in cambios.items()
+                ],
+            )
+
+    def cerrar(self):
+        """Da la ejecución por terminada; lo estructurado sin filas guardadas queda como fallido"""
+        self.volcar()
+        with self.engine.begin() as conn:
+            conn.execute(
+                text("""
+                    UPDATE trabajos SET estado = 'fallido', fallos = fallos + 1,
+                        error = 'sin filas válidas', actualizado = :ahora
+                    WHERE ejecucion = :ejecucion AND estado = 'estructurado'
+                """),
+                {"ejecucion": self.ejecucion, "ahora": datetime.now().isoformat()},
+            )
+            conn.execute(
+                text("UPDATE ejecuciones SET terminada = :ahora WHERE id = :ejecucion"),
+                {"ejecucion": self.ejecucion, "ahora": datetime.now().isoformat()},
+            )
+
+    def resumen(self):
+        """Archivos de la ejecución por estado"""
+        with self.engine.connect() as conn:
+            return dict(conn.execute(
+                text("SELECT estado, COUNT(*) FROM trabajos WHERE ejecucion = :ejecucion GROUP BY estado"),
+                {"ejecucion": self.ejecucion},
+            ).all())
+
+    def reintentables(self):
+        """Archivos fallidos que un --resume todavía volvería a intentar"""
+        with self.engine.connect() as conn:
+            return conn.execute(
+                text("""
+                    SELECT COUNT(*) FROM trabajos
+                    WHERE ejecucion = :ejecucion AND estado = 'fallido' AND fallos <= :reintentos
+                """),
+                {"ejecucion": self.ejecucion, "reintentos": self.reintentos},
+            ).scalar()
@@ -0,0 +1,227 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+from dotenv import load_dotenv
+from planificador import priorizar
+
+logger = logging.getLogger(__name__)
+
+load_dotenv(".env")
+
+# Segundos sin cambios de tamaño ni mtime para dar un PDF por terminado de copiar
+VIGILANCIA_ESPERA = float(os.getenv("VIGILANCIA_ESPERA", "1.0"))
+# Segundos entre recorridos completos cuando no hay inotify (o con VIGILANCIA_SONDEO)
+VIGILANCIA_INTERVALO = float(os.getenv("VIGILANCIA_INTERVALO", "5.0"))
+# Máximo de PDFs por micro-lote
+VIGILANCIA_LOTE = int(os.getenv("VIGILANCIA_LOTE", "20"))
+# Forzar el sondeo: inotify no ve los cambios hechos desde otra máquina en un recurso de red
+VIGILANCIA_SONDEO = os.getenv("VIGILANCIA_SONDEO", "false").lower() == "true"
+
+# Constantes de <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+MASCARA = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+EVENTO = struct.Struct("iIII")
+
+
+class DetectorInotify:
+    """Avisos del kernel (Linux) de archivos creados, escritos o movidos bajo la raíz.
+
+    Vigila cada carpeta que recorrería el descubrimiento, respetando
+    profundidad y exclusiones, y añade las que se crean después.
+    """
+
+    def __init__(self, descubrimiento):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._agregar = libc.inotify_add_watch
+        self._agregar.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+
+        self.descubrimiento = descubrimiento
+        self._carpetas = {}
+        self._vigilar(descubrimiento.raiz, "", 1)
+
+    def _vigilar(self, carpeta, relativa, nivel):
+        """Vigila carpeta y sus subcarpetas; devuelve los archivos que ya contienen"""
+        wd = self._agregar(self.fd, os.fsencode(carpeta), MASCARA)
+        if wd < 0:
+            logger.warning(f"No se puede vigilar {carpeta}: {os.strerror(ctypes.get_errno())}")
+            return []
+        self._carpetas[wd] = (carpeta, relativa, nivel)
+
+        archivos = []
+        try:
+            with os.scandir(carpeta) as entradas:
+                for entrada in entradas:
+                    ruta_relativa = relativa + entrada.name
+                    if entrada.is_dir(follow_symlinks=False):
+                        if self.descubrimiento.recorre_carpeta(ruta_relativa, nivel + 1):
+                            archivos.extend(self._vigilar(entrada.path, ruta_relativa + "/", nivel + 1))
+                    elif self.descubrimiento.acepta(ruta_relativa):
+                        archivos.append(entrada.path)
+        except OSError as e:
+            logger.warning(f"No se pudo leer {carpeta}: {e}")
+        return archivos
+
+    def eventos(self, espera):
+        """Rutas tocadas en los próximos `espera` segundos; None si el kernel perdió eventos"""
+        listos, _, _ = select.select([self.fd], [], [], espera)
+        if not listos:
+            return set()
+
+        rutas = set()
+        desbordado = False
+        while True:
+            try:
+                datos = os.read(self.fd, 1 << 16)
+            except BlockingIOError:
+                break
+
+            desplazamiento = 0
+            while desplazamiento < len(datos):
+                wd, mascara, _, largo = EVENTO.unpack_from(datos, desplazamiento)
+                nombre = os.fsdecode(datos[desplazamiento + EVENTO.size:desplazamiento + EVENTO.size + largo].rstrip(b"\0"))
+                desplazamiento += EVENTO.size + largo
+
+                if mascara & IN_Q_OVERFLOW:
+                    desbordado = True
+                    continue
+                if mascara & IN_IGNORED:
+                    self._carpetas.pop(wd, None)
+                    continue
+                if wd not in self._carpetas:
+                    continue
+
+                carpeta, relativa, nivel = self._carpetas[wd]
+                ruta = os.path.join(carpeta, nombre)
+                ruta_relativa = relativa + nombre
+
+                if mascara & IN_ISDIR:
+                    # Carpeta nueva: se vigila y lo que ya tenga dentro también cuenta
+                    if mascara & (IN_CREATE | IN_MOVED_TO) and \
+                            self.descubrimiento.recorre_carpeta(ruta_relativa, nivel + 1):
+                        rutas.update(self._vigilar(ruta, ruta_relativa + "/", nivel + 1))
+                elif self.descubrimiento.acepta(ruta_relativa):
+                    rutas.add(ruta)
+
+        return None if desbordado else rutas
+
+    def cerrar(self):
+        os.close(self.fd)
+
+
+class Vigilante:
+    """Entrega en micro-lotes los PDFs nuevos o modificados bajo la raíz.
+
+    Los cambios llegan por inotify o, si no está disponible, recorriendo la
+    raíz cada `intervalo` segundos con el descubrimiento. Un archivo sólo se
+    entrega cuando su tamaño y mtime llevan `espera` segundos sin cambiar,
+    así no se procesan copias a medias. Cada archivo se vuelve a entregar
+    únicamente si cambia después.
+    """
+
+    def __init__(self, descubrimiento, espera=VIGILANCIA_ESPERA, intervalo=VIGILANCIA_INTERVALO,
+                 lote=VIGILANCIA_LOTE, sondeo=VIGILANCIA_SONDEO):
+        self.descubrimiento = descubrimiento
+        self.espera = espera
+        self.intervalo = intervalo
+        self.lote = lote
+        self.activo = True
+        self._candidatos = {}
+        self._conocidos = {}
+        self._ultimo_sondeo = 0.0
+
+        self.detector = None
+        if not sondeo:
+            try:
+                self.detector = DetectorInotify(descubrimiento)
+            except (OSError, AttributeError, TypeError) as e:
+                logger.info(f"inotify no disponible ({e}), se usará sondeo")
+        self.modo = "inotify" if self.detector is not None else "sondeo"
+
+    def conocer(self, stats):
+        """Registra el estado actual de los archivos para no entregarlos si no cambian"""
+        self._conocidos.update(stats)
+
+    def detener(self):
+        self.activo = False
+
+    def _escanear(self):
+        self.descubrimiento.stats = {}
+        for _ in self.descubrimiento:
+            pass
+        return self.descubrimiento.stats
+
+    def _detectar(self, espera):
+        """Rutas que pueden haber cambiado"""
+        if self.detector is not None:
+            rutas = self.detector.eventos(espera)
+            if rutas is not None:
+                return rutas
+            logger.warning("inotify perdió eventos, se recorre la carpeta completa")
+        elif time.monotonic() - self._ultimo_sondeo < self.intervalo:
+            time.sleep(espera)
+            return set()
+
+        self._ultimo_sondeo = time.monotonic()
+        return {
+            ruta for ruta, firma in self._escanear().items()
+            if self._conocidos.get(ruta) != firma
+        }
+
+    def _estables(self):
+        """Candidatos sin cambios durante `espera` segundos, en orden de PLANIFICADOR_PRIORIDAD"""
+        ahora = time.monotonic()
+        listos = []
+        for ruta, (firma, desde) in list(self._candidatos.items()):
+            try:
+                stat = os.stat(ruta)
+            except OSError:
+                del self._candidatos[ruta]
+                continue
+
+            actual = (stat.st_size, stat.st_mtime)
+            if actual != firma:
+                self._candidatos[ruta] = (actual, ahora)
+            elif ahora - desde >= self.espera:
+                del self._candidatos[ruta]
+                if self._conocidos.get(ruta) != actual:
+                    self._conocidos[ruta] = actual
+                    listos.append(ruta)
+        return list(priorizar(sorted(listos), self._conocidos, ventana=0))
+
+    def lotes(self, iniciales=()):
+        """Genera listas de rutas listas para procesar hasta que se llame a detener()"""
+        ahora = time.monotonic()
+        for ruta in iniciales:
+            self._conocidos.pop(ruta, None)
+            self._candidatos[ruta] = (None, ahora)
+
+        try:
+            while self.activo:
+                # Con candidatos pendientes se revisa a menudo; si no, se espera al siguiente aviso
+                espera = min(self.espera / 2, 1.0) if self._candidatos else 1.0
+                ahora = time.monotonic()
+                for ruta in self._detectar(espera):
+                    if ruta not in self._candidatos:
+                        self._candidatos[ruta] = (None, ahora)
+
+                listos = self._estables()
+                for inicio in range(0, len(listos), self.lote):
+                    yield listos[inicio:inicio + self.lote]
+        finally:
+            if self.detector is not None:
+                self.detector.cerrar()